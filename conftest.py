@@ -0,0 +1,9 @@
+import pytest
+from django.test.utils import override_settings
+
+
+@pytest.fixture(autouse=True, scope='session')
+def request_budget_raise(django_test_environment):
+    """Fail requests over their budgets under pytest too, as helpers.test_runner does for ``manage.py test``."""
+    with override_settings(REQUEST_BUDGET_RAISE=True):
+        yield
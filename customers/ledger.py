@@ -0,0 +1,118 @@
+from django.db.models import Q
+
+import helpers.cache
+from customers.models import Customer, LedgerEntry
+
+
+def rebalance(customer_id, since=None):
+    """Recompute running balances of a customer's ledger entries dated ``since`` or later."""
+    return rebalance_many({customer_id: since})
+
+
+def rebalance_many(since):
+    """rebalance() of several customers in one pass, ``since`` is ``{customer_id: date or None}``."""
+    if not since:
+        return []
+    balances = dict.fromkeys(since, 0)
+    conditions = Q(customer_id__in=[customer_id for customer_id, date in since.items() if date is None])
+    for customer_id, date in since.items():
+        if date is not None:
+            balances[customer_id] = LedgerEntry.objects.filter(customer_id=customer_id, date__lt=date).reverse() \
+                .values_list('balance', flat=True).first() or 0
+            conditions |= Q(customer_id=customer_id, date__gte=date)
+    changed = []
+    for entry in LedgerEntry.objects.filter(conditions).order_by('customer_id', *LedgerEntry._meta.ordering):
+        balances[entry.customer_id] += entry.amount
+        if entry.balance != balances[entry.customer_id]:
+            entry.balance = balances[entry.customer_id]
+            changed.append(entry)
+    LedgerEntry.objects.bulk_update(changed, ['balance'])
+    Customer.touch(list(since))
+    helpers.cache.invalidate(helpers.cache.tag(Customer),
+                             *[helpers.cache.tag(Customer, customer_id) for customer_id in since])
+    return changed
+
+
+def _record(kind, source_field, rows):
+    """Write ledger entries for ``(customer_id, source_id, date, amount)`` rows and rebalance what they moved.
+
+    Credit entries with zero amount are removed, as orders with nothing confirmed are not charged.
+    """
+    existing = {getattr(entry, source_field): entry
+                for entry in LedgerEntry.objects.filter(**{f'{source_field}__in': [row[1] for row in rows]})}
+    since = {}
+    created, updated, deleted = [], [], []
+
+    def touch(customer_id, date):
+        if customer_id not in since or date < since[customer_id]:
+            since[customer_id] = date
+
+    for customer_id, source_id, date, amount in rows:
+        entry = existing.get(source_id)
+        if kind == LedgerEntry.CREDIT and amount == 0:
+            if entry is not None:
+                deleted.append(entry.pk)
+                touch(entry.customer_id, entry.date)
+        elif entry is None:
+            created.append(LedgerEntry(customer_id=customer_id, kind=kind, date=date, amount=amount, balance=0,
+                                       **{source_field: source_id}))
+            touch(customer_id, date)
+        elif (entry.customer_id, entry.date, entry.amount) != (customer_id, date, amount):
+            # an entry moved to another customer leaves the balances of the previous one
+            touch(entry.customer_id, entry.date)
+            touch(customer_id, date)
+            entry.customer_id, entry.date, entry.amount = customer_id, date, amount
+            updated.append(entry)
+
+    LedgerEntry.objects.bulk_create(created)
+    LedgerEntry.objects.bulk_update(updated, ['customer', 'date', 'amount'])
+    if deleted:
+        LedgerEntry.objects.filter(pk__in=deleted).delete()
+    rebalance_many(since)
+
+
+def record_debits(debits):
+    _record(LedgerEntry.DEBIT, 'debit_id',
+            [(debit.customer_id, debit.pk, debit.date, debit.amount) for debit in debits])
+
+
+def record_customer_orders(customer_orders):
+    """Write charges of customer orders, their ``order`` must be loaded."""
+    _record(LedgerEntry.CREDIT, 'customer_order_id',
+            [(customer_order.customer_id, customer_order.pk, customer_order.order.date,
+              -customer_order.confirmed_total) for customer_order in customer_orders])
+
+
+def expected_entries(customer):
+    """Ledger rows of a customer rebuilt from debits and stored confirmed totals of orders.
+
+    Returns ``(date, kind, debit_id, customer_order_id, amount, balance)`` tuples in ledger order.
+    """
+    rows = [(date, LedgerEntry.DEBIT, pk, None, amount)
+            for pk, date, amount in customer.debits.values_list('pk', 'date', 'amount')]
+    rows.extend((date, LedgerEntry.CREDIT, None, pk, -total)
+                for pk, date, total in customer.orders.exclude(confirmed_total=0)
+                .values_list('pk', 'order__date', 'confirmed_total'))
+    rows.sort(key=lambda row: (row[0], row[1], row[2] or 0, row[3] or 0))
+    balance = 0
+    entries = []
+    for row in rows:
+        balance += row[4]
+        entries.append(row + (balance,))
+    return entries
+
+
+def rebuild(customer, commit=True):
+    """Rewrite the ledger of a customer if it differs from debits and orders, returns whether it did."""
+    expected = expected_entries(customer)
+    stored = list(customer.ledger.values_list('date', 'kind', 'debit_id', 'customer_order_id', 'amount', 'balance'))
+    if stored == expected:
+        return False
+    if commit:
+        customer.ledger.all().delete()
+        LedgerEntry.objects.bulk_create(
+            LedgerEntry(customer=customer, date=date, kind=kind, debit_id=debit_id, customer_order_id=customer_order_id,
+                        amount=amount, balance=balance)
+            for date, kind, debit_id, customer_order_id, amount, balance in expected
+        )
+    return True
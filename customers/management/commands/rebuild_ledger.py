@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from customers import ledger, models
+
+
+class Command(BaseCommand):
+    help = "Rebuild customer ledgers from debits and stored confirmed totals of orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help="Only report customers whose ledger differs from debits and orders")
+
+    def handle(self, *args, verify=False, **options):
+        mismatched = 0
+        customer_list = models.Customer.objects.order_by('pk')
+        for customer in customer_list:
+            with transaction.atomic():
+                if ledger.rebuild(customer, commit=not verify):
+                    mismatched += 1
+                    self.stdout.write(f"{customer}: ledger differs from debits and orders")
+        if verify and mismatched:
+            raise CommandError(f"{mismatched} customer ledgers differ from debits and orders")
+        self.stdout.write(f"{'Verified' if verify else 'Rebuilt'} ledgers of {len(customer_list)} customers, "
+                          f"{mismatched} {'mismatched' if verify else 'fixed'}")
@@ -0,0 +1,58 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+DEBIT = 0
+CREDIT = 1
+
+
+def fill_ledger(apps, schema_editor):
+    Customer = apps.get_model('customers', 'Customer')
+    Debit = apps.get_model('customers', 'Debit')
+    LedgerEntry = apps.get_model('customers', 'LedgerEntry')
+    CustomerOrder = apps.get_model('orders', 'CustomerOrder')
+
+    for customer in Customer.objects.all():
+        rows = [(date, DEBIT, pk, None, amount)
+                for pk, date, amount in Debit.objects.filter(customer=customer).values_list('pk', 'date', 'amount')]
+        rows.extend((date, CREDIT, None, pk, -total)
+                    for pk, date, total in CustomerOrder.objects.filter(customer=customer)
+                    .exclude(confirmed_total=0).values_list('pk', 'order__date', 'confirmed_total'))
+        rows.sort(key=lambda row: (row[0], row[1], row[2] or 0, row[3] or 0))
+        balance = 0
+        entries = []
+        for date, kind, debit_id, customer_order_id, amount in rows:
+            balance += amount
+            entries.append(LedgerEntry(customer=customer, date=date, kind=kind, debit_id=debit_id,
+                                       customer_order_id=customer_order_id, amount=amount, balance=balance))
+        LedgerEntry.objects.bulk_create(entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_add_totals'),
+        ('customers', '0002_auto_20180524_2158'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('kind', models.PositiveSmallIntegerField(choices=[(0, 'Приход'), (1, 'Расход')], verbose_name='Тип')),
+                ('amount', models.IntegerField(verbose_name='Сумма')),
+                ('balance', models.IntegerField(verbose_name='Баланс')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger', to='customers.customer', verbose_name='Покупатель')),
+                ('customer_order', models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entry', to='orders.customerorder')),
+                ('debit', models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entry', to='customers.debit')),
+            ],
+            options={
+                'verbose_name': 'Движение средств',
+                'ordering': ['date', 'kind', 'debit_id', 'customer_order_id'],
+            },
+        ),
+        migrations.RunPython(fill_ledger, migrations.RunPython.noop),
+    ]
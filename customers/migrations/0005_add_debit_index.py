@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0004_add_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='debit',
+            index=models.Index(fields=['customer', 'date'], name='debit_customer_date_idx'),
+        ),
+    ]
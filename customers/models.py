@@ -1,12 +1,29 @@
+from django.apps import apps
+from django.core.paginator import Paginator
 from django.db import models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 
 from helpers import models as helpers_models
 
 
+class CustomerQuerySet(models.QuerySet):
+    def with_balance(self):
+        """Annotate ``current_balance``: debits minus stored confirmed totals of orders, computed in SQL."""
+        customer_order_model = apps.get_model('orders', 'CustomerOrder')
+        debits = Debit.objects.filter(customer=OuterRef('pk')).order_by().values('customer') \
+            .annotate(total=Sum('amount')).values('total')
+        charges = customer_order_model.objects.filter(customer=OuterRef('pk')).order_by().values('customer') \
+            .annotate(total=Sum('confirmed_total')).values('total')
+        return self.annotate(current_balance=Coalesce(Subquery(debits), 0) - Coalesce(Subquery(charges), 0))
+
+
 # Create your models here.
-class Customer(helpers_models.BrowseableObjectModel):
+class Customer(helpers_models.UpdatedAtModel, helpers_models.BrowseableObjectModel):
     name = models.CharField(max_length=20, verbose_name='Имя', unique=True)
 
+    objects = CustomerQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Заказчик"
 
@@ -14,33 +31,45 @@ class Customer(helpers_models.BrowseableObjectModel):
         return self.name
 
     def transfers(self):
-        _debits = ({'date': debit.date, 'debit': debit.amount, 'debit_obj': debit} for debit in self.debits.all())
-        _credits = (
-            {
-                'date': customer_order.order.date,
-                'credit': customer_order.confirmed_cost()
-            }
-            for customer_order in self.orders.all() if customer_order.confirmed_cost() != 0
-        )
-        from itertools import chain
-        transfers = sorted(chain(_debits, _credits), key=lambda transfer: transfer['date'])
-        return transfers
+        return [entry.as_transfer() for entry in self.ledger.select_related('debit')]
 
     def balance(self):
-        return sum(
-            (transfer.get('debit', 0) - transfer.get('credit', 0) for transfer in self.transfers())
-        )
+        balance = self.ledger.reverse().values_list('balance', flat=True).first()
+        return balance or 0
+
+    def balance_as_of(self, date):
+        """Balance at the end of ``date``."""
+        balance = self.ledger.filter(date__lte=date).reverse().values_list('balance', flat=True).first()
+        return balance or 0
+
+    def statement(self, page=1, limit=50):
+        """Page of ledger entries, oldest first, with their running balances; ``page`` can be 'last'.
+
+        Only the entries of the page are loaded.
+        """
+        paginator = Paginator(self.ledger.select_related('debit'), limit)
+        page = paginator.get_page(paginator.num_pages if page == 'last' else page)
+        page.object_list = list(page.object_list)
+        for entry in page.object_list:
+            if entry.debit is not None:
+                entry.debit.customer = self
+        return page
 
     def get_debit_url(self):
         return self.get_absolute_url('debit')
 
 
-class Debit(helpers_models.BrowseableObjectModel):
+class Debit(helpers_models.AtomicSaveMixin, helpers_models.BrowseableObjectModel):
     customer = models.ForeignKey(to=Customer, on_delete=models.CASCADE, verbose_name="Покупатель",
                                  related_name='debits')
     amount = models.IntegerField(verbose_name="Приход", default=0)
     date = models.DateField(verbose_name="Дата", auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer', 'date'], name='debit_customer_date_idx'),
+        ]
+
     def get_object_url_kwargs(self):
         kwargs: dict = self.customer.get_object_url_kwargs()
         kwargs.update(super(Debit, self).get_object_url_kwargs())
@@ -52,3 +81,38 @@ class Debit(helpers_models.BrowseableObjectModel):
             return self.customer.get_absolute_url()
         else:
             return super().get_absolute_url(kind)
+
+
+class LedgerEntry(models.Model):
+    DEBIT = 0
+    CREDIT = 1
+    KIND_CHOICES = (
+        (DEBIT, "Приход"),
+        (CREDIT, "Расход"),
+    )
+
+    customer = models.ForeignKey(to=Customer, on_delete=models.CASCADE, verbose_name="Покупатель",
+                                 related_name='ledger')
+    date = models.DateField(verbose_name="Дата")
+    kind = models.PositiveSmallIntegerField(verbose_name="Тип", choices=KIND_CHOICES)
+    debit = models.OneToOneField(to=Debit, on_delete=models.CASCADE, null=True, related_name='ledger_entry')
+    customer_order = models.OneToOneField(to='orders.CustomerOrder', on_delete=models.CASCADE, null=True,
+                                          related_name='ledger_entry')
+    amount = models.IntegerField(verbose_name="Сумма")
+    balance = models.IntegerField(verbose_name="Баланс")
+
+    class Meta:
+        verbose_name = "Движение средств"
+        ordering = ['date', 'kind', 'debit_id', 'customer_order_id']
+
+    def __str__(self):
+        return f"{self.customer} {self.date}: {self.amount} ({self.balance})"
+
+    @property
+    def opening_balance(self):
+        return self.balance - self.amount
+
+    def as_transfer(self):
+        if self.kind == self.DEBIT:
+            return {'date': self.date, 'debit': self.amount, 'debit_obj': self.debit}
+        return {'date': self.date, 'credit': -self.amount}
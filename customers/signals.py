@@ -0,0 +1,22 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+import helpers.cache
+from customers import ledger, models
+
+
+@receiver(post_save, sender=models.Debit)
+def debit_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    ledger.record_debits([instance])
+
+
+@receiver(post_delete, sender=models.Debit)
+def debit_deleted(sender, instance, **kwargs):
+    ledger.rebalance(instance.customer_id, instance.date)
+
+
+@receiver([post_save, post_delete], sender=models.Customer)
+def customer_changed(sender, instance, **kwargs):
+    helpers.cache.invalidate(helpers.cache.tag(models.Customer), helpers.cache.tag(models.Customer, instance.pk))
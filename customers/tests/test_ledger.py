@@ -0,0 +1,138 @@
+from datetime import date, timedelta
+from io import StringIO
+
+from django.core.management import call_command, CommandError
+from django.test import TestCase
+
+import customers.models
+import orders.models
+import products.models
+
+
+class LedgerTestCase(TestCase):
+    fixtures = ['test_products']
+
+    def setUp(self):
+        super().setUp()
+        self.customer = customers.models.Customer.objects.create(name="test name")
+        self.product = products.models.Product.objects.get(pk=1)
+
+    def _debit(self, amount, days_ago=0):
+        debit = self.customer.debits.create(amount=amount)
+        if days_ago:
+            debit.date = date.today() - timedelta(days=days_ago)
+            debit.save()
+        return debit
+
+    def _order(self, confirmed_amount, days_ago=0):
+        customer_order = orders.models.Order.objects.create(date=date.today() - timedelta(days=days_ago)) \
+            .customers.create(customer=self.customer)
+        customer_order.product_orders.create(product=self.product, amount=0, confirmed_amount=confirmed_amount)
+        return customer_order
+
+    def _balances(self):
+        return list(self.customer.ledger.values_list('amount', 'balance'))
+
+    def test_running_balance(self):
+        self._debit(500)
+        self._order(2)
+        self.assertEqual([(500, 500), (-200, 300)], self._balances())
+
+    def test_backdated_debit(self):
+        self._order(2, days_ago=2)
+        self._debit(500)
+        self._debit(100, days_ago=5)
+        self.assertEqual([(100, 100), (-200, -100), (500, 400)], self._balances())
+        self.assertEqual(400, self.customer.balance())
+
+    def test_debit_changed(self):
+        debit = self._debit(100, days_ago=5)
+        self._order(2, days_ago=2)
+        debit.amount = 300
+        debit.save()
+        self.assertEqual([(300, 300), (-200, 100)], self._balances())
+        debit.date = date.today()
+        debit.save()
+        self.assertEqual([(-200, -200), (300, 100)], self._balances())
+
+    def test_debit_deleted(self):
+        debit = self._debit(100, days_ago=5)
+        self._order(2, days_ago=2)
+        debit.delete()
+        self.assertEqual([(-200, -200)], self._balances())
+
+    def test_unconfirmed_order(self):
+        customer_order = self._order(0)
+        self.assertEqual([], self._balances())
+        product_order = customer_order.product_orders.get()
+        product_order.confirmed_amount = 1
+        product_order.save()
+        self.assertEqual([(-100, -100)], self._balances())
+        product_order.confirmed_amount = 0
+        product_order.save()
+        self.assertEqual([], self._balances())
+
+    def test_customer_order_customer_changed(self):
+        other = customers.models.Customer.objects.create(name="other name")
+        other.debits.create(amount=300)
+        customer_order = self._order(2, days_ago=2)
+        self._debit(500)
+        customer_order = orders.models.CustomerOrder.objects.get(pk=customer_order.pk)
+        customer_order.customer = other
+        customer_order.save()
+        self.assertEqual([(500, 500)], self._balances())
+        self.assertEqual([(-200, -200), (300, 100)], list(other.ledger.values_list('amount', 'balance')))
+        self.assertEqual((500, 100), (self.customer.balance(), other.balance()))
+        # ledgers match debits and orders
+        call_command('rebuild_ledger', verify=True, stdout=StringIO())
+
+    def test_customer_order_deleted(self):
+        self._debit(500, days_ago=5)
+        customer_order = self._order(2, days_ago=2)
+        self._order(1)
+        customer_order.delete()
+        self.assertEqual([(500, 500), (-100, 400)], self._balances())
+
+    def test_price_changed(self):
+        self._debit(500, days_ago=5)
+        self._order(2, days_ago=2)
+        price = self.product.prices.create(price=150)
+        price.date = date.today() - timedelta(days=3)
+        price.save()
+        self.assertEqual([(500, 500), (-300, 200)], self._balances())
+
+    def test_order_date_changed(self):
+        self._debit(500, days_ago=2)
+        customer_order = self._order(2)
+        order = customer_order.order
+        order.date = date.today() - timedelta(days=5)
+        order.save()
+        self.assertEqual([(-200, -200), (500, 300)], self._balances())
+
+
+class RebuildLedgerCommandTestCase(TestCase):
+    fixtures = ['test_products', 'test_customers', 'test_orders']
+
+    def setUp(self):
+        super().setUp()
+        self.customer = customers.models.Customer.objects.get(pk=1)
+        self.customer.debits.create(amount=1000)
+        # fixtures are loaded as raw rows, confirm the order with a bulk update that skips the signals
+        orders.models.ProductOrder.objects.update(confirmed_amount=1)
+        call_command('rebuild_totals', stdout=StringIO())
+
+    def test_rebuild(self):
+        customers.models.LedgerEntry.objects.update(balance=0)
+        out = StringIO()
+        call_command('rebuild_ledger', stdout=out)
+        self.assertIn("2 fixed", out.getvalue())
+        self.assertEqual(1000 - 500, self.customer.balance())
+        self.assertEqual(-500, customers.models.Customer.objects.get(pk=2).balance())
+
+    def test_verify(self):
+        out = StringIO()
+        call_command('rebuild_ledger', verify=True, stdout=out)
+        self.assertIn("0 mismatched", out.getvalue())
+        customers.models.LedgerEntry.objects.filter(customer=self.customer).update(balance=0)
+        with self.assertRaisesMessage(CommandError, "1 customer ledgers differ from debits and orders"):
+            call_command('rebuild_ledger', verify=True, stdout=StringIO())
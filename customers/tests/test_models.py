@@ -81,6 +81,58 @@ class CustomerTestCase(TestCase):
             test_customer.transfers()
         )
 
+    def test_transfers_num_queries(self):
+        test_customer = self._test_customer()
+        product = products.models.Product.objects.first()
+        for days in range(5):
+            orders.models.Order.objects.create(date=date.today() - timedelta(days=days)) \
+                .customers.create(customer=test_customer) \
+                .product_orders.create(product=product, amount=0, confirmed_amount=1)
+        expected_balance = -5 * product.price
+        with self.assertNumQueries(1):
+            self.assertEqual(expected_balance, test_customer.balance())
+        with self.assertNumQueries(1):
+            self.assertEqual(5, len(test_customer.transfers()))
+
+    def _add_history(self, test_customer, weeks):
+        product = products.models.Product.objects.first()
+        for week in range(weeks):
+            day = date(2001, 1, 7) + timedelta(days=7 * week)
+            orders.models.Order.objects.create(date=day) \
+                .customers.create(customer=test_customer) \
+                .product_orders.create(product=product, amount=0, confirmed_amount=1)
+            debit = test_customer.debits.create(amount=50)
+            debit.date = day
+            debit.save()
+        return product.price
+
+    def test_statement(self):
+        test_customer = self._test_customer()
+        price = self._add_history(test_customer, 6)
+        page = test_customer.statement(page=2, limit=5)
+        self.assertEqual(3, page.paginator.num_pages)
+        self.assertEqual(5, len(page))
+        entries = list(test_customer.ledger.all())
+        self.assertEqual(entries[5:10], page.object_list)
+        self.assertEqual(entries[4].balance, page.object_list[0].opening_balance)
+        self.assertEqual(6 * (50 - price), test_customer.statement(page='last', limit=5).object_list[-1].balance)
+
+    def test_statement_num_queries(self):
+        test_customer = self._test_customer()
+        self._add_history(test_customer, 3)
+        # count and page, debits are joined
+        with self.assertNumQueries(2):
+            page = test_customer.statement(limit=4)
+            [entry.debit.get_edit_url() for entry in page if entry.debit]
+
+    def test_balance_as_of(self):
+        test_customer = self._test_customer()
+        price = self._add_history(test_customer, 3)
+        self.assertEqual(0, test_customer.balance_as_of(date(2001, 1, 6)))
+        self.assertEqual(50 - price, test_customer.balance_as_of(date(2001, 1, 7)))
+        self.assertEqual(2 * (50 - price), test_customer.balance_as_of(date(2001, 1, 20)))
+        self.assertEqual(test_customer.balance(), test_customer.balance_as_of(date(2002, 1, 1)))
+
     def test_balance_init(self):
         test_customer = self._test_customer()
         self.assertEqual(0, test_customer.balance())
@@ -1,6 +1,9 @@
 from datetime import date, timedelta
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse, reverse_lazy
 
 import orders.models
@@ -25,6 +28,96 @@ class CustomersListViewTestCase(ViewTestCaseMixin, TestCase):
                                  ordered=False)
 
 
+class CustomersListViewBalanceTestCase(TestCase):
+    fixtures = ['test_customers', 'test_products']
+
+    def setUp(self):
+        super().setUp()
+        product = products.models.Product.objects.first()
+        self.debtor = models.Customer.objects.get(pk=1)
+        orders.models.Order.objects.create(date=date.today()) \
+            .customers.create(customer=self.debtor) \
+            .product_orders.create(product=product, amount=0, confirmed_amount=2)
+        self.creditor = models.Customer.objects.get(pk=2)
+        self.creditor.debits.create(amount=300)
+
+    def get_customer_list(self, **params):
+        response = self.client.get(reverse('customers:index'), params)
+        return [(customer, customer.current_balance) for customer in response.context['customer_list']]
+
+    def test_balance(self):
+        self.assertEqual([(self.debtor, -200), (self.creditor, 300)], self.get_customer_list())
+        for customer in models.Customer.objects.with_balance():
+            self.assertEqual(customer.balance(), customer.current_balance)
+
+    def test_ordering(self):
+        self.assertEqual([(self.creditor, 300), (self.debtor, -200)], self.get_customer_list(order='-name'))
+        self.assertEqual([(self.debtor, -200), (self.creditor, 300)], self.get_customer_list(order='balance'))
+        self.assertEqual([(self.creditor, 300), (self.debtor, -200)], self.get_customer_list(order='-balance'))
+        self.assertEqual([(self.debtor, -200), (self.creditor, 300)], self.get_customer_list(order='invalid'))
+
+    def test_filter(self):
+        self.assertEqual([(self.debtor, -200)], self.get_customer_list(filter='debtors'))
+        self.assertEqual([(self.creditor, 300)], self.get_customer_list(filter='creditors'))
+        self.assertEqual([(self.debtor, -200), (self.creditor, 300)], self.get_customer_list(filter='invalid'))
+
+    def test_num_queries_independent_of_customers(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('customers:index'))
+        for index in range(10):
+            customer = models.Customer.objects.create(name=f'user{index + 3}')
+            customer.debits.create(amount=index)
+        with self.assertNumQueries(len(queries)):
+            self.client.get(reverse('customers:index'))
+
+
+@override_settings(TAGGED_CACHE_TIMEOUT=60)
+class CustomersListViewCacheTestCase(TestCase):
+    fixtures = ['test_customers']
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.customer = models.Customer.objects.get(pk=1)
+        self.client.get(reverse('customers:index'))
+
+    def test_cached(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('customers:index'))
+        self.assertContains(response, self.customer.name)
+
+    def test_debit_invalidates(self):
+        self.customer.debits.create(amount=123)
+        self.assertContains(self.client.get(reverse('customers:index')), '123')
+
+    def test_customer_invalidates(self):
+        self.customer.name = 'renamed'
+        self.customer.save()
+        self.assertContains(self.client.get(reverse('customers:index')), 'renamed')
+
+
+class CustomerConditionalGetTestCase(TestCase):
+    fixtures = ['test_customers']
+
+    def setUp(self):
+        super().setUp()
+        self.customer = models.Customer.objects.get(pk=1)
+
+    def test_detail(self):
+        url = self.customer.get_absolute_url()
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(304, self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+        self.customer.debits.create(amount=100)
+        self.assertEqual(200, self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+
+    def test_list(self):
+        url = reverse('customers:index')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(304, self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+        models.Customer.objects.get(pk=2).debits.create(amount=100)
+        self.assertEqual(200, self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+
+
 class CustomerDetailViewTestCase(ViewTestCaseMixin, TestCase):
     fixtures = ['test_customers']
     view_class = views.CustomerDetailView
@@ -43,6 +136,17 @@ class CustomerDetailViewTestCase(ViewTestCaseMixin, TestCase):
         self.assertEqual(self.customer, response.context['object'])
         self.assertEqual(self.customer, response.context['customer'])
 
+    def test_statement_last_page(self):
+        for amount in range(1, 61):
+            self.customer.debits.create(amount=amount)
+        response = self.client.get(self.customer.get_absolute_url())
+        statement = response.context['statement']
+        self.assertEqual(2, statement.number)
+        self.assertEqual(list(range(51, 61)), [entry.amount for entry in statement])
+        self.assertContains(response, '1275.00')
+        response = self.client.get(self.customer.get_absolute_url(), {'page': 1})
+        self.assertEqual(list(range(1, 51)), [entry.amount for entry in response.context['statement']])
+
 
 class CustomerCreateViewTestCase(ViewTestCaseMixin, TestCase):
     view_class = views.CustomerCreateView
@@ -1,9 +1,12 @@
 import django.forms
+from django.db.models import Count, Max, Q
 from django.shortcuts import get_object_or_404
 from django.views.generic import ListView, CreateView, UpdateView, DetailView, DeleteView
 
 import customers.models
-from helpers.views import CreateWithParentView
+import helpers.cache
+from helpers.tracing import traced
+from helpers.views import ConditionalGetMixin, CreateWithParentView, TaggedCacheMixin
 
 
 class CustomerMixin:
@@ -27,6 +30,7 @@ class DebitMixin:
         self.customer = self.customer or get_object_or_404(customers.models.Customer, pk=self.kwargs['customer_pk'])
         return super().dispatch(request, *args, **kwargs)
 
+    @traced()
     def get_context_data(self, **kwargs):
         kwargs['customer'] = self.customer
         return super(DebitMixin, self).get_context_data(**kwargs)
@@ -35,12 +39,68 @@ class DebitMixin:
 # Create your views here.
 
 
-class CustomersListView(CustomerMixin, ListView):
-    pass
+class CustomersListView(CustomerMixin, ConditionalGetMixin, TaggedCacheMixin, ListView):
+    cache_tags = [helpers.cache.tag(customers.models.Customer)]
+    orderings = {
+        'name': 'name',
+        '-name': '-name',
+        'balance': 'current_balance',
+        '-balance': '-current_balance',
+    }
+    filters = {
+        'debtors': Q(current_balance__lt=0),
+        'creditors': Q(current_balance__gt=0),
+    }
 
+    def get_order_key(self):
+        order = self.request.GET.get('order')
+        return order if order in self.orderings else 'name'
 
-class CustomerDetailView(CustomerMixin, DetailView):
-    pass
+    def get_filter_key(self):
+        balance_filter = self.request.GET.get('filter')
+        return balance_filter if balance_filter in self.filters else None
+
+    def get_queryset(self):
+        queryset = self.model.objects.with_balance()
+        filter_key = self.get_filter_key()
+        if filter_key is not None:
+            queryset = queryset.filter(self.filters[filter_key])
+        return queryset.order_by(self.get_ordering())
+
+    def get_ordering(self):
+        return self.orderings[self.get_order_key()]
+
+    def get_stamp_tags(self):
+        return self.get_cache_tags()
+
+    def get_stamp(self):
+        stamp = self.model.objects.aggregate(count=Count('pk'), last_modified=Max('updated_at'))
+        if not stamp['count']:
+            return None, None
+        return f"customers-{stamp['count']}-{stamp['last_modified'].timestamp()}", stamp['last_modified']
+
+    @traced()
+    def get_context_data(self, **kwargs):
+        kwargs['order'] = self.get_order_key()
+        kwargs['filter'] = self.get_filter_key()
+        return super().get_context_data(**kwargs)
+
+
+class CustomerDetailView(CustomerMixin, ConditionalGetMixin, DetailView):
+    def get_stamp_tags(self):
+        return [helpers.cache.tag(self.model, self.kwargs[self.pk_url_kwarg])]
+
+    def get_stamp(self):
+        updated_at = self.model.objects.filter(pk=self.kwargs[self.pk_url_kwarg]) \
+            .values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            return None, None
+        return f"customer-{self.kwargs[self.pk_url_kwarg]}-{updated_at.timestamp()}", updated_at
+
+    @traced()
+    def get_context_data(self, **kwargs):
+        kwargs['statement'] = self.object.statement(self.request.GET.get('page', 'last'))
+        return super().get_context_data(**kwargs)
 
 
 class CustomerCreateView(CustomerMixin, CreateView):
@@ -0,0 +1,14 @@
+import os
+
+
+def on_starting(server):
+    """Check the cache is shared by the workers, see helpers.checks, and start request metrics from zero on every
+    start of the server, see helpers.metrics.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'milkshop.settings')
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('check', tags=['caches'])
+    from helpers import metrics
+    metrics.clear()
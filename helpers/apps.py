@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class HelpersConfig(AppConfig):
+    name = 'helpers'
+
+    def ready(self):
+        from helpers import checks  # noqa: F401
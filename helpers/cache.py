@@ -0,0 +1,75 @@
+"""Cache of rendered responses and template fragments tagged with the data they depend on.
+
+Every tag has a version kept in the default cache, entries are stored under a key made of
+their name and the versions of their tags, so invalidating a tag makes all its entries unreachable.
+Entries are only cached when ``settings.TAGGED_CACHE_TIMEOUT`` is set, and the default cache has to be shared
+by the workers then, see helpers.checks.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+TAG_PREFIX = 'tag:'
+ENTRY_PREFIX = 'tagged:'
+
+
+def timeout():
+    return getattr(settings, 'TAGGED_CACHE_TIMEOUT', 0)
+
+
+def process_local():
+    """Whether the default cache is kept in every process, tags invalidated by a worker stay valid in the others."""
+    return isinstance(caches['default'], LocMemCache)
+
+
+def tag(model, pk=None):
+    """Tag of a model instance, or of every row of a model without ``pk``."""
+    label = model._meta.label_lower
+    return label if pk is None else f'{label}:{pk}'
+
+
+def tag_versions(tags):
+    """Current versions of tags, tags without one get a new version."""
+    keys = [TAG_PREFIX + name for name in tags]
+    versions = cache.get_many(keys)
+    missing = {key: uuid.uuid4().hex for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def invalidate(*tags):
+    cache.delete_many([TAG_PREFIX + name for name in tags])
+
+
+def make_key(name, tags):
+    tags = sorted(frozenset(tags))
+    digest = hashlib.md5('\n'.join([name] + tags + tag_versions(tags)).encode()).hexdigest()
+    return ENTRY_PREFIX + digest
+
+
+def get(name, tags, default=None):
+    if not timeout():
+        return default
+    return cache.get(make_key(name, tags), default)
+
+
+def set(name, tags, value):
+    if timeout():
+        cache.set(make_key(name, tags), value, timeout())
+
+
+def get_or_set(name, tags, compute):
+    """Cached value of ``name``, ``compute()`` is called and cached on a miss."""
+    if not timeout():
+        return compute()
+    key = make_key(name, tags)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout())
+    return value
@@ -0,0 +1,15 @@
+from django.core import checks
+
+import helpers.cache
+
+
+@checks.register(checks.Tags.caches)
+def check_tagged_cache(app_configs, **kwargs):
+    if helpers.cache.timeout() and helpers.cache.process_local():
+        return [checks.Error(
+            "TAGGED_CACHE_TIMEOUT is set but the default cache is kept in every process, "
+            "so workers would serve pages invalidated by other workers.",
+            hint="Set MILKSHOP_CACHE_DIR, or another cache shared by the workers.",
+            id='helpers.E001',
+        )]
+    return []
@@ -0,0 +1,73 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from helpers import slow_queries
+
+SORT_KEYS = {
+    'total': lambda group: -group['total_ms'],
+    'max': lambda group: -group['max_ms'],
+    'count': lambda group: -group['count'],
+}
+
+
+def summarize(entries):
+    """Entries of the log grouped by fingerprint, with the plan of the latest one."""
+    groups = {}
+    for entry in entries:
+        group = groups.setdefault(entry['fingerprint'], {
+            'fingerprint': entry['fingerprint'], 'requests': 0, 'count': 0, 'slow': 0, 'total_ms': 0.0,
+            'max_ms': 0.0, 'max_repeat': 0, 'reasons': set(), 'views': set(), 'plan': None})
+        group['requests'] += 1 + entry.get('left_out', 0)
+        group['count'] += entry['count']
+        group['slow'] += entry['slow']
+        group['total_ms'] += entry['total_ms']
+        group['max_ms'] = max(group['max_ms'], entry['max_ms'])
+        group['max_repeat'] = max(group['max_repeat'], entry['count'])
+        group['reasons'].update(entry['reasons'])
+        group['views'].add(entry['view'] or entry['path'])
+        if entry['plan'] is not None:
+            group['plan'] = entry['plan']
+    for group in groups.values():
+        group['reasons'] = sorted(group['reasons'])
+        group['views'] = sorted(group['views'])
+        group['costly_steps'] = slow_queries.costly_steps(group['plan'])
+        group['total_ms'] = round(group['total_ms'], 3)
+    return list(groups.values())
+
+
+class Command(BaseCommand):
+    help = "Summarize the slow query log by query, worst first, see helpers.slow_queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', help="Log to read, settings.SLOW_QUERY_LOG by default")
+        parser.add_argument('--sort', choices=sorted(SORT_KEYS), default='total',
+                            help="Order by total time, slowest run or number of runs")
+        parser.add_argument('--limit', type=int, default=10, help="Number of queries shown")
+        parser.add_argument('--json', action='store_true', dest='as_json', help="Write the summary as JSON")
+        parser.add_argument('--clear', action='store_true', help="Empty the log after summarizing it")
+
+    def handle(self, *args, log=None, sort='total', limit=10, as_json=False, clear=False, **options):
+        path = log or settings.SLOW_QUERY_LOG
+        if not os.path.exists(path):
+            raise CommandError(f"No slow query log at {path}")
+        groups = sorted(summarize(slow_queries.read(path)), key=SORT_KEYS[sort])[:limit]
+        if as_json:
+            self.stdout.write(json.dumps(groups, indent=2))
+        else:
+            for group in groups:
+                self.stdout.write(
+                    f"{group['total_ms']:.1f} ms in {group['count']} runs over {group['requests']} requests, "
+                    f"slowest {group['max_ms']:.1f} ms, up to {group['max_repeat']} per request "
+                    f"({', '.join(group['reasons'])})")
+                self.stdout.write(f"  {group['fingerprint']}")
+                self.stdout.write(f"  views: {', '.join(group['views'])}")
+                for line in group['plan'] or []:
+                    marker = '!' if line in group['costly_steps'] else ' '
+                    self.stdout.write(f"  {marker} {line}")
+                self.stdout.write('')
+            self.stdout.write(f"{len(groups)} queries")
+        if clear:
+            slow_queries.clear(path)
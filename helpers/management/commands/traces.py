@@ -0,0 +1,90 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from helpers import tracing
+
+
+def span_tree(spans):
+    """``(depth, span)`` of the spans of a trace, depth first with children by start."""
+    children = {}
+    for span in spans:
+        children.setdefault(span['parent_id'], []).append(span)
+    for siblings in children.values():
+        siblings.sort(key=lambda span: span['start_ms'])
+
+    def walk(parent_id, depth):
+        for span in children.get(parent_id, []):
+            yield depth, span
+            yield from walk(span['span_id'], depth + 1)
+
+    return list(walk(None, 0))
+
+
+def breakdown(spans):
+    """Time of a trace in queries and in templates, and of the queries run while rendering templates."""
+    by_id = {span['span_id']: span for span in spans}
+
+    def has_ancestor(span, kind):
+        parent = by_id.get(span['parent_id'])
+        while parent is not None:
+            if parent['kind'] == kind:
+                return True
+            parent = by_id.get(parent['parent_id'])
+        return False
+
+    queries = [span for span in spans if span['kind'] == 'sql']
+    return {
+        'queries': len(queries),
+        'sql_ms': sum(span['duration_ms'] for span in queries),
+        'template_ms': sum(span['duration_ms'] for span in spans
+                           if span['kind'] == 'template' and not has_ancestor(span, 'template')),
+        'template_sql_ms': sum(span['duration_ms'] for span in queries if has_ancestor(span, 'template')),
+    }
+
+
+class Command(BaseCommand):
+    help = "Print the spans of the slowest recent traced requests as waterfalls, see helpers.tracing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--slowest', type=int, default=5, help="Number of traces shown")
+        parser.add_argument('--view', default='', help="Only traces of views with names containing this text")
+        parser.add_argument('--trace', dest='trace_id', help="Show the trace with this id")
+        parser.add_argument('--min-ms', type=float, default=0.0, help="Hide spans shorter than this")
+        parser.add_argument('--width', type=int, default=40, help="Width of the bars")
+        parser.add_argument('--dir', dest='directory', help="Directory of the traces, settings.TRACE_DIR by default")
+
+    def handle(self, *args, slowest=5, view='', trace_id=None, min_ms=0.0, width=40, directory=None, **options):
+        traces = [trace for trace in tracing.read_traces(directory)
+                  if (trace_id is None or trace['trace_id'] == trace_id)
+                  and view in trace['attributes'].get('view', '')]
+        if trace_id is not None and not traces:
+            raise CommandError(f"No trace {trace_id}")
+        traces.sort(key=lambda trace: -trace['duration_ms'])
+        for trace in traces[:slowest]:
+            self.waterfall(trace, min_ms, width)
+        if not traces:
+            self.stdout.write("No traces")
+
+    def waterfall(self, trace, min_ms, width):
+        started = datetime.datetime.fromtimestamp(trace['started']).isoformat(sep=' ', timespec='seconds')
+        status = trace['attributes'].get('status', '')
+        self.stdout.write(f"{trace['trace_id']} {trace['name']} {status} {trace['duration_ms']:.1f} ms at {started}")
+        total = trace['duration_ms'] or 1
+        parts = breakdown(trace['spans'])
+        self.stdout.write(
+            f"  {parts['queries']} queries {parts['sql_ms']:.1f} ms ({parts['sql_ms'] / total:.0%}), "
+            f"templates {parts['template_ms']:.1f} ms ({parts['template_ms'] / total:.0%}) "
+            f"of which queries {parts['template_sql_ms']:.1f} ms")
+        for depth, span in span_tree(trace['spans']):
+            if span['duration_ms'] < min_ms and depth > 0:
+                continue
+            name = span['name']
+            if span['kind'] == 'sql':
+                name = f"sql {' '.join(span['attributes'].get('statement', '').split())}"
+            label = ('  ' * depth + name)[:60].ljust(60)
+            offset = min(width - 1, int(span['start_ms'] / total * width))
+            length = max(1, round(span['duration_ms'] / total * width))
+            bar = (' ' * offset + '█' * length)[:width].ljust(width)
+            self.stdout.write(f"  {label} |{bar}| {span['start_ms']:8.1f} {span['duration_ms']:8.1f} ms")
+        self.stdout.write('')
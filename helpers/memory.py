@@ -0,0 +1,166 @@
+"""Allocation profiling of requests with tracemalloc.
+
+A traced request is run between two snapshots. Its peak is the most memory traced above what was allocated
+when it started, and its top allocation sites are the lines with the most memory still allocated at its end,
+attributed to the innermost frame of project code. Every process appends its traced requests to its own
+JSON lines file in ``settings.MEMORY_STATS_DIR``, and the statistics merge the files of all processes,
+keeping the latest ``settings.MEMORY_STATS_WINDOW`` traced requests of every view.
+"""
+import glob
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+
+EXCLUDED = [tracemalloc.__file__, '<frozen importlib._bootstrap>', '<frozen importlib._bootstrap_external>',
+            '<unknown>']
+
+Site = namedtuple('Site', 'site size_kb count')
+
+lock = threading.Lock()
+
+
+def frame_site(traceback):
+    """``file:line`` of the innermost frame of project code in a traceback, the innermost frame without one."""
+    root = str(settings.BASE_DIR)
+    for frame in reversed(traceback):
+        if frame.filename.startswith(root) and 'site-packages' not in frame.filename:
+            return f'{os.path.relpath(frame.filename, root)}:{frame.lineno}'
+    frame = traceback[-1]
+    return f'{frame.filename}:{frame.lineno}'
+
+
+class AllocationTrace:
+    """Context manager tracing the allocations of a block of code.
+
+    tracemalloc is started for the block, unless it is already tracing, with ``frames`` frames per allocation.
+    """
+
+    def __init__(self, frames=10, limit=10):
+        self.frames = frames
+        self.limit = limit
+        self.peak_kb = None
+        self.allocated_kb = None
+        self.sites = []
+
+    def __enter__(self):
+        # only one request is traced at a time, tracemalloc is global to the process
+        lock.acquire()
+        self.started = not tracemalloc.is_tracing()
+        if self.started:
+            tracemalloc.start(self.frames)
+        self.before = tracemalloc.take_snapshot().filter_traces(self.filters())
+        self.start_size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            size, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot().filter_traces(self.filters())
+            self.peak_kb = round((peak - self.start_size) / 1024, 1)
+            self.allocated_kb = round((size - self.start_size) / 1024, 1)
+            self.sites = self.top_sites(after.compare_to(self.before, 'traceback'))
+        finally:
+            del self.before
+            if self.started:
+                tracemalloc.stop()
+            lock.release()
+
+    @staticmethod
+    def filters():
+        return [tracemalloc.Filter(False, filename) for filename in EXCLUDED]
+
+    def top_sites(self, differences):
+        """Sites with the most memory allocated in the block and not freed, largest first."""
+        sizes = defaultdict(int)
+        counts = defaultdict(int)
+        for difference in differences:
+            if difference.size_diff > 0:
+                site = frame_site(difference.traceback)
+                sizes[site] += difference.size_diff
+                counts[site] += max(difference.count_diff, 0)
+        top = sorted(sizes, key=sizes.get, reverse=True)[:self.limit]
+        return [Site(site, round(sizes[site] / 1024, 1), counts[site]) for site in top]
+
+
+stats_lock = threading.Lock()
+# lines in the file of the current process, by pid as forked processes start with the counts of their parent
+stats_lines = {}
+
+
+def stats_path():
+    return os.path.join(settings.MEMORY_STATS_DIR, f'{os.getpid()}.jsonl')
+
+
+def record(view_name, peak_kb, sites):
+    """Add the peak of a traced request of a view to the file of the current process."""
+    line = json.dumps({'time': time.time(), 'view': view_name or 'unresolved', 'peak_kb': peak_kb,
+                       'sites': [site._asdict() for site in sites]})
+    window = getattr(settings, 'MEMORY_STATS_WINDOW', 100)
+    with stats_lock:
+        os.makedirs(settings.MEMORY_STATS_DIR, exist_ok=True)
+        path = stats_path()
+        with open(path, 'a') as file:
+            file.write(line + '\n')
+        stats_lines[path] = stats_lines.get(path, 0) + 1
+        if stats_lines[path] > 10 * window:
+            stats_lines[path] = compact(path, window)
+
+
+def compact(path, window):
+    """Keep the latest ``window`` entries of every view in a file, returns the number of lines left."""
+    kept = latest(read(path), window)
+    entries = sorted((entry for view_entries in kept.values() for entry in view_entries), key=lambda e: e['time'])
+    with open(path + '.tmp', 'w') as file:
+        file.writelines(json.dumps(entry) + '\n' for entry in entries)
+    os.replace(path + '.tmp', path)
+    return len(entries)
+
+
+def read(path):
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def latest(entries, window):
+    """``{view name: entries}`` of the latest ``window`` entries of every view, oldest first."""
+    by_view = defaultdict(list)
+    for entry in sorted(entries, key=lambda e: e['time']):
+        by_view[entry['view']].append(entry)
+    return {view_name: view_entries[-window:] for view_name, view_entries in by_view.items()}
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of sorted values."""
+    return values[min(len(values) - 1, max(0, round(percent / 100 * len(values) + 0.5) - 1))]
+
+
+def view_stats():
+    """``{view name: {count, last, p50, p90, max, worst}}`` of the traced requests of all processes,
+    by descending p90.
+    """
+    entries = [entry for path in glob.glob(os.path.join(settings.MEMORY_STATS_DIR, '*.jsonl'))
+               for entry in read(path)]
+    result = {}
+    for view_name, view_entries in latest(entries, getattr(settings, 'MEMORY_STATS_WINDOW', 100)).items():
+        peaks = sorted(entry['peak_kb'] for entry in view_entries)
+        worst = max(view_entries, key=lambda entry: entry['peak_kb'])
+        result[view_name] = {'count': len(peaks), 'last': view_entries[-1]['peak_kb'], 'p50': percentile(peaks, 50),
+                             'p90': percentile(peaks, 90), 'max': peaks[-1],
+                             'worst': {'peak_kb': worst['peak_kb'], 'sites': worst['sites']}}
+    return dict(sorted(result.items(), key=lambda item: -item[1]['p90']))
+
+
+def clear():
+    """Remove the traced requests of all processes."""
+    with stats_lock:
+        stats_lines.clear()
+        for path in glob.glob(os.path.join(settings.MEMORY_STATS_DIR, '*.jsonl')):
+            os.remove(path)
@@ -0,0 +1,202 @@
+"""Request metrics shared by the worker processes, exposed in the Prometheus text format.
+
+Every process adds to its own file in ``settings.METRICS_DIR``, mapped to memory, holding float values by
+sample key such as ``milkshop_requests_total{method="GET",status="200",view="orders:index"}``.
+The exposition sums the values of the files of all processes, dead ones included, so counters do not go
+back when a worker is restarted; the directory is cleared when the server starts, see gunicorn.conf.py.
+"""
+import glob
+import mmap
+import os
+import struct
+import threading
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+
+HEADER = struct.Struct('Q')
+KEY_LENGTH = struct.Struct('i')
+VALUE = struct.Struct('d')
+
+Family = namedtuple('Family', 'name type help labels buckets')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 12, 20, 50, 100, 200, 500)
+
+REQUESTS = Family('milkshop_requests_total', 'counter', "Requests by view, method and response status",
+                  ('view', 'method', 'status'), None)
+EXCEPTIONS = Family('milkshop_request_exceptions_total', 'counter', "Exceptions raised by views",
+                    ('view', 'exception'), None)
+LATENCY = Family('milkshop_request_duration_seconds', 'histogram', "Time to respond to requests",
+                 ('view', 'method'), LATENCY_BUCKETS)
+QUERIES = Family('milkshop_request_db_queries', 'histogram', "Database queries run by requests",
+                 ('view', 'method'), QUERY_BUCKETS)
+DB_TIME = Family('milkshop_request_db_duration_seconds', 'histogram', "Time of database queries of requests",
+                 ('view', 'method'), LATENCY_BUCKETS)
+FAMILIES = [REQUESTS, EXCEPTIONS, LATENCY, QUERIES, DB_TIME]
+# other methods come from clients and are labelled 'other', each would add samples to the files otherwise
+METHODS = frozenset(['GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'TRACE', 'CONNECT'])
+
+
+def method_label(method):
+    return method if method in METHODS else 'other'
+
+
+def padded(length):
+    """Size of an entry with a key of ``length`` bytes, the value aligned on 8 bytes."""
+    return (KEY_LENGTH.size + length + 7) // 8 * 8 + VALUE.size
+
+
+class MmapValues:
+    """Float values by key in a file mapped to memory, written by a single process.
+
+    The file is an 8 bytes size of the used part, followed by entries of a 4 bytes key length,
+    the UTF-8 key padded to 8 bytes and an 8 bytes float. An entry is written before the used
+    size is increased to include it, so readers never see a partial one.
+    """
+    initial_size = 1 << 16
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'a+b')
+        if os.fstat(self.file.fileno()).st_size == 0:
+            self.file.truncate(self.initial_size)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.used = HEADER.unpack_from(self.map, 0)[0] or HEADER.size
+        self.positions = {key: position for key, position, _ in read_entries(self.map, self.used)}
+
+    def add(self, key, amount):
+        with self.lock:
+            position = self.positions.get(key)
+            if position is None:
+                position = self.positions[key] = self.append(key)
+            VALUE.pack_into(self.map, position, VALUE.unpack_from(self.map, position)[0] + amount)
+
+    def append(self, key):
+        encoded = key.encode()
+        size = padded(len(encoded))
+        if self.used + size > len(self.map):
+            new_size = max(2 * len(self.map), self.used + size)
+            self.map.close()
+            self.file.truncate(new_size)
+            self.map = mmap.mmap(self.file.fileno(), 0)
+        KEY_LENGTH.pack_into(self.map, self.used, len(encoded))
+        self.map[self.used + KEY_LENGTH.size:self.used + KEY_LENGTH.size + len(encoded)] = encoded
+        position = self.used + size - VALUE.size
+        VALUE.pack_into(self.map, position, 0.0)
+        self.used += size
+        HEADER.pack_into(self.map, 0, self.used)
+        return position
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+def read_entries(data, used=None):
+    """``(key, value position, value)`` of the entries of the content of a values file."""
+    if used is None:
+        used = HEADER.unpack_from(data, 0)[0] if len(data) >= HEADER.size else 0
+    position = HEADER.size
+    while position < used:
+        length = KEY_LENGTH.unpack_from(data, position)[0]
+        key = bytes(data[position + KEY_LENGTH.size:position + KEY_LENGTH.size + length]).decode()
+        value_position = position + padded(length) - VALUE.size
+        yield key, value_position, VALUE.unpack_from(data, value_position)[0]
+        position += padded(length)
+
+
+store = None
+store_lock = threading.Lock()
+
+
+def get_store():
+    """Values file of the current process, opened again in processes forked after it was."""
+    global store
+    with store_lock:
+        if store is None or store.pid != os.getpid():
+            os.makedirs(settings.METRICS_DIR, exist_ok=True)
+            store = MmapValues(os.path.join(settings.METRICS_DIR, f'{os.getpid()}.db'))
+            store.pid = os.getpid()
+        return store
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def sample_key(name, labels):
+    return name + '{' + ','.join(f'{label}="{escape(value)}"' for label, value in sorted(labels.items())) + '}'
+
+
+def inc(family, amount=1, **labels):
+    get_store().add(sample_key(family.name, labels), amount)
+
+
+def observe(family, value, **labels):
+    """Add a value to a histogram, the buckets are stored cumulative as they are exposed."""
+    values = get_store()
+    for bucket in family.buckets:
+        values.add(sample_key(f'{family.name}_bucket', {**labels, 'le': bucket}), 1 if value <= bucket else 0)
+    values.add(sample_key(f'{family.name}_bucket', {**labels, 'le': '+Inf'}), 1)
+    values.add(sample_key(f'{family.name}_count', labels), 1)
+    values.add(sample_key(f'{family.name}_sum', labels), value)
+
+
+def collect():
+    """Sum of the values of every sample key over the files of all processes."""
+    totals = defaultdict(float)
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.db')):
+        with open(path, 'rb') as file:
+            data = file.read()
+        for key, _, value in read_entries(data):
+            totals[key] += value
+    return totals
+
+
+def family_of(key):
+    name = key.split('{', 1)[0]
+    for family in FAMILIES:
+        if name == family.name or (family.type == 'histogram' and name.rsplit('_', 1)[0] == family.name):
+            return family
+    return None
+
+
+def format_value(value):
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+def exposition():
+    """Metrics in the Prometheus text format, version 0.0.4."""
+    samples = defaultdict(list)
+    for key, value in collect().items():
+        family = family_of(key)
+        if family is not None:
+            samples[family].append((key, value))
+    lines = []
+    for family in FAMILIES:
+        lines.append(f'# HELP {family.name} {family.help}')
+        lines.append(f'# TYPE {family.name} {family.type}')
+        lines.extend(f'{key} {format_value(value)}' for key, value in sorted(samples[family], key=sample_order))
+    return '\n'.join(lines) + '\n'
+
+
+def sample_order(item):
+    """Order of the samples of a family: by labels, buckets by bound."""
+    key = item[0]
+    name, _, labels = key.partition('{')
+    parts = [part for part in labels.rstrip('}').split(',') if not part.startswith('le=')]
+    bound = next((part[4:-1] for part in labels.rstrip('}').split(',') if part.startswith('le=')), None)
+    return parts, name, float('inf') if bound in (None, '+Inf') else float(bound)
+
+
+def clear():
+    """Remove the values of all processes, the current one starts from zero."""
+    global store
+    with store_lock:
+        if store is not None:
+            store.close()
+            store = None
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.db')):
+            os.remove(path)
@@ -0,0 +1,341 @@
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from helpers import memory, metrics, profiling, slow_queries, tracing
+from helpers.queries import RepeatedQueries, format_report
+
+logger = logging.getLogger(__name__)
+
+METRICS = ['queries', 'sql_ms', 'template_ms', 'view_ms', 'total_ms']
+
+
+class MetricsMiddleware:
+    """Count requests and exceptions and observe latency and queries of requests by view, see helpers.metrics.
+
+    It comes before QueryBudgetMiddleware, which measures the queries of the request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - start
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        method = metrics.method_label(request.method)
+        metrics.inc(metrics.REQUESTS, view=view, method=method, status=response.status_code)
+        metrics.observe(metrics.LATENCY, duration, view=view, method=method)
+        request_metrics = getattr(request, 'metrics', None)
+        if request_metrics is not None:
+            metrics.observe(metrics.QUERIES, request_metrics.queries, view=view, method=method)
+            metrics.observe(metrics.DB_TIME, request_metrics.sql_ms / 1000, view=view, method=method)
+        return response
+
+    def process_exception(self, request, exception):
+        metrics.inc(metrics.EXCEPTIONS, view=request.resolver_match.view_name, exception=type(exception).__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestMetrics:
+    """Queries and time spent on one request.
+
+    ``template_ms`` is the time rendering the TemplateResponse, ``view_ms`` the rest of handling the request.
+    SQL run by the view or while rendering counts in ``sql_ms`` as well.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.template_ms = 0.0
+        self.total_ms = 0.0
+
+    @property
+    def view_ms(self):
+        return self.total_ms - self.template_ms
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_ms += (time.perf_counter() - start) * 1000
+
+    def as_dict(self):
+        return {name: getattr(self, name) if name == 'queries' else round(getattr(self, name), 3) for name in METRICS}
+
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.sql_ms:.3f};desc="{self.queries} queries"',
+            f'template;dur={self.template_ms:.3f}',
+            f'view;dur={self.view_ms:.3f}',
+            f'total;dur={self.total_ms:.3f}',
+        ])
+
+
+def get_budget(method, view_name):
+    """Limits of ``settings.REQUEST_BUDGETS`` for a request of a view.
+
+    Budgets are looked up by method and view name ('GET orders:order'), view name ('orders:order') and then '*'.
+    """
+    budgets = getattr(settings, 'REQUEST_BUDGETS', {})
+    for key in [f'{method} {view_name}', view_name, '*']:
+        if key in budgets:
+            return budgets[key]
+    return {}
+
+
+class QueryBudgetMiddleware:
+    """Measure queries, SQL, template and view time of every request.
+
+    Metrics go to the ``Server-Timing`` header and to a JSON log line. Requests of views over their
+    ``settings.REQUEST_BUDGETS`` log a warning, or raise QueryBudgetExceeded when
+    ``settings.REQUEST_BUDGET_RAISE`` is set, as it is in tests.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = request.metrics = RequestMetrics()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics))
+            response = self.get_response(request)
+        metrics.total_ms = (time.perf_counter() - start) * 1000
+        response['Server-Timing'] = metrics.server_timing()
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else None
+        record = {'method': request.method, 'path': request.path, 'view': view_name,
+                  'status': response.status_code, **metrics.as_dict()}
+        logger.info(json.dumps(record), extra={'metrics': record})
+        self.check_budget(record)
+        return response
+
+    def process_template_response(self, request, response):
+        render = response.render
+
+        def timed_render():
+            start = time.perf_counter()
+            try:
+                return render()
+            finally:
+                request.metrics.template_ms += (time.perf_counter() - start) * 1000
+
+        response.render = timed_render
+        return response
+
+    @staticmethod
+    def check_budget(record):
+        over = {name: (record[name], limit) for name, limit in get_budget(record['method'], record['view']).items()
+                if record[name] > limit}
+        if not over:
+            return
+        message = f"{record['method']} {record['view'] or record['path']} over budget: " + ', '.join(
+            f"{name} {value} > {limit}" for name, (value, limit) in over.items())
+        if getattr(settings, 'REQUEST_BUDGET_RAISE', False):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message, extra={'metrics': record})
+
+
+class RepeatedQueriesFound(Exception):
+    pass
+
+
+class RepeatedQueriesMiddleware:
+    """Development middleware reporting queries of the same shape run ``settings.REPEATED_QUERIES_THRESHOLD``
+    times or more in a request, see helpers.queries. Reports are logged as warnings, or raised as
+    RepeatedQueriesFound when ``settings.REPEATED_QUERIES_RAISE`` is set.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        detector = RepeatedQueries(getattr(settings, 'REPEATED_QUERIES_THRESHOLD', 3))
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(detector))
+            response = self.get_response(request)
+        report = detector.report()
+        if report:
+            message = '\n'.join([f"Repeated queries in {request.method} {request.path}:", *format_report(report)])
+            if getattr(settings, 'REPEATED_QUERIES_RAISE', False):
+                raise RepeatedQueriesFound(message)
+            logger.warning(message, extra={'repeated_queries': report})
+        return response
+
+
+class ProfilerMiddleware:
+    """Profile requests asked for with a profiling token or sampled by ``settings.PROFILE_SAMPLE_RATE``.
+
+    The mode is ``settings.PROFILE_MODE``, or the ``profile_mode`` parameter of requests with a token,
+    see helpers.profiling. The name of the saved profile is returned in the ``X-Profile`` header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def get_mode(self, request):
+        """Profiling mode of a request, None when it is not profiled."""
+        token = request.GET.get('profile') or request.META.get('HTTP_X_PROFILE')
+        if token and profiling.check_token(token):
+            mode = request.GET.get('profile_mode', getattr(settings, 'PROFILE_MODE', 'cprofile'))
+            return mode if mode in profiling.MODES else 'cprofile'
+        if random.random() < getattr(settings, 'PROFILE_SAMPLE_RATE', 0):
+            return getattr(settings, 'PROFILE_MODE', 'cprofile')
+        return None
+
+    def __call__(self, request):
+        mode = self.get_mode(request)
+        if mode is None:
+            return self.get_response(request)
+        profiler = profiling.make_profiler(mode)
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        duration_ms = (time.perf_counter() - start) * 1000
+        match = getattr(request, 'resolver_match', None)
+        name = profiling.save(profiler, mode, match.view_name if match else None, request.method, duration_ms)
+        response['X-Profile'] = name
+        return response
+
+
+class MemoryProfilerMiddleware:
+    """Trace the allocations of requests asked for with a profiling token in the ``memory`` parameter or the
+    ``X-Memory-Profile`` header, or sampled by ``settings.MEMORY_PROFILE_SAMPLE_RATE``, see helpers.memory.
+
+    The peak is returned in the ``X-Memory-Peak`` header in KiB and logged with the top allocation sites.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    @staticmethod
+    def is_traced(request):
+        token = request.GET.get('memory') or request.META.get('HTTP_X_MEMORY_PROFILE')
+        if token:
+            return profiling.check_token(token)
+        return random.random() < getattr(settings, 'MEMORY_PROFILE_SAMPLE_RATE', 0)
+
+    def __call__(self, request):
+        if not self.is_traced(request):
+            return self.get_response(request)
+        with memory.AllocationTrace(getattr(settings, 'MEMORY_PROFILE_FRAMES', 10)) as trace:
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else None
+        memory.record(view_name, trace.peak_kb, trace.sites)
+        record = {'method': request.method, 'path': request.path, 'view': view_name, 'status': response.status_code,
+                  'peak_kb': trace.peak_kb, 'allocated_kb': trace.allocated_kb,
+                  'sites': [site._asdict() for site in trace.sites]}
+        logger.info(json.dumps(record), extra={'memory': record})
+        response['X-Memory-Peak'] = str(trace.peak_kb)
+        return response
+
+
+class SlowQueryMiddleware:
+    """Log queries slower than ``settings.SLOW_QUERY_MS`` and statements run more than ``settings.SLOW_QUERY_REPEAT``
+    times in a request, with their plans, to ``settings.SLOW_QUERY_LOG``, see helpers.slow_queries.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        statements = {}
+        slow_ms = getattr(settings, 'SLOW_QUERY_MS', 100)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(
+                    slow_queries.SlowQueries(connection.alias, slow_ms, statements)))
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        logged = slow_queries.entries(statements, request, match.view_name if match else None)
+        if logged:
+            slow_queries.write(logged)
+            for entry in logged:
+                logger.warning(f"{' and '.join(entry['reasons'])} query in {request.method} {request.path}: "
+                               f"{entry['count']} x {entry['max_ms']} ms max {entry['fingerprint']}",
+                               extra={'slow_query': entry})
+        return response
+
+
+class TracingMiddleware:
+    """Trace requests asked for with a profiling token in the ``trace`` parameter or the ``X-Trace`` header,
+    or sampled by ``settings.TRACE_SAMPLE_RATE``, with a span for every query and template, see helpers.tracing.
+
+    It comes first, for the root span to include the other middleware, and ViewTracingMiddleware last.
+    The trace id is returned in the ``X-Trace-Id`` header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        tracing.instrument_templates()
+
+    @staticmethod
+    def is_traced(request):
+        token = request.GET.get('trace') or request.META.get('HTTP_X_TRACE')
+        if token:
+            return profiling.check_token(token)
+        return random.random() < getattr(settings, 'TRACE_SAMPLE_RATE', 0)
+
+    def __call__(self, request):
+        if not self.is_traced(request):
+            return self.get_response(request)
+        with tracing.trace(f'{request.method} {request.path}', method=request.method, path=request.path) as root:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(tracing.sql_wrapper))
+                response = self.get_response(request)
+            match = getattr(request, 'resolver_match', None)
+            if match is not None:
+                root.name = f'{request.method} {match.view_name}'
+                root.attributes['view'] = match.view_name
+            root.attributes['status'] = response.status_code
+        response['X-Trace-Id'] = root.trace.trace_id
+        return response
+
+
+class ViewTracingMiddleware:
+    """Span of the view of traced requests, from the call of the view to the render of its response."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            tracing.end_span(getattr(request, 'view_span', None))
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.view_span = tracing.start_span('view', view=request.resolver_match.view_name)
+
+    def process_template_response(self, request, response):
+        tracing.end_span(getattr(request, 'view_span', None))
+        render = response.render
+
+        def traced_render():
+            with tracing.span('render', 'render'):
+                return render()
+
+        response.render = traced_render
+        return response
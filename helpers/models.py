@@ -1,6 +1,39 @@
 import django.db.models
 import django.db.models.options
+from django.db import transaction
 from django.urls import reverse
+from django.utils import timezone
+
+
+class AtomicSaveMixin:
+    """Run save() and delete() together with their signal receivers in one transaction."""
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
+
+class UpdatedAtModel(django.db.models.Model):
+    """Model stamped with the time of its last change, used to answer conditional GET requests."""
+    updated_at = django.db.models.DateTimeField(verbose_name="Изменено", default=timezone.now, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        self.updated_at = timezone.now()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'updated_at'}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def touch(cls, pks):
+        """Stamp rows changed without save(), like the ones written by bulk_update()."""
+        cls._default_manager.filter(pk__in=pks).update(updated_at=timezone.now())
 
 
 class BrowseableObjectModel(django.db.models.Model):
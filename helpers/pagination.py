@@ -0,0 +1,90 @@
+import functools
+import operator
+
+import django.core.exceptions
+import django.http
+from django.db.models import Q
+
+
+class KeysetPage:
+    """Page of a queryset ordered by unique keys, such as ``['-date', '-pk']``.
+
+    The page is found by seeking past the keys of the row in a cursor instead of an OFFSET,
+    so its cost does not depend on how far into the queryset it is. Cursors come from
+    ``next_cursor`` and ``previous_cursor`` of other pages.
+    """
+
+    def __init__(self, queryset, ordering, per_page, after=None, before=None):
+        self.ordering = [(key.lstrip('-'), key.startswith('-')) for key in ordering]
+        self.per_page = per_page
+        self.model = queryset.model
+        backwards = before is not None
+        cursor = before if backwards else after
+        queryset = queryset.order_by(*[('-' if descending != backwards else '') + name
+                                       for name, descending in self.ordering])
+        if cursor is not None:
+            queryset = queryset.filter(self._seek(self.decode(cursor), backwards))
+        rows = list(queryset[:per_page + 1])
+        more = len(rows) > per_page
+        rows = rows[:per_page]
+        if backwards:
+            rows.reverse()
+        self.object_list = rows
+        self._has_next = more if not backwards else True
+        self._has_previous = more if backwards else cursor is not None
+
+    def _field(self, name):
+        return self.model._meta.pk if name == 'pk' else self.model._meta.get_field(name)
+
+    def _seek(self, values, backwards):
+        conditions = []
+        for index, (name, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending != backwards else 'gt'
+            equal = {previous: values[position] for position, (previous, _) in enumerate(self.ordering[:index])}
+            conditions.append(Q(**equal, **{f'{name}__{lookup}': values[index]}))
+        return functools.reduce(operator.or_, conditions)
+
+    def encode(self, obj):
+        return ','.join(self._field(name).value_to_string(obj) for name, _ in self.ordering)
+
+    def decode(self, cursor):
+        parts = cursor.split(',')
+        if len(parts) != len(self.ordering):
+            raise django.http.Http404("Invalid cursor")
+        try:
+            return [self._field(name).to_python(part) for (name, _), part in zip(self.ordering, parts)]
+        except (django.core.exceptions.ValidationError, ValueError):
+            raise django.http.Http404("Invalid cursor")
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next and bool(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous and bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def next_cursor(self):
+        return self.encode(self.object_list[-1]) if self.has_next() else None
+
+    @property
+    def previous_cursor(self):
+        return self.encode(self.object_list[0]) if self.has_previous() else None
+
+
+class KeysetPaginationMixin:
+    """ListView pagination with KeysetPage, driven by ``after`` and ``before`` GET parameters."""
+    keyset_ordering = ['-pk']
+
+    def paginate_queryset(self, queryset, page_size):
+        page = KeysetPage(queryset, self.keyset_ordering, page_size,
+                          after=self.request.GET.get('after'), before=self.request.GET.get('before'))
+        return None, page, page.object_list, page.has_other_pages()
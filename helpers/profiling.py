@@ -0,0 +1,159 @@
+"""Opt-in profiling of requests.
+
+A request is profiled when it carries a token of a staff user from make_token() in the ``profile`` parameter
+or the ``X-Profile`` header, or by chance with ``settings.PROFILE_SAMPLE_RATE``. It runs either under cProfile,
+saved as a ``.prof`` file for pstats or snakeviz, or under a stack sampler, saved as collapsed stacks
+(``.folded``) for flamegraph tools. Profiles are kept in ``settings.PROFILE_DIR``, in a directory per view.
+"""
+import cProfile
+import datetime
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+
+SALT = 'helpers.profiling'
+# committed to the repository, anyone could sign tokens with it
+DEFAULT_SECRET_KEY = 'top-secret-key'
+MODES = {'cprofile': '.prof', 'sample': '.folded'}
+NAME_PATTERN = re.compile(r'^[0-9]{8}T[0-9]{12}-[0-9]+ms-[A-Z]+\.(prof|folded)$')
+
+Profile = namedtuple('Profile', 'view name created duration_ms method size')
+
+
+def tokens_enabled():
+    """Tokens are neither made nor accepted while ``settings.SECRET_KEY`` is the default one."""
+    return settings.SECRET_KEY != DEFAULT_SECRET_KEY
+
+
+def make_token(user):
+    """Token allowing ``user`` to profile requests for ``settings.PROFILE_TOKEN_MAX_AGE`` seconds, None when
+    tokens are disabled.
+    """
+    if not tokens_enabled():
+        return None
+    return signing.TimestampSigner(salt=SALT).sign(str(user.pk))
+
+
+def check_token(token):
+    """Whether ``token`` is valid and its user is still active staff."""
+    if not tokens_enabled():
+        return False
+    try:
+        user_id = signing.TimestampSigner(salt=SALT).unsign(
+            token, max_age=getattr(settings, 'PROFILE_TOKEN_MAX_AGE', 3600))
+    except signing.BadSignature:
+        return False
+    return get_user_model().objects.filter(pk=user_id, is_active=True, is_staff=True).exists()
+
+
+def profile_dir():
+    return settings.PROFILE_DIR
+
+
+class StackSampler:
+    """Sample the stack of the current thread from another thread every ``interval`` seconds."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.thread_id = None
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def enable(self):
+        self.thread_id = threading.get_ident()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def disable(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump_stats(self, path):
+        with open(path, 'w') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f'{stack} {count}\n')
+
+
+def make_profiler(mode):
+    if mode == 'sample':
+        return StackSampler(getattr(settings, 'PROFILE_SAMPLE_INTERVAL', 0.005))
+    return cProfile.Profile()
+
+
+def view_dir_name(view_name):
+    """Directory of the profiles of a view, 'orders.order' for 'orders:order'."""
+    return re.sub(r'[^\w.-]', '_', (view_name or 'unresolved').replace(':', '.')).lstrip('.')
+
+
+def save(profiler, mode, view_name, method, duration_ms):
+    """Write a profile to the directory of its view, keeping the newest ``settings.PROFILE_KEEP`` ones there."""
+    directory = os.path.join(profile_dir(), view_dir_name(view_name))
+    os.makedirs(directory, exist_ok=True)
+    created = datetime.datetime.now()
+    name = f'{created:%Y%m%dT%H%M%S%f}-{round(duration_ms)}ms-{method}{MODES[mode]}'
+    profiler.dump_stats(os.path.join(directory, name))
+    names = sorted(filter(NAME_PATTERN.match, os.listdir(directory)), reverse=True)
+    for old in names[getattr(settings, 'PROFILE_KEEP', 20):]:
+        os.remove(os.path.join(directory, old))
+    return name
+
+
+def parse_name(view, name, size=None):
+    created, duration, rest = name.split('-', 2)
+    return Profile(view, name, datetime.datetime.strptime(created, '%Y%m%dT%H%M%S%f'), int(duration[:-2]),
+                   rest.split('.')[0], size)
+
+
+def recent_profiles():
+    """``{view directory: [Profile, ...]}`` newest first."""
+    root = profile_dir()
+    profiles = {}
+    if not os.path.isdir(root):
+        return profiles
+    for view in sorted(os.listdir(root)):
+        directory = os.path.join(root, view)
+        if not os.path.isdir(directory):
+            continue
+        names = sorted(filter(NAME_PATTERN.match, os.listdir(directory)), reverse=True)
+        if names:
+            profiles[view] = [parse_name(view, name, os.path.getsize(os.path.join(directory, name)))
+                              for name in names]
+    return profiles
+
+
+def profile_path(view, name):
+    """Path of a stored profile, None for names that are not ones of profiles."""
+    if not NAME_PATTERN.match(name) or not view or view != view_dir_name(view):
+        return None
+    path = os.path.join(profile_dir(), view, name)
+    return path if os.path.isfile(path) else None
+
+
+def summary(path, limit=50):
+    """Text summary of a profile: pstats sorted by cumulative time, or the most sampled stacks."""
+    if path.endswith('.prof'):
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+    with open(path) as file:
+        return ''.join(file.readlines()[:limit])
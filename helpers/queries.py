@@ -0,0 +1,129 @@
+"""Detection of repeated queries of the same shape, the N+1 pattern, within one request.
+
+Statements are grouped by a fingerprint of their SQL with values and IN lists normalized. The first
+statement of every group records the Python frames of the project and the template line that ran it,
+and groups run at least ``threshold`` times are reported with a guess of the relation to prefetch.
+"""
+import os
+import re
+import sys
+
+from django.apps import apps
+from django.conf import settings
+
+FINGERPRINT_RULES = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\bIN \((?:\?, )*\?\)', re.IGNORECASE), 'IN (...)'),
+    (re.compile(r'\s+'), ' '),
+]
+TABLE_WHERE = re.compile(
+    r'\bFROM "(?P<table>\w+)".*?\bWHERE \(?"(?P=table)"\."(?P<column>\w+)" (?:= \?|IN \(\.\.\.\))')
+
+
+def fingerprint(sql):
+    for pattern, replacement in FINGERPRINT_RULES:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+IGNORED_FILES = [__file__, os.path.join(os.path.dirname(__file__), 'middleware.py')]
+
+
+def project_frames(frame, limit=5):
+    """``file:line in function`` of the innermost frames of project code, outside site-packages and instrumentation."""
+    root = str(settings.BASE_DIR)
+    frames = []
+    while frame is not None and len(frames) < limit:
+        filename = frame.f_code.co_filename
+        if filename.startswith(root) and 'site-packages' not in filename and filename not in IGNORED_FILES:
+            frames.append(f'{os.path.relpath(filename, root)}:{frame.f_lineno} in {frame.f_code.co_name}')
+        frame = frame.f_back
+    return frames
+
+
+def template_line(frame):
+    """``template name:line`` of the innermost template node being rendered, None outside templates."""
+    while frame is not None:
+        if frame.f_code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            origin = getattr(node, 'origin', None)
+            token = getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                return f'{origin.template_name or origin.name}:{token.lineno}'
+        frame = frame.f_back
+    return None
+
+
+def suggestion(sql):
+    """Relation to prefetch or select for repeated SQL, guessed from the table and the column it filters on."""
+    match = TABLE_WHERE.search(sql)
+    if match is None:
+        return None
+    models = {model._meta.db_table: model for model in apps.get_models()}
+    model = models.get(match['table'])
+    if model is None:
+        return None
+    column = match['column']
+    if column == model._meta.pk.column:
+        return f"select_related() the foreign key to {model._meta.label}"
+    for field in model._meta.concrete_fields:
+        if field.column == column and field.is_relation:
+            related = field.remote_field.model
+            accessor = field.remote_field.get_accessor_name()
+            if field.remote_field.is_hidden():
+                return f"{model._meta.label} rows are loaded per {related._meta.label}: load them in one query"
+            return f"prefetch_related('{accessor}') on {related._meta.label}"
+    return None
+
+
+class QueryGroup:
+    def __init__(self, fingerprint, sql, frames, template):
+        self.fingerprint = fingerprint
+        self.sql = sql
+        self.frames = frames
+        self.template = template
+        self.count = 0
+
+    def as_dict(self):
+        return {'count': self.count, 'fingerprint': self.fingerprint, 'sql': self.sql, 'frames': self.frames,
+                'template': self.template, 'suggestion': suggestion(self.fingerprint)}
+
+
+class RepeatedQueries:
+    """Database execute wrapper grouping statements by fingerprint."""
+
+    def __init__(self, threshold=3):
+        self.threshold = threshold
+        self.groups = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        key = fingerprint(sql)
+        group = self.groups.get(key)
+        if group is None:
+            frame = sys._getframe(1)
+            group = self.groups[key] = QueryGroup(key, sql, project_frames(frame), template_line(frame))
+        group.count += 1
+        return execute(sql, params, many, context)
+
+    def repeated(self):
+        """Groups run at least ``threshold`` times, most frequent first."""
+        return sorted((group for group in self.groups.values() if group.count >= self.threshold),
+                      key=lambda group: -group.count)
+
+    def report(self):
+        return [group.as_dict() for group in self.repeated()]
+
+
+def format_report(report):
+    """Text lines of RepeatedQueries.report()."""
+    lines = []
+    for group in report:
+        lines.append(f"{group['count']} x {group['fingerprint']}")
+        if group['template']:
+            lines.append(f"    template {group['template']}")
+        lines.extend(f"    {frame}" for frame in group['frames'])
+        if group['suggestion']:
+            lines.append(f"    suggestion: {group['suggestion']}")
+    return lines
@@ -0,0 +1,176 @@
+"""Log of slow and repeated queries with their query plans.
+
+Queries of a request slower than ``settings.SLOW_QUERY_MS``, and statements run more than
+``settings.SLOW_QUERY_REPEAT`` times in a request, are logged with the normalized SQL, the view and the plan
+of the database: ``EXPLAIN QUERY PLAN`` on SQLite, ``EXPLAIN`` on PostgreSQL. Plans are taken once the
+request has been handled, on the backend cursor, so they do not count as queries of the request.
+A query of a view is logged, and explained, once per ``settings.SLOW_QUERY_LOG_INTERVAL`` seconds by each
+process, the next entry counting the requests left out meanwhile. Entries are appended to
+``settings.SLOW_QUERY_LOG`` as JSON lines, summarized by the slow_queries command; the log is moved to a
+``.1`` backup once it grows over ``settings.SLOW_QUERY_LOG_MAX_BYTES``.
+"""
+import datetime
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+from helpers.queries import fingerprint
+
+EXPLAIN = {'sqlite': 'EXPLAIN QUERY PLAN ', 'postgresql': 'EXPLAIN '}
+EXPLAINABLE = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+# scans of whole tables, not of an index of them, and sorts of rows not read in order from an index
+COSTLY_STEP = re.compile(r'^SCAN (?:TABLE )?\w+(?: AS \w+)?$|^USE TEMP B-TREE|\bSeq Scan on\b|\bSort\b')
+
+# when every (fingerprint, view) was last logged by this process, and the requests left out since
+logged_lock = threading.Lock()
+last_logged = {}
+left_out = defaultdict(int)
+
+
+class Statement:
+    def __init__(self, alias, sql, params, many):
+        self.alias = alias
+        self.sql = sql
+        self.params = params
+        self.many = many
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.slow = 0
+
+
+class SlowQueries:
+    """Database execute wrapper timing statements of a request, grouped by their SQL."""
+
+    def __init__(self, alias, slow_ms, statements):
+        self.alias = alias
+        self.slow_ms = slow_ms
+        self.statements = statements
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - start) * 1000
+            statement = self.statements.get((self.alias, sql))
+            if statement is None:
+                statement = self.statements[self.alias, sql] = Statement(self.alias, sql, params, many)
+            statement.count += 1
+            statement.total_ms += duration
+            if duration > statement.max_ms:
+                statement.max_ms = duration
+                if not many:
+                    # explain the slowest run
+                    statement.params = params
+            if duration > self.slow_ms:
+                statement.slow += 1
+
+
+def explain(alias, sql, params):
+    """Lines of the plan of a query, None for statements that are not explained."""
+    connection = connections[alias]
+    prefix = EXPLAIN.get(connection.vendor)
+    if prefix is None or not EXPLAINABLE.match(sql):
+        return None
+    try:
+        with connection.cursor() as cursor:
+            # the backend cursor, bypassing execute wrappers
+            cursor.cursor.execute(prefix + sql, params)
+            rows = cursor.cursor.fetchall()
+    except DatabaseError as e:
+        return [f"EXPLAIN failed: {e}"]
+    if connection.vendor == 'sqlite':
+        # (id, parent, notused, detail)
+        return [row[-1] for row in rows]
+    return [row[0] for row in rows]
+
+
+def costly_steps(plan):
+    """Lines of a plan reading whole tables or sorting rows."""
+    return [line for line in plan or [] if COSTLY_STEP.search(line.strip())]
+
+
+def due(key):
+    """Number of requests left out since ``key`` was last logged, None if it was logged too recently."""
+    now = time.monotonic()
+    with logged_lock:
+        last = last_logged.get(key)
+        if last is not None and now - last < getattr(settings, 'SLOW_QUERY_LOG_INTERVAL', 60):
+            left_out[key] += 1
+            return None
+        last_logged[key] = now
+        return left_out.pop(key, 0)
+
+
+def entries(statements, request, view_name):
+    """Log entries of the slow and repeated statements of a request that are due to be logged."""
+    slow_ms = getattr(settings, 'SLOW_QUERY_MS', 100)
+    repeat = getattr(settings, 'SLOW_QUERY_REPEAT', 10)
+    logged = []
+    for statement in statements.values():
+        reasons = []
+        if statement.slow:
+            reasons.append('slow')
+        if statement.count > repeat:
+            reasons.append('repeated')
+        if not reasons:
+            continue
+        statement_fingerprint = fingerprint(statement.sql)
+        skipped = due((statement.alias, statement_fingerprint, view_name))
+        if skipped is None:
+            continue
+        plan = None if statement.many else explain(statement.alias, statement.sql, statement.params)
+        logged.append({
+            'time': datetime.datetime.now().isoformat(timespec='seconds'),
+            'reasons': reasons,
+            'fingerprint': statement_fingerprint,
+            'sql': statement.sql,
+            'count': statement.count,
+            'slow': statement.slow,
+            'total_ms': round(statement.total_ms, 3),
+            'max_ms': round(statement.max_ms, 3),
+            'threshold_ms': slow_ms,
+            'view': view_name,
+            'method': request.method,
+            'path': request.path,
+            'database': statement.alias,
+            'plan': plan,
+            'left_out': skipped,
+        })
+    return logged
+
+
+def write(logged):
+    path = settings.SLOW_QUERY_LOG
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path) and os.path.getsize(path) > getattr(settings, 'SLOW_QUERY_LOG_MAX_BYTES', 10 << 20):
+        os.replace(path, path + '.1')
+    with open(path, 'a') as file:
+        for entry in logged:
+            file.write(json.dumps(entry) + '\n')
+
+
+def read(path=None):
+    """Entries of the log and of its backup, oldest first."""
+    path = path or settings.SLOW_QUERY_LOG
+    for file_path in [path + '.1', path]:
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path) as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def clear(path=None):
+    path = path or settings.SLOW_QUERY_LOG
+    for file_path in [path + '.1', path]:
+        if os.path.exists(file_path):
+            os.remove(file_path)
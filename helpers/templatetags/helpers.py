@@ -2,6 +2,8 @@ from django import template, get_version
 from django.conf import settings
 from pkg_resources import parse_version
 
+import helpers.cache
+
 register = template.Library()
 
 
@@ -28,6 +30,33 @@ def key(d, key_name):
     return value
 
 
+class TaggedCacheNode(template.Node):
+    def __init__(self, nodelist, name, tags):
+        self.nodelist = nodelist
+        self.name = name
+        self.tags = tags
+
+    def render(self, context):
+        return helpers.cache.get_or_set(f'fragment:{self.name.resolve(context)}',
+                                        [str(tag.resolve(context)) for tag in self.tags],
+                                        lambda: self.nodelist.render(context))
+
+
+@register.tag
+def tagged_cache(parser, token):
+    """
+    Cache the enclosed fragment until one of the tags is invalidated::
+
+        {% tagged_cache "product-list" "catalog" "products.price" %}...{% endtagged_cache %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires a fragment name")
+    nodelist = parser.parse(('endtagged_cache',))
+    parser.delete_first_token()
+    return TaggedCacheNode(nodelist, parser.compile_filter(bits[1]), [parser.compile_filter(bit) for bit in bits[2:]])
+
+
 if parse_version(get_version()) < parse_version("2.1"):
     @register.filter(is_safe=True)
     def json_script(value, element_id):
@@ -0,0 +1,65 @@
+from django.core.cache import cache
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+
+import helpers.cache
+from helpers.checks import check_tagged_cache
+
+
+@override_settings(TAGGED_CACHE_TIMEOUT=60)
+class TaggedCacheTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_get_set(self):
+        self.assertIsNone(helpers.cache.get('name', ['a', 'b']))
+        helpers.cache.set('name', ['a', 'b'], 'value')
+        self.assertEqual('value', helpers.cache.get('name', ['b', 'a']))
+        self.assertIsNone(helpers.cache.get('other', ['a', 'b']))
+
+    def test_invalidate(self):
+        helpers.cache.set('name', ['a', 'b'], 'value')
+        helpers.cache.set('other', ['c'], 'other value')
+        helpers.cache.invalidate('b')
+        self.assertIsNone(helpers.cache.get('name', ['a', 'b']))
+        self.assertEqual('other value', helpers.cache.get('other', ['c']))
+
+    def test_get_or_set(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return 'value'
+
+        self.assertEqual('value', helpers.cache.get_or_set('name', ['a'], compute))
+        self.assertEqual('value', helpers.cache.get_or_set('name', ['a'], compute))
+        self.assertEqual(1, len(calls))
+        helpers.cache.invalidate('a')
+        helpers.cache.get_or_set('name', ['a'], compute)
+        self.assertEqual(2, len(calls))
+
+    @override_settings(TAGGED_CACHE_TIMEOUT=0)
+    def test_disabled(self):
+        helpers.cache.set('name', ['a'], 'value')
+        self.assertIsNone(helpers.cache.get('name', ['a']))
+
+    def test_tagged_cache_tag(self):
+        template = Template('{% load helpers %}{% tagged_cache "fragment" "a" tag %}{{ value }}{% endtagged_cache %}')
+        self.assertEqual('1', template.render(Context({'value': 1, 'tag': 'b'})))
+        self.assertEqual('1', template.render(Context({'value': 2, 'tag': 'b'})))
+        self.assertEqual('2', template.render(Context({'value': 2, 'tag': 'c'})))
+        helpers.cache.invalidate('a')
+        self.assertEqual('3', template.render(Context({'value': 3, 'tag': 'b'})))
+
+
+class TaggedCacheCheckTestCase(TestCase):
+    def test_process_local_cache(self):
+        with override_settings(TAGGED_CACHE_TIMEOUT=60):
+            self.assertEqual(['helpers.E001'], [error.id for error in check_tagged_cache(None)])
+        self.assertEqual([], check_tagged_cache(None))
+
+    @override_settings(TAGGED_CACHE_TIMEOUT=60, CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/nonexistent'}})
+    def test_shared_cache(self):
+        self.assertEqual([], check_tagged_cache(None))
@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
+from django.urls import resolve, reverse
+
+from helpers import metrics
+from helpers.middleware import MetricsMiddleware
+
+
+class MetricsTestCase(TestCase):
+    fixtures = ['test_customers']
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings_override = override_settings(METRICS_DIR=self.directory, METRICS_TOKEN=None)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        metrics.clear()
+        self.addCleanup(metrics.clear)
+
+    def samples(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual('text/plain; version=0.0.4; charset=utf-8', response['Content-Type'])
+        return dict(line.rsplit(' ', 1) for line in response.content.decode().splitlines()
+                    if not line.startswith('#'))
+
+    def test_request_metrics(self):
+        for _ in range(2):
+            self.client.get(reverse('customers:index'))
+        self.client.get('/no-such-page/')
+        samples = self.samples()
+        self.assertEqual('2', samples['milkshop_requests_total{method="GET",status="200",view="customers:index"}'])
+        self.assertEqual('1', samples['milkshop_requests_total{method="GET",status="404",view="unresolved"}'])
+        latency = 'milkshop_request_duration_seconds_{}{{method="GET",view="customers:index"}}'
+        self.assertEqual('2', samples[latency.format('count')])
+        self.assertGreater(float(samples[latency.format('sum')]), 0)
+        self.assertEqual('2', samples['milkshop_request_duration_seconds_bucket'
+                                      '{le="+Inf",method="GET",view="customers:index"}'])
+        self.assertEqual('0', samples['milkshop_request_db_queries_bucket{le="0",method="GET",view="customers:index"}'])
+        self.assertGreater(float(samples['milkshop_request_db_queries_sum{method="GET",view="customers:index"}']), 0)
+
+    def test_unknown_method(self):
+        for method in ['FOO123', 'BAR456']:
+            self.client.generic(method, reverse('customers:index'))
+        samples = self.samples()
+        self.assertEqual('2', samples['milkshop_requests_total{method="other",status="405",view="customers:index"}'])
+        self.assertFalse([key for key in samples if 'FOO123' in key or 'BAR456' in key])
+
+    def test_exposition_format(self):
+        self.client.get(reverse('customers:index'))
+        lines = self.client.get(reverse('metrics')).content.decode().splitlines()
+        self.assertIn('# TYPE milkshop_request_duration_seconds histogram', lines)
+        self.assertIn('# TYPE milkshop_requests_total counter', lines)
+        buckets = [line for line in lines if line.startswith('milkshop_request_duration_seconds_bucket')
+                   and 'customers:index' in line]
+        self.assertEqual(len(metrics.LATENCY_BUCKETS) + 1, len(buckets))
+        counts = [float(line.rsplit(' ', 1)[1]) for line in buckets]
+        self.assertEqual(sorted(counts), counts)
+        self.assertIn('le="+Inf"', buckets[-1])
+
+    def test_processes_summed(self):
+        other = metrics.MmapValues(os.path.join(self.directory, '1.db'))
+        self.addCleanup(other.close)
+        other.add('milkshop_requests_total{method="GET",status="200",view="orders:index"}', 3)
+        metrics.inc(metrics.REQUESTS, view='orders:index', method='GET', status=200)
+        self.assertEqual(4, metrics.collect()['milkshop_requests_total{method="GET",status="200",view="orders:index"}'])
+
+    def test_values_file(self):
+        path = os.path.join(self.directory, 'values.db')
+        values = metrics.MmapValues(path)
+        keys = [f'key{{view="{"x" * number}"}}' for number in range(2000)]
+        for number, key in enumerate(keys):
+            values.add(key, number)
+        values.add(keys[1], 0.5)
+        values.close()
+        self.assertGreater(os.path.getsize(path), metrics.MmapValues.initial_size)
+        values = metrics.MmapValues(path)
+        self.addCleanup(values.close)
+        values.add(keys[2], 1)
+        with open(path, 'rb') as file:
+            read = {key: value for key, _, value in metrics.read_entries(file.read())}
+        self.assertEqual(2000, len(read))
+        self.assertEqual([0, 1.5, 3, 3], [read[key] for key in keys[:4]])
+
+    def test_label_escaping(self):
+        self.assertEqual(r'name{a="x\"y\\z\n"}', metrics.sample_key('name', {'a': 'x"y\\z\n'}))
+
+    def test_exception_counted(self):
+        request = self.client.get(reverse('customers:index')).wsgi_request
+        request.resolver_match = resolve(reverse('customers:index'))
+        MetricsMiddleware(None).process_exception(request, ValueError())
+        self.assertEqual('1', self.samples()['milkshop_request_exceptions_total'
+                                             '{exception="ValueError",view="customers:index"}'])
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token(self):
+        self.assertEqual(403, self.client.get(reverse('metrics')).status_code)
+        self.assertEqual(403, self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer other').status_code)
+        self.assertEqual(200, self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret').status_code)
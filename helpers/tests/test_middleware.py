@@ -0,0 +1,49 @@
+import json
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from helpers.middleware import QueryBudgetExceeded, get_budget
+
+
+class QueryBudgetMiddlewareTestCase(TestCase):
+    fixtures = ['test_customers']
+
+    def test_server_timing(self):
+        response = self.client.get(reverse('customers:index'))
+        timing = dict(part.strip().split(';', 1) for part in response['Server-Timing'].split(','))
+        self.assertEqual({'db', 'template', 'view', 'total'}, timing.keys())
+        self.assertRegex(timing['db'], r'^dur=[0-9.]+;desc="[1-9][0-9]* queries"$')
+
+    def test_log(self):
+        with self.assertLogs('helpers.middleware', 'INFO') as logs:
+            self.client.get(reverse('customers:index'))
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual('customers:index', record['view'])
+        self.assertEqual(200, record['status'])
+        self.assertGreater(record['queries'], 0)
+        self.assertGreater(record['template_ms'], 0)
+        self.assertAlmostEqual(record['total_ms'], record['view_ms'] + record['template_ms'], places=2)
+
+    def test_raise_set_in_tests(self):
+        self.assertTrue(settings.REQUEST_BUDGET_RAISE)
+
+    @override_settings(REQUEST_BUDGETS={'GET customers:index': {'queries': 0}}, REQUEST_BUDGET_RAISE=True)
+    def test_over_budget_raises(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, "GET customers:index over budget: queries"):
+            self.client.get(reverse('customers:index'))
+
+    @override_settings(REQUEST_BUDGETS={'*': {'queries': 0}}, REQUEST_BUDGET_RAISE=False)
+    def test_over_budget_warns(self):
+        with self.assertLogs('helpers.middleware', 'WARNING') as logs:
+            response = self.client.get(reverse('customers:index'))
+        self.assertEqual(200, response.status_code)
+        self.assertIn("over budget", logs.output[0])
+
+    @override_settings(REQUEST_BUDGETS={'GET customers:index': {'queries': 1}, 'customers:index': {'queries': 2},
+                                        '*': {'queries': 3}})
+    def test_budget_lookup(self):
+        self.assertEqual({'queries': 1}, get_budget('GET', 'customers:index'))
+        self.assertEqual({'queries': 2}, get_budget('POST', 'customers:index'))
+        self.assertEqual({'queries': 3}, get_budget('GET', 'customers:customer'))
@@ -0,0 +1,183 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core import signing
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from helpers import memory, profiling
+
+
+@override_settings(SECRET_KEY='test-secret-key')
+class ProfilerMiddlewareTestCase(TestCase):
+    fixtures = ['test_customers']
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings_override = override_settings(PROFILE_DIR=self.directory, PROFILE_SAMPLE_RATE=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.staff = User.objects.create_user('staff', is_staff=True)
+
+    def profiles(self):
+        return os.listdir(os.path.join(self.directory, 'customers.index'))
+
+    def test_token_profiles_request(self):
+        response = self.client.get(reverse('customers:index'), {'profile': profiling.make_token(self.staff)})
+        self.assertRegex(response['X-Profile'], r'-GET\.prof$')
+        self.assertEqual([response['X-Profile']], self.profiles())
+        self.assertIn('function calls', profiling.summary(os.path.join(self.directory, 'customers.index',
+                                                                       response['X-Profile'])))
+
+    def test_sample_mode(self):
+        response = self.client.get(reverse('customers:index'), {'profile_mode': 'sample'},
+                                   HTTP_X_PROFILE=profiling.make_token(self.staff))
+        self.assertRegex(response['X-Profile'], r'\.folded$')
+        self.assertEqual([response['X-Profile']], self.profiles())
+
+    def test_bad_token(self):
+        response = self.client.get(reverse('customers:index'), {'profile': 'profile:forged'})
+        self.assertFalse(response.has_header('X-Profile'))
+        self.assertFalse(os.listdir(self.directory))
+
+    def test_token_of_user_no_longer_staff(self):
+        token = profiling.make_token(self.staff)
+        User.objects.filter(pk=self.staff.pk).update(is_staff=False)
+        self.assertFalse(self.client.get(reverse('customers:index'), {'profile': token}).has_header('X-Profile'))
+        self.assertFalse(profiling.check_token(profiling.make_token(User.objects.create_user('user'))))
+
+    def test_default_secret_key(self):
+        token = profiling.make_token(self.staff)
+        with override_settings(SECRET_KEY=profiling.DEFAULT_SECRET_KEY):
+            self.assertIsNone(profiling.make_token(self.staff))
+            self.assertFalse(profiling.check_token(token))
+            self.assertFalse(profiling.check_token(
+                signing.TimestampSigner(salt=profiling.SALT).sign(str(self.staff.pk))))
+
+    @override_settings(PROFILE_SAMPLE_RATE=1)
+    def test_sample_rate(self):
+        response = self.client.get(reverse('customers:index'))
+        self.assertTrue(response.has_header('X-Profile'))
+
+    @override_settings(PROFILE_SAMPLE_RATE=1, PROFILE_KEEP=2)
+    def test_keeps_newest(self):
+        names = [self.client.get(reverse('customers:index'))['X-Profile'] for _ in range(3)]
+        self.assertEqual(sorted(names[1:]), sorted(self.profiles()))
+
+
+@override_settings(SECRET_KEY='test-secret-key')
+class ProfileViewTestCase(TestCase):
+    fixtures = ['test_customers']
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings_override = override_settings(PROFILE_DIR=self.directory, PROFILE_SAMPLE_RATE=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        staff = User.objects.create_user('staff', is_staff=True)
+        self.name = self.client.get(reverse('customers:index'), {'profile': profiling.make_token(staff)})['X-Profile']
+        self.client.force_login(staff)
+
+    def test_list(self):
+        response = self.client.get(reverse('helpers:profiles'))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([self.name], [profile.name for profile in response.context['profiles']['customers.index']])
+        self.assertContains(response, reverse('helpers:profile', args=['customers.index', self.name]))
+
+    def test_detail(self):
+        response = self.client.get(reverse('helpers:profile', args=['customers.index', self.name]))
+        self.assertContains(response, 'cumulative')
+        response = self.client.get(reverse('helpers:profile', args=['customers.index', self.name]), {'download': ''})
+        self.assertEqual(f'attachment; filename="{self.name}"', response['Content-Disposition'])
+
+    def test_unknown(self):
+        for view, name in [('customers.index', 'profile.prof'), ('..', self.name), ('customers.other', self.name)]:
+            response = self.client.get(reverse('helpers:profile', args=[view, name]))
+            self.assertEqual(404, response.status_code)
+
+    def test_staff_only(self):
+        self.client.force_login(User.objects.create_user('customer'))
+        self.assertEqual(403, self.client.get(reverse('helpers:profiles')).status_code)
+        self.client.logout()
+        response = self.client.get(reverse('helpers:profiles'))
+        self.assertRedirects(response, reverse('admin:login') + '?next=' + reverse('helpers:profiles'),
+                             fetch_redirect_response=False)
+
+
+@override_settings(MEMORY_PROFILE_SAMPLE_RATE=0, SECRET_KEY='test-secret-key')
+class MemoryProfilerMiddlewareTestCase(TestCase):
+    fixtures = ['test_customers']
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings_override = override_settings(MEMORY_STATS_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.staff = User.objects.create_user('staff', is_staff=True)
+
+    def test_token_traces_request(self):
+        with self.assertLogs('helpers.middleware', 'INFO') as logs:
+            response = self.client.get(reverse('customers:index'), {'memory': profiling.make_token(self.staff)})
+        self.assertGreater(float(response['X-Memory-Peak']), 0)
+        record = next(record.memory for record in logs.records if hasattr(record, 'memory'))
+        self.assertEqual('customers:index', record['view'])
+        self.assertEqual(float(response['X-Memory-Peak']), record['peak_kb'])
+        self.assertTrue(all(site.keys() == {'site', 'size_kb', 'count'} for site in record['sites']))
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_untraced(self):
+        response = self.client.get(reverse('customers:index'), HTTP_X_MEMORY_PROFILE='profile:forged')
+        self.assertFalse(response.has_header('X-Memory-Peak'))
+        self.assertEqual({}, memory.view_stats())
+
+    @override_settings(MEMORY_PROFILE_SAMPLE_RATE=1, MEMORY_STATS_WINDOW=2)
+    def test_view_stats(self):
+        peaks = [float(self.client.get(reverse('customers:index'))['X-Memory-Peak']) for _ in range(3)]
+        stats = memory.view_stats()['customers:index']
+        self.assertEqual(2, stats['count'])
+        self.assertEqual(peaks[-1], stats['last'])
+        self.assertEqual(max(peaks[1:]), stats['max'])
+        self.assertLessEqual(stats['p50'], stats['p90'])
+
+    @override_settings(MEMORY_STATS_WINDOW=2)
+    def test_view_stats_of_all_processes(self):
+        with open(os.path.join(self.directory, '1.jsonl'), 'w') as file:
+            for number, peak_kb in enumerate([50.0, 10.0]):
+                file.write(json.dumps({'time': number, 'view': 'customers:index', 'peak_kb': peak_kb, 'sites': []}))
+                file.write('\n')
+        memory.record('customers:index', 20.0, [])
+        stats = memory.view_stats()['customers:index']
+        # the oldest peak of the other process is out of the window
+        self.assertEqual((2, 20.0, 20.0), (stats['count'], stats['last'], stats['max']))
+
+    @override_settings(MEMORY_STATS_WINDOW=2)
+    def test_compacted(self):
+        for number in range(25):
+            memory.record('customers:index', float(number), [])
+        with open(memory.stats_path()) as file:
+            self.assertLessEqual(len(file.readlines()), 20)
+        self.assertEqual(24.0, memory.view_stats()['customers:index']['last'])
+
+    def test_sites(self):
+        with memory.AllocationTrace() as trace:
+            kept = [str(number) * 10 for number in range(10000)]
+        self.assertGreater(trace.peak_kb, 100)
+        self.assertEqual(f'helpers/tests/test_profiling.py:{sys._getframe().f_lineno - 2}', trace.sites[0].site)
+        self.assertEqual(10000, len(kept))
+
+    def test_stats_page(self):
+        self.client.force_login(self.staff)
+        self.client.get(reverse('customers:index'), {'memory': profiling.make_token(self.staff)})
+        response = self.client.get(reverse('helpers:memory'))
+        self.assertEqual(['customers:index'], list(response.context['stats']))
+        self.assertContains(response, 'customers:index')
+        self.assertRedirects(self.client.post(reverse('helpers:memory')), reverse('helpers:memory'))
+        self.assertEqual({}, memory.view_stats())
@@ -0,0 +1,58 @@
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, modify_settings, override_settings
+from django.urls import reverse
+
+import orders.models
+from helpers.middleware import RepeatedQueriesFound
+from helpers.queries import RepeatedQueries, fingerprint, suggestion
+
+
+class FingerprintTestCase(TestCase):
+    def test_values_normalized(self):
+        self.assertEqual('SELECT "a" FROM "t" WHERE "t"."b" = ? AND "t"."c" IN (...) AND "t"."d" = ?',
+                         fingerprint('SELECT "a"\n  FROM "t" WHERE "t"."b" = %s AND "t"."c" IN (%s, %s, %s) '
+                                     'AND "t"."d" = \'it\'\'s\''))
+        self.assertEqual(fingerprint('SELECT 1 LIMIT 21'), fingerprint('SELECT 2 LIMIT 1'))
+
+    def test_suggestion(self):
+        self.assertEqual("prefetch_related('product_orders') on orders.CustomerOrder", suggestion(
+            'SELECT "orders_productorder"."id" FROM "orders_productorder" '
+            'WHERE ("orders_productorder"."customerOrder_id" = ? AND "orders_productorder"."product_id" = ?)'))
+        self.assertEqual("select_related() the foreign key to customers.Customer", suggestion(
+            'SELECT "customers_customer"."id" FROM "customers_customer" WHERE "customers_customer"."id" = ?'))
+        self.assertIsNone(suggestion('SELECT COUNT(*) FROM "orders_order"'))
+
+
+class RepeatedQueriesTestCase(TestCase):
+    fixtures = ['test_products', 'test_customers', 'test_orders']
+
+    def test_loop(self):
+        detector = RepeatedQueries()
+        with connection.execute_wrapper(detector):
+            customer_orders = list(orders.models.CustomerOrder.objects.all())
+            for customer_order in customer_orders * 2:
+                list(customer_order.product_orders.all())
+        [group] = detector.report()
+        self.assertEqual(4, group['count'])
+        self.assertIn('helpers/tests/test_queries.py', group['frames'][0])
+        self.assertEqual("prefetch_related('product_orders') on orders.CustomerOrder", group['suggestion'])
+
+    @modify_settings(MIDDLEWARE={'append': 'helpers.middleware.RepeatedQueriesMiddleware'})
+    @override_settings(REPEATED_QUERIES_RAISE=True)
+    def test_middleware(self):
+        self.client.get(reverse('customers:index'))
+        with self.assertRaisesMessage(RepeatedQueriesFound, "template products/product_list.html:"):
+            self.client.get(reverse('products:index'))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('find_repeated_queries', namespaces=['products', 'customers'], as_json=True, stdout=out,
+                     stderr=StringIO())
+        report = json.loads(out.getvalue())
+        self.assertEqual(['products:index'], list(report))
+        self.assertEqual("prefetch_related('prices') on products.Product",
+                         report['products:index']['groups'][0]['suggestion'])
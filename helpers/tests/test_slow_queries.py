@@ -0,0 +1,110 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from helpers import slow_queries
+
+
+class SlowQueryTestCase(TestCase):
+    fixtures = ['test_products', 'test_customers', 'test_orders']
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.log = os.path.join(directory, 'slow.jsonl')
+        settings_override = override_settings(SLOW_QUERY_LOG=self.log, SLOW_QUERY_MS=1000, SLOW_QUERY_REPEAT=10,
+                                              SLOW_QUERY_LOG_INTERVAL=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        slow_queries.last_logged.clear()
+        slow_queries.left_out.clear()
+
+    def entries(self):
+        return list(slow_queries.read())
+
+    def get_customer(self, times=1):
+        with self.assertLogs('helpers.middleware', 'WARNING'):
+            for _ in range(times):
+                self.client.get(reverse('customers:customer', kwargs={'customer_pk': 1}))
+
+    @override_settings(SLOW_QUERY_MS=-1)
+    def test_slow(self):
+        with self.assertLogs('helpers.middleware', 'WARNING') as logs:
+            self.client.get(reverse('customers:customer', kwargs={'customer_pk': 1}))
+        entries = self.entries()
+        self.assertTrue(entries)
+        self.assertTrue(any("slow query in GET /customers/1/" in line for line in logs.output))
+        entry = next(entry for entry in entries if '"customers_customer"' in entry['sql'])
+        self.assertEqual(['slow'], entry['reasons'])
+        self.assertEqual('customers:customer', entry['view'])
+        self.assertIn('?', entry['fingerprint'])
+        self.assertTrue(entry['plan'])
+
+    def test_repeated(self):
+        with self.settings(SLOW_QUERY_REPEAT=1), self.assertLogs('helpers.middleware', 'WARNING'):
+            self.client.get(reverse('products:index'))
+        [entry] = [entry for entry in self.entries() if 'FROM "products_price"' in entry['sql']]
+        self.assertEqual(['repeated'], entry['reasons'])
+        self.assertEqual(4, entry['count'])
+        self.assertEqual('products:index', entry['view'])
+
+    def test_fast_not_logged(self):
+        self.client.get(reverse('customers:customer', kwargs={'customer_pk': 1}))
+        self.assertEqual([], self.entries())
+
+    def test_explain(self):
+        with CaptureQueriesContext(connection) as queries:
+            plan = slow_queries.explain('default', 'SELECT * FROM "products_price" WHERE "price" = %s', [100])
+            self.assertEqual(plan, slow_queries.costly_steps(plan))
+            plan = slow_queries.explain('default', 'SELECT * FROM "customers_customer" WHERE "id" = %s', [1])
+            self.assertEqual([], slow_queries.costly_steps(plan))
+        self.assertEqual(0, len(queries))
+        self.assertIsNone(slow_queries.explain('default', 'DELETE FROM "customers_customer"', []))
+        self.assertEqual(['Seq Scan on products_price  (cost=0.00..1.04 rows=1 width=4)'],
+                         slow_queries.costly_steps(['Seq Scan on products_price  (cost=0.00..1.04 rows=1 width=4)',
+                                                  'Index Scan using products_price_pkey on products_price']))
+
+    @override_settings(SLOW_QUERY_MS=-1)
+    def test_command(self):
+        self.get_customer(2)
+        out = StringIO()
+        call_command('slow_queries', sort='count', limit=3, clear=True, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertRegex(lines[0], r'^[0-9.]+ ms in \d+ runs over 2 requests, slowest [0-9.]+ ms')
+        self.assertIn('views: customers:customer', lines[2])
+        self.assertEqual('3 queries', lines[-1])
+        self.assertEqual([], self.entries())
+
+    @override_settings(SLOW_QUERY_MS=-1, SLOW_QUERY_LOG_INTERVAL=60)
+    def test_logged_once_per_interval(self):
+        self.get_customer(3)
+        entries = self.entries()
+        self.assertEqual(len(entries), len({entry['fingerprint'] for entry in entries}))
+        # the interval is over
+        for key in slow_queries.last_logged:
+            slow_queries.last_logged[key] -= 60
+        self.get_customer()
+        later = self.entries()[len(entries):]
+        self.assertEqual(len(entries), len(later))
+        self.assertEqual({2}, {entry['left_out'] for entry in later})
+        out = StringIO()
+        call_command('slow_queries', limit=1, stdout=out)
+        self.assertIn('over 4 requests', out.getvalue())
+
+    @override_settings(SLOW_QUERY_MS=-1, SLOW_QUERY_LOG_MAX_BYTES=1)
+    def test_rotated(self):
+        self.get_customer()
+        first = self.entries()
+        self.get_customer(2)
+        self.assertTrue(os.path.exists(self.log + '.1'))
+        # the backup and the log, the oldest entries are dropped with the previous backup
+        self.assertEqual(2 * len(first), len(self.entries()))
+        slow_queries.clear()
+        self.assertFalse(os.path.exists(self.log + '.1'))
@@ -0,0 +1,100 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from helpers import profiling, tracing
+from helpers.management.commands.traces import breakdown
+
+
+@override_settings(SECRET_KEY='test-secret-key')
+class TracingTestCase(TestCase):
+    fixtures = ['test_products', 'test_customers', 'test_orders']
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings_override = override_settings(TRACE_DIR=self.directory, TRACE_SAMPLE_RATE=0, TRACE_FORMAT='jsonl')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command('rebuild_totals', stdout=StringIO())
+        self.token = profiling.make_token(User.objects.create_user('staff', is_staff=True))
+
+    def traced_get(self, url):
+        return self.client.get(url, HTTP_X_TRACE=self.token)
+
+    def test_spans(self):
+        response = self.traced_get(reverse('orders:order', kwargs={'order_pk': 1}))
+        [trace] = tracing.read_traces()
+        self.assertEqual(response['X-Trace-Id'], trace['trace_id'])
+        self.assertEqual('GET orders:order', trace['name'])
+        self.assertEqual(200, trace['attributes']['status'])
+        spans = {span['span_id']: span for span in trace['spans']}
+        names = [span['name'] for span in trace['spans']]
+        self.assertIn('view', names)
+        self.assertIn('OrderView.get_context_data', names)
+        self.assertIn('OrderMatrix', names)
+        self.assertIn('render', names)
+        self.assertIn('template orders/order_detail.html', names)
+        root = trace['spans'][0]
+        self.assertIsNone(root['parent_id'])
+        for span in trace['spans'][1:]:
+            parent = spans[span['parent_id']]
+            self.assertLessEqual(parent['start_ms'], span['start_ms'])
+            self.assertLessEqual(span['start_ms'] + span['duration_ms'],
+                                 parent['start_ms'] + parent['duration_ms'] + 0.01)
+        matrix = next(span for span in trace['spans'] if span['name'] == 'OrderMatrix')
+        self.assertEqual('OrderView.get_context_data', spans[matrix['parent_id']]['name'])
+        self.assertTrue(any(span['kind'] == 'sql' and span['parent_id'] == matrix['span_id']
+                            for span in trace['spans']))
+
+    def test_untraced(self):
+        response = self.client.get(reverse('orders:order', kwargs={'order_pk': 1}), {'trace': 'profile:forged'})
+        self.assertFalse(response.has_header('X-Trace-Id'))
+        self.assertEqual([], list(tracing.read_traces()))
+        with tracing.span('outside') as span:
+            self.assertIsNone(span)
+
+    @override_settings(TRACE_FORMAT='otlp')
+    def test_otlp(self):
+        response = self.traced_get(reverse('customers:customer', kwargs={'customer_pk': 1}))
+        [path] = os.listdir(self.directory)
+        with open(os.path.join(self.directory, path)) as file:
+            record = json.loads(file.readline())
+        spans = record['resourceSpans'][0]['scopeSpans'][0]['spans']
+        self.assertEqual({response['X-Trace-Id']}, {span['traceId'] for span in spans})
+        self.assertEqual(2, spans[0]['kind'])
+        self.assertEqual('', spans[0]['parentSpanId'])
+        self.assertTrue(all(int(span['endTimeUnixNano']) >= int(span['startTimeUnixNano']) for span in spans))
+        [trace] = tracing.read_traces()
+        self.assertEqual('GET customers:customer', trace['name'])
+        self.assertIn('CustomerDetailView.get_context_data', [span['name'] for span in trace['spans']])
+        self.assertEqual(len(spans), len(trace['spans']))
+
+    def test_waterfall(self):
+        slow = self.traced_get(reverse('orders:order', kwargs={'order_pk': 1}))['X-Trace-Id']
+        self.traced_get(reverse('customers:index'))
+        out = StringIO()
+        call_command('traces', slowest=5, view='orders:', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith(f'{slow} GET orders:order 200'))
+        self.assertRegex(lines[1], r'^  \d+ queries [0-9.]+ ms \(\d+%\), templates [0-9.]+ ms \(\d+%\) of which')
+        self.assertTrue(lines[2].lstrip().startswith('GET orders:order'))
+        self.assertTrue(any(line.lstrip().startswith('sql SELECT') for line in lines))
+        self.assertNotIn('customers:index', out.getvalue())
+
+    def test_breakdown(self):
+        spans = [
+            {'span_id': 'r', 'parent_id': None, 'kind': 'request', 'duration_ms': 10},
+            {'span_id': 'q1', 'parent_id': 'r', 'kind': 'sql', 'duration_ms': 2},
+            {'span_id': 't', 'parent_id': 'r', 'kind': 'template', 'duration_ms': 5},
+            {'span_id': 'i', 'parent_id': 't', 'kind': 'template', 'duration_ms': 3},
+            {'span_id': 'q2', 'parent_id': 'i', 'kind': 'sql', 'duration_ms': 1},
+        ]
+        self.assertEqual({'queries': 2, 'sql_ms': 3, 'template_ms': 5, 'template_sql_ms': 1}, breakdown(spans))
@@ -0,0 +1,241 @@
+"""Nested timing spans of requests, exported to JSON lines files.
+
+A trace is started for a request by TracingMiddleware, and spans are opened with ``span()`` or ``traced()``
+while it is active; outside of a trace both cost a context variable lookup. Queries and template renders,
+includes too, get spans of their own. Finished traces are appended to a file per process and day in
+``settings.TRACE_DIR``, a line per trace, in the format of this module or, with ``settings.TRACE_FORMAT``
+``'otlp'``, as OTLP/JSON export requests, the format of the OpenTelemetry collector file exporter.
+"""
+import contextvars
+import datetime
+import functools
+import glob
+import json
+import os
+import secrets
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.template import base as template_base
+
+current_trace = contextvars.ContextVar('current_trace', default=None)
+current_span = contextvars.ContextVar('current_span', default=None)
+
+SPAN_KINDS = {'request': 2, 'sql': 3}  # OTLP SPAN_KIND_SERVER, SPAN_KIND_CLIENT, SPAN_KIND_INTERNAL otherwise
+
+
+class Span:
+    def __init__(self, trace, name, kind, parent, attributes):
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.end = None
+
+    @property
+    def duration_ms(self):
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+    def as_dict(self):
+        return {'span_id': self.span_id, 'parent_id': self.parent_id, 'name': self.name, 'kind': self.kind,
+                'start_ms': round((self.start - self.trace.start) * 1000, 3), 'duration_ms': round(self.duration_ms, 3),
+                'attributes': self.attributes}
+
+
+class Trace:
+    def __init__(self):
+        self.trace_id = secrets.token_hex(16)
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.spans = []
+
+    def as_dict(self):
+        root = self.spans[0]
+        return {'trace_id': self.trace_id, 'name': root.name, 'started': self.started,
+                'duration_ms': round(root.duration_ms, 3), 'attributes': root.attributes,
+                'spans': [span.as_dict() for span in self.spans]}
+
+
+def start_span(name, kind='internal', **attributes):
+    """Open a span in the current trace, child of the current span; None outside of a trace.
+
+    The span is current until it is passed to ``end_span()``.
+    """
+    trace = current_trace.get()
+    if trace is None:
+        return None
+    span = Span(trace, name, kind, current_span.get(), attributes)
+    trace.spans.append(span)
+    span.token = current_span.set(span)
+    return span
+
+
+def end_span(span):
+    if span is not None and span.end is None:
+        span.end = time.perf_counter()
+        current_span.reset(span.token)
+
+
+@contextmanager
+def span(name, kind='internal', **attributes):
+    opened = start_span(name, kind, **attributes)
+    try:
+        yield opened
+    finally:
+        end_span(opened)
+
+
+def traced(name=None):
+    """Decorator running a function in a span, named after its qualified name by default."""
+
+    def decorator(function):
+        span_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if current_trace.get() is None:
+                return function(*args, **kwargs)
+            with span(span_name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def trace(name, **attributes):
+    """Collect the spans of a block under a root span, and export them when it ends."""
+    collected = Trace()
+    trace_token = current_trace.set(collected)
+    try:
+        with span(name, 'request', **attributes) as root:
+            yield root
+    finally:
+        current_trace.reset(trace_token)
+        export(collected)
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    """Database execute wrapper running every query in a span."""
+    if current_trace.get() is None:
+        return execute(sql, params, many, context)
+    with span('sql', 'sql', statement=sql[:500], many=many):
+        return execute(sql, params, many, context)
+
+
+def instrument_templates():
+    """Run renders of templates, included ones too, in spans. Extended templates render as part of the child."""
+    render = template_base.Template.render
+    if getattr(render, 'traced', False):
+        return
+
+    @functools.wraps(render)
+    def traced_render(self, context):
+        if current_trace.get() is None:
+            return render(self, context)
+        with span(f'template {self.origin.template_name or self.origin.name}', 'template'):
+            return render(self, context)
+
+    traced_render.traced = True
+    template_base.Template.render = traced_render
+
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def otlp_attributes(attributes):
+    return [{'key': key, 'value': otlp_value(value)} for key, value in attributes.items()]
+
+
+def as_otlp(collected):
+    """OTLP/JSON ExportTraceServiceRequest of a trace."""
+    started_ns = int(collected.started * 1e9)
+    spans = []
+    for item in collected.spans:
+        start_ns = started_ns + int((item.start - collected.start) * 1e9)
+        spans.append({
+            'traceId': collected.trace_id,
+            'spanId': item.span_id,
+            'parentSpanId': item.parent_id or '',
+            'name': item.name,
+            'kind': SPAN_KINDS.get(item.kind, 1),
+            'startTimeUnixNano': str(start_ns),
+            'endTimeUnixNano': str(start_ns + int(item.duration_ms * 1e6)),
+            'attributes': otlp_attributes({'milkshop.kind': item.kind, **item.attributes}),
+        })
+    return {'resourceSpans': [{
+        'resource': {'attributes': otlp_attributes({'service.name': 'milkshop'})},
+        'scopeSpans': [{'scope': {'name': __name__}, 'spans': spans}],
+    }]}
+
+
+def trace_path():
+    return os.path.join(settings.TRACE_DIR, f'{datetime.date.today():%Y%m%d}-{os.getpid()}.jsonl')
+
+
+def export(collected):
+    if not collected.spans:
+        return
+    record = as_otlp(collected) if getattr(settings, 'TRACE_FORMAT', 'jsonl') == 'otlp' else collected.as_dict()
+    os.makedirs(settings.TRACE_DIR, exist_ok=True)
+    path = trace_path()
+    if not os.path.exists(path):
+        prune(getattr(settings, 'TRACE_KEEP_FILES', 50) - 1)
+    with open(path, 'a') as file:
+        file.write(json.dumps(record) + '\n')
+
+
+def from_otlp(record):
+    """Traces of an OTLP/JSON export request, in the format of ``Trace.as_dict()``."""
+    spans = [span for resource in record['resourceSpans'] for scope in resource['scopeSpans']
+             for span in scope['spans']]
+    traces = {}
+    for item in spans:
+        traces.setdefault(item['traceId'], []).append(item)
+    for trace_id, items in traces.items():
+        started_ns = min(int(item['startTimeUnixNano']) for item in items)
+        converted = []
+        for item in items:
+            attributes = {attribute['key']: next(iter(attribute['value'].values()))
+                          for attribute in item.get('attributes', [])}
+            start_ns, end_ns = int(item['startTimeUnixNano']), int(item['endTimeUnixNano'])
+            converted.append({'span_id': item['spanId'], 'parent_id': item.get('parentSpanId') or None,
+                              'name': item['name'], 'kind': attributes.pop('milkshop.kind', 'internal'),
+                              'start_ms': (start_ns - started_ns) / 1e6, 'duration_ms': (end_ns - start_ns) / 1e6,
+                              'attributes': attributes})
+        root = next(item for item in converted if item['parent_id'] is None)
+        yield {'trace_id': trace_id, 'name': root['name'], 'started': started_ns / 1e9,
+               'duration_ms': root['duration_ms'], 'attributes': root['attributes'], 'spans': converted}
+
+
+def read_traces(directory=None):
+    """Every trace of the files of a directory, ``settings.TRACE_DIR`` by default, whatever their format."""
+    for path in sorted(glob.glob(os.path.join(directory or settings.TRACE_DIR, '*.jsonl'))):
+        with open(path) as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if 'resourceSpans' in record:
+                    yield from from_otlp(record)
+                else:
+                    yield record
+
+
+def prune(keep):
+    """Remove all but the newest ``keep`` trace files."""
+    paths = sorted(glob.glob(os.path.join(settings.TRACE_DIR, '*.jsonl')), key=os.path.getmtime, reverse=True)
+    for path in paths[keep:]:
+        os.remove(path)
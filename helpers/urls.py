@@ -0,0 +1,11 @@
+from django.urls import path
+
+import helpers.views
+
+app_name = 'helpers'
+
+urlpatterns = [
+    path('profiles/', helpers.views.ProfileListView.as_view(), name='profiles'),
+    path('profiles/<str:view>/<str:name>', helpers.views.ProfileView.as_view(), name='profile'),
+    path('memory/', helpers.views.MemoryStatsView.as_view(), name='memory'),
+]
@@ -1,6 +1,213 @@
+import json
+
 import django.core.exceptions
 import django.forms
+import django.http
 import django.views.generic
+from django.conf import settings
+from django.contrib.auth.mixins import UserPassesTestMixin
+from django.middleware.csrf import CsrfViewMiddleware
+from django.urls import reverse_lazy
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import method_decorator
+from django.utils.functional import cached_property
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
+
+import helpers.cache
+from helpers import memory, metrics, profiling
+
+
+class ConditionalGetMixin:
+    """Answer GET requests with 304 Not Modified before building the page, when its stamp has not changed."""
+
+    def get_stamp(self):
+        """``(etag, last_modified)`` of the page, either can be None."""
+        return None, None
+
+    def get_stamp_tags(self):
+        """Tags to keep the stamp in the tagged cache under, it is computed on every request without them."""
+        return None
+
+    @cached_property
+    def stamp(self):
+        tags = self.get_stamp_tags()
+        if tags is None:
+            return self.get_stamp()
+        return helpers.cache.get_or_set(f'stamp:{self.request.get_full_path()}', tags, self.get_stamp)
+
+    def get(self, request, *args, **kwargs):
+        view = condition(etag_func=lambda *args, **kwargs: self.stamp[0],
+                         last_modified_func=lambda *args, **kwargs: self.stamp[1])(super().get)
+        return view(request, *args, **kwargs)
+
+
+class TaggedCacheMixin:
+    """Serve rendered GET responses from the tagged cache until one of their tags is invalidated."""
+    cache_tags = ()
+
+    def get_cache_tags(self):
+        return list(self.cache_tags)
+
+    def get(self, request, *args, **kwargs):
+        name = f'view:{request.get_full_path()}'
+        tags = self.get_cache_tags()
+        cached = helpers.cache.get(name, tags)
+        if cached is not None:
+            content, content_type = cached
+            return django.http.HttpResponse(content, content_type=content_type)
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            response.add_post_render_callback(
+                lambda rendered: helpers.cache.set(name, tags, (rendered.content, rendered['Content-Type'])))
+        return response
+
+
+class JsonError(Exception):
+    """Error answered by JsonView as ``{"errors": {field: message}}`` with ``status``."""
+
+    def __init__(self, errors, status=400):
+        super().__init__(errors)
+        self.errors = errors
+        self.status = status
+
+
+def select_fields(value, schema):
+    """Sparse field selection of a comma separated ``fields`` parameter.
+
+    ``schema`` maps field names to None or to the schema of a nested object. Nested fields are selected
+    with dots, ``'id,customers.customer'`` gives ``{'id': None, 'customers': {'customer': None}}``,
+    and a nested object named alone is selected with all its fields.
+    """
+    selection = {}
+    for path in filter(None, (part.strip() for part in value.split(','))):
+        names = path.split('.')
+        level, level_schema = selection, schema
+        for depth, name in enumerate(names):
+            if not isinstance(level_schema, dict) or name not in level_schema:
+                raise JsonError({'fields': f"Unknown field {path!r}"})
+            if depth == len(names) - 1 or level_schema[name] is not None and level.get(name) is level_schema[name]:
+                level[name] = level_schema[name]
+                break
+            level = level.setdefault(name, {})
+            level_schema = level_schema[name]
+    return selection
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class JsonView(django.views.generic.View):
+    """View of an API answering JSON.
+
+    Writes need the ``settings.API_TOKEN`` bearer token or, from browsers, a CSRF token, and their bodies
+    have to be sent as ``application/json``.
+    """
+    fields_schema = {}
+    default_fields = None
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            self.check_write(request)
+            return super().dispatch(request, *args, **kwargs)
+        except JsonError as e:
+            return django.http.JsonResponse({'errors': e.errors}, status=e.status)
+        except django.http.Http404 as e:
+            return django.http.JsonResponse({'errors': {'__all__': str(e) or "Not found"}}, status=404)
+
+    def check_write(self, request):
+        if request.method in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            return
+        token = getattr(settings, 'API_TOKEN', None)
+        if not token or not constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+            csrf = CsrfViewMiddleware(lambda request: None)
+            csrf.process_request(request)
+            if csrf.process_view(request, None, (), {}) is not None:
+                raise JsonError({'__all__': "CSRF token or API token required"}, status=403)
+        if request.body and request.content_type != 'application/json':
+            raise JsonError({'__all__': "Content-Type application/json expected"}, status=415)
+
+    @cached_property
+    def data(self):
+        """Decoded JSON object of the request body."""
+        try:
+            data = json.loads(self.request.body or b'{}')
+        except ValueError:
+            raise JsonError({'__all__': "Invalid JSON"})
+        if not isinstance(data, dict):
+            raise JsonError({'__all__': "JSON object expected"})
+        return data
+
+    @cached_property
+    def fields(self):
+        """Selection of ``fields_schema`` asked for by the ``fields`` parameter, ``default_fields`` without it."""
+        if self.request.GET.get('fields'):
+            return select_fields(self.request.GET['fields'], self.fields_schema)
+        return self.fields_schema if self.default_fields is None else self.default_fields
+
+
+class StaffRequiredMixin(UserPassesTestMixin):
+    login_url = reverse_lazy('admin:login')
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+
+class ProfileListView(StaffRequiredMixin, django.views.generic.TemplateView):
+    """Recent profiles by view, with a token to profile requests with, see helpers.profiling."""
+    template_name = 'helpers/profile_list.html'
+
+    def get_context_data(self, **kwargs):
+        kwargs['profiles'] = profiling.recent_profiles()
+        kwargs['token'] = profiling.make_token(self.request.user)
+        return super().get_context_data(**kwargs)
+
+
+class ProfileView(StaffRequiredMixin, django.views.generic.TemplateView):
+    """Summary of a profile, the file itself with ``?download``."""
+    template_name = 'helpers/profile_detail.html'
+
+    @cached_property
+    def path(self):
+        path = profiling.profile_path(self.kwargs['view'], self.kwargs['name'])
+        if path is None:
+            raise django.http.Http404("No such profile")
+        return path
+
+    def get(self, request, *args, **kwargs):
+        if 'download' in request.GET:
+            return django.http.FileResponse(open(self.path, 'rb'), as_attachment=True, filename=kwargs['name'])
+        return super().get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        kwargs['summary'] = profiling.summary(self.path)
+        kwargs['profile'] = profiling.parse_name(self.kwargs['view'], self.kwargs['name'])
+        return super().get_context_data(**kwargs)
+
+
+class MemoryStatsView(StaffRequiredMixin, django.views.generic.TemplateView):
+    """Peak memory of the latest traced requests by view, see helpers.memory."""
+    template_name = 'helpers/memory_stats.html'
+
+    def post(self, request, *args, **kwargs):
+        memory.clear()
+        return django.http.HttpResponseRedirect(request.path)
+
+    def get_context_data(self, **kwargs):
+        kwargs['stats'] = memory.view_stats()
+        kwargs['token'] = profiling.make_token(self.request.user)
+        return super().get_context_data(**kwargs)
+
+
+class MetricsView(django.views.generic.View):
+    """Request metrics of all workers in the Prometheus text format, see helpers.metrics.
+
+    With ``settings.METRICS_TOKEN`` set, scrapers have to send it as a bearer token.
+    """
+
+    def get(self, request, *args, **kwargs):
+        token = getattr(settings, 'METRICS_TOKEN', None)
+        if token and not constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+            return django.http.HttpResponseForbidden()
+        return django.http.HttpResponse(metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 class CreateWithParentView(django.views.generic.CreateView):
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.0/ref/settings/
 """
 
 import os
+import tempfile
 
 import django_heroku
 
@@ -38,13 +39,16 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'bootstrap4',
-    'helpers',
+    'helpers.apps.HelpersConfig',
     'customers.apps.CustomersConfig',
     'products.apps.ProductsConfig',
     'orders.apps.OrdersConfig',
 ]
 
 MIDDLEWARE = [
+    'helpers.middleware.TracingMiddleware',
+    'helpers.middleware.MetricsMiddleware',
+    'helpers.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,6 +89,92 @@ DATABASES = {
     }
 }
 
+# Cache, has to be shared between processes, set MILKSHOP_CACHE_DIR when running several workers
+# https://docs.djangoproject.com/en/2.0/topics/cache/
+
+CACHE_DIR = os.environ.get('MILKSHOP_CACHE_DIR')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_DIR,
+    } if CACHE_DIR else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Seconds to keep cached pages and fragments, see helpers.cache, 0 turns the cache off, needs a shared cache
+TAGGED_CACHE_TIMEOUT = int(os.environ.get('MILKSHOP_CACHE_TIMEOUT', 0))
+
+# Bearer token of scripts and the phone client writing through the JSON API without CSRF tokens, see helpers.views
+API_TOKEN = os.environ.get('MILKSHOP_API_TOKEN')
+
+# Limits of queries and milliseconds (sql_ms, template_ms, view_ms, total_ms) of requests by method and view name,
+# or by view name for every method, '*' applies to other views, see helpers.middleware
+REQUEST_BUDGETS = {
+    'GET orders:index': {'queries': 12},
+    'GET orders:order': {'queries': 12},
+    'GET orders:list': {'queries': 5},
+    'GET orders:create': {'queries': 8},
+    'GET orders:order-edit': {'queries': 8},
+    'GET orders:order-confirm': {'queries': 8},
+    'GET orders:api-orders': {'queries': 5},
+    'GET orders:api-order': {'queries': 6},
+    'GET customers:index': {'queries': 5},
+    'GET customers:customer': {'queries': 8},
+}
+
+# Going over a budget fails the request when set, and logs a warning otherwise; set in tests by helpers.test_runner
+# and conftest.py
+REQUEST_BUDGET_RAISE = os.environ.get('MILKSHOP_BUDGET_RAISE', 'False').lower() in ['1', 'true', 't', 'yes', 'y']
+
+TEST_RUNNER = 'helpers.test_runner.TestRunner'
+
+# Queries of the same shape run this many times in a request are reported in development, see helpers.queries
+REPEATED_QUERIES_THRESHOLD = 3
+REPEATED_QUERIES_RAISE = False
+
+if DEBUG:
+    MIDDLEWARE.append('helpers.middleware.RepeatedQueriesMiddleware')
+
+# Profiles of requests with a token from /debug/profiles/ or sampled at PROFILE_SAMPLE_RATE, see helpers.profiling
+MIDDLEWARE.append('helpers.middleware.ProfilerMiddleware')
+PROFILE_DIR = os.environ.get('MILKSHOP_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'milkshop-profiles'))
+PROFILE_SAMPLE_RATE = float(os.environ.get('MILKSHOP_PROFILE_SAMPLE_RATE', 0))
+PROFILE_MODE = os.environ.get('MILKSHOP_PROFILE_MODE', 'cprofile')
+PROFILE_SAMPLE_INTERVAL = 0.005
+PROFILE_TOKEN_MAX_AGE = 3600
+PROFILE_KEEP = 20
+
+# Allocations of requests with a profiling token in ?memory= or sampled, see helpers.memory
+MIDDLEWARE.append('helpers.middleware.MemoryProfilerMiddleware')
+MEMORY_PROFILE_SAMPLE_RATE = float(os.environ.get('MILKSHOP_MEMORY_PROFILE_SAMPLE_RATE', 0))
+MEMORY_PROFILE_FRAMES = 10
+MEMORY_STATS_WINDOW = 100
+MEMORY_STATS_DIR = os.environ.get('MILKSHOP_MEMORY_STATS_DIR', os.path.join(tempfile.gettempdir(), 'milkshop-memory'))
+
+# Request metrics shared by the workers, served at /metrics, see helpers.metrics
+METRICS_DIR = os.environ.get('MILKSHOP_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'milkshop-metrics'))
+METRICS_TOKEN = os.environ.get('MILKSHOP_METRICS_TOKEN')
+
+# Spans of requests with a profiling token in ?trace= or sampled, see helpers.tracing and the traces command
+TRACE_DIR = os.environ.get('MILKSHOP_TRACE_DIR', os.path.join(tempfile.gettempdir(), 'milkshop-traces'))
+TRACE_SAMPLE_RATE = float(os.environ.get('MILKSHOP_TRACE_SAMPLE_RATE', 0))
+TRACE_FORMAT = os.environ.get('MILKSHOP_TRACE_FORMAT', 'jsonl')
+TRACE_KEEP_FILES = 50
+
+# Slow and repeated queries with their plans, see helpers.slow_queries and the slow_queries command
+MIDDLEWARE.append('helpers.middleware.SlowQueryMiddleware')
+SLOW_QUERY_MS = float(os.environ.get('MILKSHOP_SLOW_QUERY_MS', 100))
+SLOW_QUERY_REPEAT = int(os.environ.get('MILKSHOP_SLOW_QUERY_REPEAT', 10))
+SLOW_QUERY_LOG = os.environ.get('MILKSHOP_SLOW_QUERY_LOG',
+                                os.path.join(tempfile.gettempdir(), 'milkshop-slow-queries.jsonl'))
+SLOW_QUERY_LOG_INTERVAL = float(os.environ.get('MILKSHOP_SLOW_QUERY_LOG_INTERVAL', 60))
+SLOW_QUERY_LOG_MAX_BYTES = 10 << 20
+
+# innermost, for the span of the view to start right before it is called
+MIDDLEWARE.append('helpers.middleware.ViewTracingMiddleware')
+
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
 
@@ -17,11 +17,15 @@ from django.contrib import admin
 from django.urls import path, include
 from django.views.generic import TemplateView
 
+import helpers.views
+
 urlpatterns = [
     path('', TemplateView.as_view(template_name='index.html'), name='index'),
     path('admin/', admin.site.urls),
     path('customers/', include('customers.urls')),
     path('products/', include('products.urls')),
     path('orders/', include('orders.urls')),
+    path('debug/', include('helpers.urls')),
+    path('metrics', helpers.views.MetricsView.as_view(), name='metrics'),
     path('robots.txt', TemplateView.as_view(template_name='robots.txt', content_type='text/plain'))
 ]
@@ -0,0 +1,242 @@
+"""JSON API of orders, customer orders and their product order cells.
+
+Reads take a ``fields`` parameter to return only some fields (see helpers.views.select_fields) and only
+query what is returned. Writes take ``{"amounts": {customer_id: {product_id: value}}}`` and/or the same
+under ``"confirmed_amounts"``, validated against the catalog and applied in one transaction with the
+bulk statements of CustomerOrder.save_many_amounts().
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.functional import cached_property
+
+import customers.models
+from helpers.pagination import KeysetPage
+from helpers.views import ConditionalGetMixin, JsonError, JsonView
+from orders import forms
+from orders.importer import MAX_AMOUNT
+from orders.models import CustomerOrder, Order, ProductOrder
+
+PRODUCT_ORDER_FIELDS = {'id': None, 'product': None, 'amount': None, 'confirmed_amount': None}
+CUSTOMER_ORDER_FIELDS = {'id': None, 'customer': None, 'customer_name': None, 'order_total': None,
+                         'confirmed_total': None, 'product_orders': PRODUCT_ORDER_FIELDS}
+ORDER_FIELDS = {'id': None, 'date': None, 'order_total': None, 'confirmed_total': None, 'url': None,
+                'customers': CUSTOMER_ORDER_FIELDS}
+AMOUNT_FIELDS = {'amounts': 'amount', 'confirmed_amounts': 'confirmed_amount'}
+MAX_PAGE_SIZE = 100
+
+
+def product_order_data(product_order, fields):
+    values = {
+        'id': lambda: product_order.pk,
+        'product': lambda: product_order.product_id,
+        'amount': lambda: product_order.amount,
+        'confirmed_amount': lambda: product_order.confirmed_amount,
+    }
+    return {name: values[name]() for name in fields}
+
+
+def customer_order_data(customer_order, fields):
+    values = {
+        'id': lambda: customer_order.pk,
+        'customer': lambda: customer_order.customer_id,
+        'customer_name': lambda: customer_order.customer.name,
+        'order_total': lambda: customer_order.order_total,
+        'confirmed_total': lambda: customer_order.confirmed_total,
+        'product_orders': lambda: [product_order_data(product_order, fields['product_orders'])
+                                   for product_order in customer_order.product_orders.all()],
+    }
+    return {name: values[name]() for name in fields}
+
+
+def order_data(order, fields):
+    values = {
+        'id': lambda: order.pk,
+        'date': lambda: order.date.isoformat(),
+        'order_total': lambda: order.order_total,
+        'confirmed_total': lambda: order.confirmed_total,
+        'url': order.get_absolute_url,
+        'customers': lambda: [customer_order_data(customer_order, fields['customers'])
+                              for customer_order in order.customers.all()],
+    }
+    return {name: values[name]() for name in fields}
+
+
+def customer_orders_queryset(fields):
+    """Customer orders with what ``fields`` of CUSTOMER_ORDER_FIELDS read."""
+    queryset = CustomerOrder.objects.order_by('pk')
+    if 'customer_name' in fields:
+        queryset = queryset.select_related('customer')
+    if 'product_orders' in fields:
+        queryset = queryset.prefetch_related(Prefetch('product_orders', ProductOrder.objects.order_by('product_id')))
+    return queryset
+
+
+def orders_queryset(fields):
+    """Orders with what ``fields`` of ORDER_FIELDS read."""
+    queryset = Order.objects.all()
+    if 'customers' in fields:
+        queryset = queryset.prefetch_related(Prefetch('customers', customer_orders_queryset(fields['customers'])))
+    return queryset
+
+
+def parse_amount(value):
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError("Integer or null expected")
+    if not 0 <= value <= MAX_AMOUNT:
+        raise ValueError(f"Out of range 0..{MAX_AMOUNT}")
+    return value
+
+
+def parse_amounts(data, customer_id=None):
+    """``{customer_id: {product_id: {amount field: value}}}`` of a request body.
+
+    With ``customer_id`` the amounts in the body are ``{product_id: value}`` of that customer.
+    Raises JsonError listing every invalid customer, product and value.
+    """
+    product_ids = forms.catalog_form_class(forms.CustomerOrderForm).product_fields
+    changes = {}
+    errors = {}
+    customer_paths = {}
+    for key, amount_field in AMOUNT_FIELDS.items():
+        by_customer = data.get(key)
+        if by_customer is None:
+            continue
+        if customer_id is not None:
+            by_customer = {str(customer_id): by_customer}
+        if not isinstance(by_customer, dict):
+            errors[key] = "JSON object expected"
+            continue
+        for customer_key, amounts in by_customer.items():
+            path = key if customer_id is not None else f'{key}.{customer_key}'
+            try:
+                customer = int(customer_key)
+            except ValueError:
+                errors[path] = "Invalid customer id"
+                continue
+            customer_paths[customer] = path
+            if not isinstance(amounts, dict):
+                errors[path] = "JSON object expected"
+                continue
+            for product_key, value in amounts.items():
+                try:
+                    product_id = int(product_key)
+                except ValueError:
+                    product_id = None
+                if product_id not in product_ids:
+                    errors[f'{path}.{product_key}'] = "Unknown product"
+                    continue
+                try:
+                    value = parse_amount(value)
+                except ValueError as e:
+                    errors[f'{path}.{product_key}'] = str(e)
+                    continue
+                changes.setdefault(customer, {}).setdefault(product_id, {})[amount_field] = value
+    for customer in customers.models.Customer.objects.filter(pk__in=customer_paths).values_list('pk', flat=True):
+        del customer_paths[customer]
+    for path in customer_paths.values():
+        errors[path] = "Unknown customer"
+    if errors:
+        raise JsonError(errors)
+    return changes
+
+
+class OrdersApiView(JsonView):
+    """``GET``: orders newest first, paginated by ``after`` and ``before`` cursors and ``limit``.
+    ``POST``: new order of ``date`` with optional amounts.
+    """
+    fields_schema = ORDER_FIELDS
+    default_fields = {name: value for name, value in ORDER_FIELDS.items() if name != 'customers'}
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.GET.get('limit', 20))
+        except ValueError:
+            raise JsonError({'limit': "Invalid number"})
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise JsonError({'limit': f"Out of range 1..{MAX_PAGE_SIZE}"})
+        return limit
+
+    def get(self, request, *args, **kwargs):
+        page = KeysetPage(orders_queryset(self.fields), ['-date', '-pk'], self.get_limit(),
+                          after=request.GET.get('after'), before=request.GET.get('before'))
+        return JsonResponse({
+            'results': [order_data(order, self.fields) for order in page],
+            'next': page.next_cursor,
+            'previous': page.previous_cursor,
+        })
+
+    def post(self, request, *args, **kwargs):
+        try:
+            date = datetime.date.fromisoformat(str(self.data.get('date')))
+        except ValueError:
+            raise JsonError({'date': "Date in YYYY-MM-DD format expected"})
+        changes = parse_amounts(self.data)
+        with transaction.atomic():
+            order = Order(date=date)
+            order.save()
+            order.save_amounts(changes)
+        return JsonResponse(order_data(orders_queryset(self.fields).get(pk=order.pk), self.fields), status=201)
+
+
+class BaseOrderApiView(JsonView):
+    """``GET``: an order with its customer orders. ``DELETE``: delete the order."""
+    fields_schema = ORDER_FIELDS
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(order_data(get_object_or_404(orders_queryset(self.fields), pk=kwargs['order_pk']),
+                                       self.fields))
+
+    def delete(self, request, *args, **kwargs):
+        get_object_or_404(Order, pk=kwargs['order_pk']).delete()
+        return HttpResponse(status=204)
+
+
+class OrderApiView(ConditionalGetMixin, BaseOrderApiView):
+    @cached_property
+    def order_stamp(self):
+        return Order.objects.filter(pk=self.kwargs['order_pk']).values_list('pk', 'updated_at').first()
+
+    def get_stamp(self):
+        if self.order_stamp is None:
+            return None, None
+        pk, updated_at = self.order_stamp
+        return f'order-api-{pk}-{updated_at.timestamp()}', updated_at
+
+
+class OrderAmountsApiView(JsonView):
+    """``POST``: apply amounts of many customers to an order at once, answers the order."""
+    fields_schema = ORDER_FIELDS
+
+    def post(self, request, *args, **kwargs):
+        order = get_object_or_404(Order, pk=kwargs['order_pk'])
+        order.save_amounts(parse_amounts(self.data))
+        return JsonResponse(order_data(orders_queryset(self.fields).get(pk=order.pk), self.fields))
+
+
+class CustomerOrderApiView(JsonView):
+    """``GET``: the customer order of a customer in an order.
+    ``PATCH``: apply ``{"amounts": {product_id: value}}`` and/or ``"confirmed_amounts"`` to it.
+    """
+    fields_schema = CUSTOMER_ORDER_FIELDS
+
+    def get_queryset(self):
+        return customer_orders_queryset(self.fields).filter(order_id=self.kwargs['order_pk'],
+                                                            customer_id=self.kwargs['customer_pk'])
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(customer_order_data(get_object_or_404(self.get_queryset()), self.fields))
+
+    def patch(self, request, *args, **kwargs):
+        order = get_object_or_404(Order, pk=kwargs['order_pk'])
+        order.save_amounts(parse_amounts(self.data, customer_id=kwargs['customer_pk']))
+        customer_order = self.get_queryset().first()
+        if customer_order is None:
+            # every product order was removed, and the customer order with them
+            return HttpResponse(status=204)
+        return JsonResponse(customer_order_data(customer_order, self.fields))
@@ -0,0 +1,64 @@
+import csv
+import itertools
+
+import products.models
+from orders import models
+
+
+def export_rows(customer_orders, chunk_size=2000):
+    """Rows of the customer × product grid of customer orders (a queryset), header first.
+
+    Each row holds the order date, the customer, ordered and confirmed amounts of every product
+    and the stored totals. Product orders are read through one iterator, so memory use does not
+    depend on how many orders are exported.
+    """
+    product_list = list(products.models.Product.objects.select_related('product_type')
+                        .order_by('product_type_id', 'pk'))
+    columns = {product.pk: index for index, product in enumerate(product_list)}
+    header = ["Дата", "Покупатель"]
+    for product in product_list:
+        header.extend([f"{product} (заказ)", f"{product} (подтверждено)"])
+    header.extend(["Предварительная сумма", "Окончательная сумма"])
+    yield header
+
+    product_orders = models.ProductOrder.objects \
+        .filter(customerOrder__in=customer_orders) \
+        .order_by('customerOrder__order__date', 'customerOrder__order_id', 'customerOrder_id') \
+        .values_list('customerOrder_id', 'customerOrder__order__date', 'customerOrder__customer__name',
+                     'customerOrder__order_total', 'customerOrder__confirmed_total',
+                     'product_id', 'amount', 'confirmed_amount') \
+        .iterator(chunk_size=chunk_size)
+    for _, lines in itertools.groupby(product_orders, key=lambda line: line[0]):
+        lines = list(lines)
+        _, date, customer, order_total, confirmed_total = lines[0][:5]
+        amounts = [''] * (2 * len(product_list))
+        for *_, product_id, amount, confirmed_amount in lines:
+            if product_id in columns:
+                amounts[2 * columns[product_id]] = '' if amount is None else amount
+                amounts[2 * columns[product_id] + 1] = '' if confirmed_amount is None else confirmed_amount
+        yield [date.isoformat(), customer, *amounts, order_total, confirmed_total]
+
+
+class Echo:
+    """File-like object returning what is written, to stream csv.writer output."""
+
+    def write(self, value):
+        return value
+
+
+def export_csv(customer_orders, chunk_size=2000):
+    """Lines of the CSV export of customer orders."""
+    writer = csv.writer(Echo())
+    return (writer.writerow(row) for row in export_rows(customer_orders, chunk_size))
+
+
+def customer_orders(order=None, date_from=None, date_to=None):
+    """Customer orders of an order or of orders in a date range, both ends included."""
+    queryset = models.CustomerOrder.objects.all()
+    if order is not None:
+        queryset = queryset.filter(order=order)
+    if date_from is not None:
+        queryset = queryset.filter(order__date__gte=date_from)
+    if date_to is not None:
+        queryset = queryset.filter(order__date__lte=date_to)
+    return queryset
@@ -1,87 +1,194 @@
-import re
+import threading
 
 from django import forms
+from django.db import transaction
+from django.utils.functional import cached_property
 
 import orders.models
 import products.models
+from orders import totals
+from products import catalog
+
+
+class InstanceChoiceField(forms.ModelChoiceField):
+    """Model choice looked up by pk in ``instances`` when they are given, instead of with a query per form."""
+    instances = None
+
+    def to_python(self, value):
+        if self.instances is None or value in self.empty_values:
+            return super().to_python(value)
+        try:
+            return self.instances[str(value)]
+        except KeyError:
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
 
 
 class CustomerOrderForm(forms.ModelForm):
     class Meta:
         model = orders.models.CustomerOrder
         fields = ['customer']
+        # the customer is declared below and set in clean(), the model validation would look it up again and
+        # check it is unique with a query per form, the formset checks it among its forms instead
+        exclude = ['customer']
 
+    customer = orders.models.CustomerOrder._meta.get_field('customer').formfield(form_class=InstanceChoiceField)
     amount_field = 'amount'
+    # field name by product id, filled in by catalog_form_class()
+    product_fields = {}
 
     def __init__(self, amount_field=None, **kwargs):
         super().__init__(**kwargs)
-        order_fields = {}
-        for product_type in products.models.ProductType.objects.all():
-            for product in product_type.products.all():
-                order_fields[product.get_field_name()] = forms.IntegerField(
-                    label=str(product),
-                    required=False)
-        self.fields.update(order_fields)
         self.amount_field = amount_field or self.amount_field
         self.initial.update(self.get_initial())
 
     def get_initial(self):
-        if self.instance:
-            initial = {}
+        initial = {}
+        if self.instance.pk:
+            initial['customer'] = self.instance.customer_id
             for product_order in self.instance.product_orders.all():
-                initial[product_order.product.get_field_name()] = getattr(product_order, self.amount_field)
-            return initial
-        return None
+                if product_order.product_id in self.product_fields:
+                    initial[self.product_fields[product_order.product_id]] = getattr(product_order,
+                                                                                     self.amount_field)
+        return initial
+
+    def get_amounts(self):
+        """``{product_id: value}`` of the amount fields."""
+        return {product_id: self.cleaned_data.get(field_name) for product_id, field_name in self.product_fields.items()}
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('customer') is not None:
+            self.instance.customer = cleaned_data['customer']
+        return cleaned_data
 
     def _save_m2m(self):
-        pattern = r'product-(?P<type>\d+)-(?P<product>\d+)'
-        for key, value in self.cleaned_data.items():
-            match = re.match(pattern, key)
-            if not match:
-                continue
-            product = products.models.Product.objects.get(pk=match['product'], product_type=match['type'])
-            if value and value > 0:
-                product_order, created = self.instance.product_orders.update_or_create(product=product,
-                                                                                       defaults={
-                                                                                           self.amount_field: value})
-                product_order.save()
-            else:
-                try:
-                    product_order = self.instance.product_orders.get(product=product)
-                    setattr(product_order, self.amount_field, value)
-                    if product_order.amount is None and product_order.confirmed_amount is None:
-                        product_order.delete()
-                    else:
-                        product_order.save()
-                except self.instance.product_orders.model.DoesNotExist:
-                    pass
-        if self.instance.product_orders.count() == 0:
+        if self.instance.save_amounts(self.get_amounts(), self.amount_field) == 0:
             self.instance.delete()
             self.instance = None
         return self.instance
 
 
+_catalog_classes = {}
+_catalog_classes_lock = threading.Lock()
+
+
+def catalog_form_class(form_class):
+    """Subclass of ``form_class`` with an amount field for every product in the catalog.
+
+    Classes are built once per catalog version, so forms of a formset do not query the catalog.
+    """
+    version = catalog.version()
+    with _catalog_classes_lock:
+        if _catalog_classes.get('version') != version:
+            _catalog_classes.clear()
+            _catalog_classes['version'] = version
+        if form_class not in _catalog_classes:
+            attrs = {'product_fields': {}}
+            for product in products.models.Product.objects.select_related('product_type') \
+                    .order_by('product_type_id', 'pk'):
+                field_name = product.get_field_name()
+                attrs[field_name] = forms.IntegerField(label=str(product), required=False)
+                attrs['product_fields'][product.pk] = field_name
+            _catalog_classes[form_class] = type(form_class)(form_class.__name__, (form_class,), attrs)
+        return _catalog_classes[form_class]
+
+
+def catalog_formset_class(formset_class):
+    """Subclass of ``formset_class`` whose forms have amount fields of the current catalog."""
+    form_class = catalog_form_class(formset_class.form)
+    key = (formset_class, form_class)
+    with _catalog_classes_lock:
+        if key not in _catalog_classes:
+            _catalog_classes[key] = type(formset_class.__name__, (formset_class,), {'form': form_class})
+        return _catalog_classes[key]
+
+
+class BaseCustomerOrderFormSet(forms.BaseInlineFormSet):
+    """Inline formset whose forms share one list of customer choices instead of querying it per form,
+    saved with the bulk statements of Order.save_amounts().
+    """
+
+    @cached_property
+    def customer_choices(self):
+        return list(self.form.base_fields['customer'].choices)
+
+    @cached_property
+    def customer_instances(self):
+        """Customers the forms accept by pk: the choices, or the customers of the order when they are hidden."""
+        if self.form.base_fields['customer'].widget.is_hidden:
+            return {str(customer_order.customer_id): customer_order.customer
+                    for customer_order in self.existing_instances.values()}
+        return {str(value): value.instance for value, _ in self.customer_choices if value}
+
+    @cached_property
+    def existing_instances(self):
+        """Customer orders of the formset by pk, for the hidden pk fields of the forms."""
+        return {str(customer_order.pk): customer_order for customer_order in self.get_queryset()}
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        if not form.fields['customer'].widget.is_hidden:
+            form.fields['customer'].choices = self.customer_choices
+        form.fields['customer'].instances = self.customer_instances
+        pk_field = form.fields[self._pk_field.name]
+        form.fields[self._pk_field.name] = InstanceChoiceField(pk_field.queryset, initial=pk_field.initial,
+                                                               required=False, widget=pk_field.widget)
+        form.fields[self._pk_field.name].instances = self.existing_instances
+
+    def validate_unique(self):
+        super().validate_unique()
+        # the customer is not a model field of the forms, so the unique checks of the formset miss it
+        customers = set()
+        for form in self.forms:
+            if not form.is_valid() or form in self.deleted_forms or form.cleaned_data.get('customer') is None:
+                continue
+            if form.cleaned_data['customer'] in customers:
+                form.add_error(None, self.get_form_error())
+                raise forms.ValidationError(self.get_unique_error_message(['customer']))
+            customers.add(form.cleaned_data['customer'])
+
+    def save(self, commit=True):
+        """Save the changed forms with Order.save_amounts(), returns the customer orders saved."""
+        if not commit:
+            return super().save(commit)
+        self.new_objects, self.changed_objects, self.deleted_objects = [], [], []
+        changed_forms = [form for form in self.forms if form.has_changed()]
+        changes = {}
+        for form in changed_forms:
+            if form.instance.pk is not None and 'customer' in form.changed_data:
+                # one by one, the charge of the customer order moves to the new customer
+                form.instance.save(update_fields=['customer'])
+            changes[form.cleaned_data['customer'].pk] = {product_id: {form.amount_field: value}
+                                                         for product_id, value in form.get_amounts().items()}
+        saved = self.instance.save_amounts(changes)
+        for form in changed_forms:
+            customer_order = saved.get(form.cleaned_data['customer'].pk)
+            if customer_order is None:
+                # emptied, see CustomerOrderForm._save_m2m()
+                if form.instance.pk is not None:
+                    self.deleted_objects.append(form.instance)
+                continue
+            if form.instance.pk is None:
+                self.new_objects.append(customer_order)
+            else:
+                self.changed_objects.append((customer_order, form.changed_data))
+            form.instance = customer_order
+        return [customer_order for customer_order, _ in self.changed_objects] + self.new_objects
+
+
 OrderFormSet = forms.inlineformset_factory(orders.models.Order, orders.models.CustomerOrder, form=CustomerOrderForm,
-                                           extra=1, can_delete=False)
+                                           formset=BaseCustomerOrderFormSet, extra=1, can_delete=False)
 
 
 class CustomerOrderConfirmForm(CustomerOrderForm):
-    class Meta(CustomerOrderForm.Meta):
-        widgets = {'customer': forms.HiddenInput}
-
+    customer = orders.models.CustomerOrder._meta.get_field('customer').formfield(form_class=InstanceChoiceField,
+                                                                                widget=forms.HiddenInput)
     amount_field = 'confirmed_amount'
 
-    def get_initial(self):
-        if self.instance:
-            initial = {}
-            for product_order in self.instance.product_orders.all():
-                initial[product_order.product.get_field_name()] = product_order.confirmed_amount
-            return initial
-        return None
-
 
 OrderConfirmFormSet = forms.inlineformset_factory(orders.models.Order, orders.models.CustomerOrder,
-                                                  form=CustomerOrderConfirmForm, extra=0, can_delete=False)
+                                                  form=CustomerOrderConfirmForm, formset=BaseCustomerOrderFormSet,
+                                                  extra=0, can_delete=False)
 
 
 class OrderForm(forms.ModelForm):
@@ -95,17 +202,24 @@ class OrderForm(forms.ModelForm):
 
     def __init__(self, initial=None, **kwargs):
         super().__init__(initial=initial, **kwargs)
-        self.formset = self.get_formset_class()(initial=(initial or {}).get('order', None), **kwargs)
+        self.formset = self.get_formset_class()(initial=(initial or {}).get('order', None),
+                                                queryset=self.get_formset_queryset(), **kwargs)
 
     def get_formset_class(self):
-        return self.formset_class
+        return catalog_formset_class(self.formset_class)
+
+    def get_formset_queryset(self):
+        """Customer orders of the formset, with everything their forms and the templates read."""
+        return orders.models.CustomerOrder.objects.select_related('customer').prefetch_related('product_orders')
 
     def is_valid(self):
         return super().is_valid() and self.formset.is_valid()
 
+    @transaction.atomic
     def save(self, commit=True):
-        self.formset.instance = super().save(commit)
-        self.formset.save(commit)
+        with totals.batch():
+            self.formset.instance = super().save(commit)
+            self.formset.save(commit)
         return self.instance
 
 
@@ -115,3 +229,15 @@ class OrderConfirmForm(OrderForm):
         widgets = {'date': forms.HiddenInput}
 
     formset_class = OrderConfirmFormSet
+
+
+class OrderImportForm(forms.Form):
+    file = forms.FileField(label="Файл CSV или JSON",
+                           help_text="Колонки: date, customer, product, amount, confirmed")
+    dry_run = forms.BooleanField(label="Только проверить", required=False)
+
+    def clean_file(self):
+        file = self.cleaned_data['file']
+        if not file.name.lower().endswith(('.csv', '.json')):
+            raise forms.ValidationError("Поддерживаются только файлы .csv и .json")
+        return file
@@ -0,0 +1,192 @@
+import csv
+import datetime
+import io
+import itertools
+import json
+from collections import Counter, namedtuple
+from contextlib import nullcontext
+
+from django.db import IntegrityError, transaction
+
+import customers.models
+import products.models
+from orders import models, totals
+
+FIELDS = ['date', 'customer', 'product', 'amount', 'confirmed']
+MAX_AMOUNT = 32767
+
+Line = namedtuple('Line', 'number date customer_id product_id amount confirmed_amount')
+
+
+def read_csv(file):
+    """``(line number, record)`` pairs of a CSV file with a header of FIELDS."""
+    reader = csv.DictReader(file)
+    for record in reader:
+        yield reader.line_num, record
+
+
+def read_json(file):
+    """``(position, record)`` pairs of a JSON list of objects with FIELDS."""
+    records = json.load(file)
+    if not isinstance(records, list):
+        raise ValueError("JSON import has to be a list of objects")
+    return enumerate(records, start=1)
+
+
+def read(file, file_format):
+    """Records of a binary or text file in 'csv' or 'json' format."""
+    if isinstance(file.read(0), bytes):
+        file = io.TextIOWrapper(file, encoding='utf-8-sig')
+    return read_json(file) if file_format == 'json' else read_csv(file)
+
+
+class OrderImporter:
+    """Import order lines, creating orders, customer orders and product orders with bulk statements.
+
+    Customers are matched by name, products by ``str(product)`` (as in the CSV export) or primary key.
+    Lines go to the first order of their date, lines of existing product orders replace their amounts.
+    Invalid lines are reported in ``errors`` and skipped, ``counts`` tells what was written.
+    With ``dry_run`` everything is rolled back at the end.
+    """
+
+    def __init__(self, batch_size=5000, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.customers = dict(customers.models.Customer.objects.values_list('name', 'pk'))
+        self.products = {}
+        for product in products.models.Product.objects.select_related('product_type'):
+            self.products[str(product)] = product.pk
+            self.products[str(product.pk)] = product.pk
+        self.errors = []
+        self.counts = Counter()
+
+    def summary(self):
+        """``(what, count)`` pairs of rows written."""
+        return sorted((name, count) for name, count in self.counts.items() if name != 'lines')
+
+    def parse(self, number, record):
+        if not isinstance(record, dict):
+            raise ValueError("not an object")
+        missing = [field for field in FIELDS[:3] if not record.get(field)]
+        if missing:
+            raise ValueError(f"missing {', '.join(missing)}")
+        try:
+            date = datetime.date.fromisoformat(str(record['date']).strip())
+        except ValueError:
+            raise ValueError(f"invalid date {record['date']!r}")
+        customer_id = self.customers.get(str(record['customer']).strip())
+        if customer_id is None:
+            raise ValueError(f"unknown customer {record['customer']!r}")
+        product_id = self.products.get(str(record['product']).strip())
+        if product_id is None:
+            raise ValueError(f"unknown product {record['product']!r}")
+        amounts = []
+        for field in FIELDS[3:]:
+            value = record.get(field)
+            if value is None or str(value).strip() == '':
+                amounts.append(None)
+                continue
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"invalid {field} {value!r}")
+            if not 0 <= value <= MAX_AMOUNT:
+                raise ValueError(f"{field} {value} out of range")
+            amounts.append(value)
+        if amounts == [None, None]:
+            raise ValueError("no amount")
+        return Line(number, date, customer_id, product_id, *amounts)
+
+    def lines(self, records):
+        for number, record in records:
+            try:
+                yield self.parse(number, record)
+            except ValueError as e:
+                self.errors.append((number, str(e)))
+
+    def run(self, records):
+        lines = self.lines(records)
+        with transaction.atomic() if self.dry_run else nullcontext():
+            while True:
+                batch = list(itertools.islice(lines, self.batch_size))
+                if not batch:
+                    break
+                with transaction.atomic():
+                    self.import_batch(batch)
+            if self.dry_run:
+                transaction.set_rollback(True)
+        return self
+
+    def import_batch(self, lines):
+        self.counts['lines'] += len(lines)
+        order_ids = self._orders({line.date for line in lines})
+        customer_order_ids = self._customer_orders({(order_ids[line.date], line.customer_id) for line in lines})
+
+        amounts = {}
+        for line in lines:
+            customer_order_id = customer_order_ids[order_ids[line.date], line.customer_id]
+            amounts[customer_order_id, line.product_id] = (line.amount, line.confirmed_amount)
+        existing = {(product_order.customerOrder_id, product_order.product_id): product_order
+                    for product_order in models.ProductOrder.objects.filter(
+                        customerOrder_id__in=set(customer_order_ids.values()))
+                    .only('pk', 'customerOrder_id', 'product_id', 'amount', 'confirmed_amount')}
+        created, updated = [], []
+        for (customer_order_id, product_id), (amount, confirmed_amount) in amounts.items():
+            product_order = existing.get((customer_order_id, product_id))
+            if product_order is None:
+                created.append(models.ProductOrder(customerOrder_id=customer_order_id, product_id=product_id,
+                                                   amount=amount, confirmed_amount=confirmed_amount))
+            elif (product_order.amount, product_order.confirmed_amount) != (amount, confirmed_amount):
+                product_order.amount, product_order.confirmed_amount = amount, confirmed_amount
+                updated.append(product_order)
+        models.ProductOrder.objects.bulk_create(created, batch_size=self.batch_size)
+        models.ProductOrder.objects.bulk_update(updated, ['amount', 'confirmed_amount'], batch_size=self.batch_size)
+        self.counts['product orders created'] += len(created)
+        self.counts['product orders updated'] += len(updated)
+
+        totals.refresh_customer_orders(models.CustomerOrder.objects.filter(pk__in=set(customer_order_ids.values())))
+
+    def _orders(self, dates):
+        """Order id by date, orders missing for the dates are created."""
+        def load():
+            order_ids = {}
+            for date, pk in models.Order.objects.filter(date__in=dates).order_by('pk').values_list('date', 'pk'):
+                order_ids.setdefault(date, pk)
+            return order_ids
+
+        order_ids = load()
+        missing = dates - order_ids.keys()
+        if missing:
+            # primary keys of bulk created rows are not set on every database, so they are read back
+            models.Order.objects.bulk_create([models.Order(date=date) for date in sorted(missing)])
+            self.counts['orders created'] += len(missing)
+            order_ids = load()
+        return order_ids
+
+    def _load_customer_orders(self, keys):
+        """Customer order id by ``(order id, customer id)`` of the orders of ``keys``."""
+        return {(order_id, customer_id): pk for order_id, customer_id, pk in models.CustomerOrder.objects
+                .filter(order_id__in={order_id for order_id, _ in keys}).values_list('order_id', 'customer_id', 'pk')}
+
+    def _customer_orders(self, keys):
+        """Customer order id by ``(order id, customer id)``, missing customer orders are created."""
+        customer_order_ids = self._load_customer_orders(keys)
+        missing = keys - customer_order_ids.keys()
+        while missing:
+            try:
+                with transaction.atomic():
+                    models.CustomerOrder.objects.bulk_create(
+                        [models.CustomerOrder(order_id=order_id, customer_id=customer_id)
+                         for order_id, customer_id in sorted(missing)], batch_size=self.batch_size)
+            except IntegrityError:
+                # customer orders created meanwhile by another import are left as they are and the others are
+                # inserted again, so only rows inserted here are counted as created
+                customer_order_ids = self._load_customer_orders(keys)
+                if not missing & customer_order_ids.keys():
+                    raise
+                missing -= customer_order_ids.keys()
+            else:
+                self.counts['customer orders created'] += len(missing)
+                customer_order_ids = self._load_customer_orders(keys)
+                break
+        return customer_order_ids
@@ -0,0 +1,194 @@
+import datetime
+import json
+import platform
+import time
+import tracemalloc
+
+import django
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.urls import NoReverseMatch, URLResolver, get_resolver, reverse
+
+import customers.models
+import products.models
+from helpers.memory import percentile
+from orders import models
+
+
+def url_names(namespace):
+    """``(name, kwarg names)`` of every named URL pattern of a namespace, includes followed."""
+    try:
+        _, resolver = get_resolver().namespace_dict[namespace]
+    except KeyError:
+        raise CommandError(f"Unknown URL namespace {namespace!r}")
+
+    def walk(patterns, kwargs):
+        for pattern in patterns:
+            pattern_kwargs = kwargs | set(pattern.pattern.regex.groupindex)
+            if isinstance(pattern, URLResolver):
+                yield from walk(pattern.url_patterns, pattern_kwargs)
+            elif pattern.name:
+                yield f'{namespace}:{pattern.name}', pattern_kwargs
+
+    return walk(resolver.url_patterns, set())
+
+
+def sample_kwargs():
+    """URL kwargs of the objects pages are measured with.
+
+    These are the latest order, the customer of it with the longest ledger, their last debit and the first product.
+    """
+    samples = {}
+    order = models.Order.objects.order_by('-date', '-pk').first()
+    if order is not None:
+        samples['order_pk'] = order.pk
+    customer_list = customers.models.Customer.objects.all()
+    if order is not None and order.customers.exists():
+        # so that customer order URLs of the order resolve
+        customer_list = customer_list.filter(orders__order=order)
+    customer = customer_list.annotate(entries=Count('ledger', distinct=True)).order_by('-entries', 'pk').first()
+    if customer is not None:
+        samples['customer_pk'] = customer.pk
+        debit = customer.debits.order_by('-date', '-pk').first()
+        if debit is not None:
+            samples.update(debit_pk=debit.pk, debit_date=debit.date)
+    product = products.models.Product.objects.order_by('pk').first()
+    if product is not None:
+        samples.update(producttype_pk=product.product_type_id, product_pk=product.pk)
+    return samples
+
+
+class QueryCounter:
+    """Database execute wrapper counting statements."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = "Request every page of the orders, customers and products URLs through the test client " \
+           "and report latency percentiles, query counts and peak memory as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--namespace', action='append', dest='namespaces',
+                            help="URL namespace to measure, orders, customers and products by default")
+        parser.add_argument('--filter', default='', dest='name_filter',
+                            help="Only measure URL names containing this text")
+        parser.add_argument('--repeat', type=int, default=20, help="Measured requests per URL")
+        parser.add_argument('--warmup', type=int, default=2, help="Requests per URL before measuring")
+        parser.add_argument('--clear-cache', action='store_true',
+                            help="Clear the cache before every request, to measure pages built from scratch")
+        parser.add_argument('--no-memory', action='store_false', dest='memory',
+                            help="Skip the extra request per URL traced for peak memory")
+        parser.add_argument('--kwarg', action='append', default=[], metavar='NAME=VALUE',
+                            help="URL kwarg to use instead of the sample one, such as order_pk=10")
+        parser.add_argument('--compare', help="JSON output of an earlier run to compare with")
+        parser.add_argument('--output', help="File to write the JSON to instead of stdout")
+
+    def handle(self, *args, namespaces=None, name_filter='', repeat=20, warmup=2, clear_cache=False, memory=True,
+               kwarg=(), compare=None, output=None, **options):
+        if repeat < 1:
+            raise CommandError("--repeat has to be at least 1")
+        samples = sample_kwargs()
+        for item in kwarg:
+            name, _, value = item.partition('=')
+            samples[name] = datetime.date.fromisoformat(value) if name.endswith('_date') else value
+        baseline = {}
+        if compare:
+            with open(compare) as file:
+                baseline = {result['name']: result for result in json.load(file)['results']}
+
+        client = Client()
+        results = []
+        for namespace in namespaces or ['orders', 'customers', 'products']:
+            for name, kwargs in url_names(namespace):
+                if name_filter not in name:
+                    continue
+                try:
+                    path = reverse(name, kwargs={key: samples[key] for key in kwargs})
+                except (KeyError, NoReverseMatch):
+                    self.stderr.write(f"{name}: skipped, no sample object for {', '.join(sorted(kwargs))}")
+                    continue
+                result = self.measure(client, name, path, repeat, warmup, clear_cache, memory)
+                if name in baseline:
+                    result['baseline'] = {key: baseline[name][key] for key in ['ms', 'queries', 'peak_memory_kb']
+                                          if key in baseline[name]}
+                results.append(result)
+                self.stderr.write(f"{name} {path}: {result['status']}, p50 {result['ms']['p50']} ms, "
+                                  f"{result['queries']} queries")
+
+        report = {
+            'meta': {
+                'started': datetime.datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'repeat': repeat,
+                'warmup': warmup,
+                'clear_cache': clear_cache,
+                'rows': {model._meta.label_lower: model.objects.count() for model in [
+                    customers.models.Customer, customers.models.Debit, products.models.Product,
+                    products.models.Price, models.Order, models.CustomerOrder, models.ProductOrder]},
+                'kwargs': {key: str(value) for key, value in samples.items()},
+            },
+            'results': results,
+        }
+        text = json.dumps(report, indent=2)
+        if output:
+            with open(output, 'w') as file:
+                file.write(text + '\n')
+        else:
+            self.stdout.write(text)
+
+    @staticmethod
+    def request(client, path):
+        """Response of a GET request, with streamed content read."""
+        response = client.get(path)
+        size = len(b''.join(response.streaming_content) if response.streaming else response.content)
+        return response, size
+
+    def measure(self, client, name, path, repeat, warmup, clear_cache, memory):
+        for _ in range(warmup):
+            self.request(client, path)
+        timings = []
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            for _ in range(repeat):
+                if clear_cache:
+                    cache.clear()
+                start = time.perf_counter()
+                response, size = self.request(client, path)
+                timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        result = {
+            'name': name,
+            'path': path,
+            'status': response.status_code,
+            'bytes': size,
+            'queries': round(counter.count / repeat, 1),
+            'ms': {
+                'min': round(timings[0], 3),
+                'p50': round(percentile(timings, 50), 3),
+                'p90': round(percentile(timings, 90), 3),
+                'p99': round(percentile(timings, 99), 3),
+                'max': round(timings[-1], 3),
+                'mean': round(sum(timings) / len(timings), 3),
+            },
+        }
+        if memory and not tracemalloc.is_tracing():
+            if clear_cache:
+                cache.clear()
+            tracemalloc.start()
+            try:
+                self.request(client, path)
+                result['peak_memory_kb'] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+            finally:
+                tracemalloc.stop()
+        return result
@@ -0,0 +1,31 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders import export, models
+
+
+class Command(BaseCommand):
+    help = "Export the customer × product grid of an order or of orders in a date range as CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--order', type=int, help="Primary key of the order to export")
+        parser.add_argument('--from', dest='date_from', type=datetime.date.fromisoformat,
+                            help="First order date to export, YYYY-MM-DD")
+        parser.add_argument('--to', dest='date_to', type=datetime.date.fromisoformat,
+                            help="Last order date to export, YYYY-MM-DD")
+        parser.add_argument('--output', help="File to write, standard output by default")
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help="Number of product orders fetched from the database at once")
+
+    def handle(self, *args, order=None, date_from=None, date_to=None, output=None, chunk_size=2000, **options):
+        if order is not None and not models.Order.objects.filter(pk=order).exists():
+            raise CommandError(f"Order {order} does not exist")
+        lines = export.export_csv(export.customer_orders(order=order, date_from=date_from, date_to=date_to),
+                                  chunk_size)
+        if output is None:
+            for line in lines:
+                self.stdout.write(line, ending='')
+        else:
+            with open(output, 'w', newline='', encoding='utf-8') as file:
+                file.writelines(lines)
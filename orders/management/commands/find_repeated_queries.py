@@ -0,0 +1,56 @@
+import json
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.urls import NoReverseMatch, reverse
+
+from helpers.queries import RepeatedQueries, format_report
+from orders.management.commands.bench import sample_kwargs, url_names
+
+
+class Command(BaseCommand):
+    help = "Request every page of the orders, customers and products URLs and report queries repeated " \
+           "with the same shape (N+1 queries); run it against gen_benchmark_data data"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--namespace', action='append', dest='namespaces',
+                            help="URL namespace to crawl, orders, customers and products by default")
+        parser.add_argument('--threshold', type=int, default=3,
+                            help="Number of queries of the same shape reported")
+        parser.add_argument('--json', action='store_true', dest='as_json', help="Write the report as JSON")
+        parser.add_argument('--fail', action='store_true', help="Exit with an error when repeated queries are found")
+
+    def handle(self, *args, namespaces=None, threshold=3, as_json=False, fail=False, **options):
+        samples = sample_kwargs()
+        client = Client()
+        reports = {}
+        for namespace in namespaces or ['orders', 'customers', 'products']:
+            for name, kwargs in url_names(namespace):
+                try:
+                    path = reverse(name, kwargs={key: samples[key] for key in kwargs})
+                except (KeyError, NoReverseMatch):
+                    self.stderr.write(f"{name}: skipped, no sample object for {', '.join(sorted(kwargs))}")
+                    continue
+                detector = RepeatedQueries(threshold)
+                with ExitStack() as stack:
+                    for connection in connections.all():
+                        stack.enter_context(connection.execute_wrapper(detector))
+                    response = client.get(path)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                report = detector.report()
+                if report:
+                    reports[name] = {'path': path, 'groups': report}
+
+        if as_json:
+            self.stdout.write(json.dumps(reports, indent=2))
+        else:
+            for name, report in reports.items():
+                self.stdout.write(f"{name} {report['path']}")
+                for line in format_report(report['groups']):
+                    self.stdout.write(f"  {line}")
+            self.stdout.write(f"{len(reports)} pages with repeated queries")
+        if fail and reports:
+            raise CommandError(f"Repeated queries on {', '.join(reports)}")
@@ -0,0 +1,133 @@
+import datetime
+import random
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+import customers.models
+import helpers.cache
+import products.models
+from customers import ledger
+from orders import models, totals
+from products import catalog
+
+
+@contextmanager
+def explicit_dates(*model_fields):
+    """Turn off ``auto_now_add`` of ``(model, field name)`` date fields, so bulk_create() keeps generated dates."""
+    fields = [model._meta.get_field(name) for model, name in model_fields]
+    saved = [field.auto_now_add for field in fields]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now_add in zip(fields, saved):
+            field.auto_now_add = auto_now_add
+
+
+class Command(BaseCommand):
+    help = "Fill the database with synthetic customers, products, prices, weekly orders and debits for benchmarks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=200)
+        parser.add_argument('--product-types', type=int, default=10)
+        parser.add_argument('--products', type=int, default=4, help="Products per product type")
+        parser.add_argument('--price-changes', type=int, default=3, help="Price changes per product")
+        parser.add_argument('--orders', type=int, default=100, help="Weekly orders, the last one is left unconfirmed")
+        parser.add_argument('--customers-per-order', type=float, default=0.6,
+                            help="Share of customers ordering in every order")
+        parser.add_argument('--lines', type=int, default=5, help="Products per customer order, at most")
+        parser.add_argument('--debits', type=int, default=10, help="Debits per customer")
+        parser.add_argument('--start', type=datetime.date.fromisoformat, default=datetime.date(2020, 1, 6),
+                            help="Date of the first order")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        start = options['start']
+        end = start + datetime.timedelta(weeks=max(options['orders'] - 1, 0))
+        with transaction.atomic(), \
+                explicit_dates((products.models.Price, 'date'), (customers.models.Debit, 'date')):
+            customer_ids = self.create_customers(options['customers'])
+            product_ids = self.create_products(options['product_types'], options['products'],
+                                               options['price_changes'], start, end)
+            order_ids = self.create_orders(options['orders'], start, customer_ids, product_ids,
+                                           options['customers_per_order'], options['lines'])
+            self.create_debits(customer_ids, options['debits'], start, end)
+            # bulk_create() skips the signals keeping totals and ledgers, so they are rebuilt at once
+            for index in range(0, len(order_ids), 100):
+                totals.rebuild(models.Order.objects.filter(pk__in=order_ids[index:index + 100]))
+            for customer in customers.models.Customer.objects.filter(pk__in=customer_ids):
+                ledger.rebuild(customer)
+            helpers.cache.invalidate(helpers.cache.tag(customers.models.Customer),
+                                     helpers.cache.tag(products.models.Price))
+            transaction.on_commit(catalog.bump)
+        self.stdout.write(f"Created {len(customer_ids)} customers, {len(product_ids)} products "
+                          f"and {len(order_ids)} orders from {start} to {end}")
+
+    def bulk_create(self, model, objs):
+        """Create rows, returns primary keys of the new rows, as bulk_create() does not set them on every database."""
+        previous = model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        model.objects.bulk_create(objs, batch_size=self.batch_size)
+        return list(model.objects.filter(pk__gt=previous).order_by('pk').values_list('pk', flat=True))
+
+    def create_customers(self, count):
+        first = customers.models.Customer.objects.count() + 1
+        return self.bulk_create(customers.models.Customer,
+                                [customers.models.Customer(name=f'bench-{number:06}')
+                                 for number in range(first, first + count)])
+
+    def create_products(self, type_count, product_count, price_changes, start, end):
+        first = products.models.ProductType.objects.count() + 1
+        type_ids = self.bulk_create(products.models.ProductType,
+                                    [products.models.ProductType(name=f'bench-{number}')
+                                     for number in range(first, first + type_count)])
+        product_ids = self.bulk_create(products.models.Product,
+                                       [products.models.Product(product_type_id=type_id, name=f'{number * 250} g')
+                                        for type_id in type_ids for number in range(1, product_count + 1)])
+        prices = []
+        days = (end - start).days
+        for product_id in product_ids:
+            price = self.random.randint(50, 500)
+            dates = {start - datetime.timedelta(days=7)}
+            dates.update(start + datetime.timedelta(days=self.random.randint(0, days)) for _ in range(price_changes))
+            for date in sorted(dates):
+                prices.append(products.models.Price(product_id=product_id, date=date, price=price))
+                price = max(1, price + self.random.randint(-50, 50))
+        self.bulk_create(products.models.Price, prices)
+        return product_ids
+
+    def create_orders(self, count, start, customer_ids, product_ids, customers_per_order, lines):
+        dates = [start + datetime.timedelta(weeks=week) for week in range(count)]
+        order_ids = self.bulk_create(models.Order, [models.Order(date=date) for date in dates])
+        ordering = min(len(customer_ids), round(len(customer_ids) * customers_per_order))
+        ordering = max(ordering, 1) if customer_ids else 0
+        customer_order_ids = self.bulk_create(models.CustomerOrder, [
+            models.CustomerOrder(order_id=order_id, customer_id=customer_id)
+            for order_id in order_ids for customer_id in sorted(self.random.sample(customer_ids, ordering))
+        ])
+        confirmed = set(models.CustomerOrder.objects.filter(pk__in=customer_order_ids)
+                        .exclude(order_id=order_ids[-1] if order_ids else None).values_list('pk', flat=True))
+        product_orders = []
+        for customer_order_id in customer_order_ids if product_ids else []:
+            for product_id in self.random.sample(product_ids, self.random.randint(1, min(lines, len(product_ids)))):
+                amount = self.random.randint(1, 10)
+                confirmed_amount = None
+                if customer_order_id in confirmed:
+                    confirmed_amount = amount if self.random.random() < 0.9 else self.random.randint(0, amount)
+                product_orders.append(models.ProductOrder(customerOrder_id=customer_order_id, product_id=product_id,
+                                                          amount=amount, confirmed_amount=confirmed_amount))
+        self.bulk_create(models.ProductOrder, product_orders)
+        return order_ids
+
+    def create_debits(self, customer_ids, count, start, end):
+        days = (end - start).days
+        self.bulk_create(customers.models.Debit, [
+            customers.models.Debit(customer_id=customer_id, date=start + datetime.timedelta(
+                days=self.random.randint(0, days)), amount=self.random.randint(1, 100) * 100)
+            for customer_id in customer_ids for _ in range(count)
+        ])
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.importer import FIELDS, OrderImporter, read
+
+
+class Command(BaseCommand):
+    help = f"Import order lines from a CSV or JSON file with {', '.join(FIELDS)} fields"
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="CSV file with a header row, or JSON list of objects")
+        parser.add_argument('--format', choices=['csv', 'json'],
+                            help="File format, guessed from the file name by default")
+        parser.add_argument('--dry-run', action='store_true', help="Check the file and roll everything back")
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Number of lines imported per transaction")
+
+    def handle(self, *args, file=None, format=None, dry_run=False, batch_size=5000, **options):
+        file_format = format or ('json' if file.lower().endswith('.json') else 'csv')
+        importer = OrderImporter(batch_size=batch_size, dry_run=dry_run)
+        try:
+            with open(file, encoding='utf-8-sig', newline='') as records:
+                importer.run(read(records, file_format))
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for number, message in importer.errors:
+            self.stderr.write(f"{file}:{number}: {message}")
+        self.stdout.write(f"{'Checked' if dry_run else 'Imported'} {importer.counts['lines']} lines, "
+                          f"{len(importer.errors)} errors")
+        for name, count in importer.summary():
+            self.stdout.write(f"{name}: {count}")
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from orders import models, totals
+
+
+class Command(BaseCommand):
+    help = "Recompute stored order and customer order totals from their line items"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help="Only report stored totals that differ from line items")
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help="Number of orders processed per transaction")
+
+    def handle(self, *args, verify=False, batch_size=100, **options):
+        order_ids = list(models.Order.objects.order_by('pk').values_list('pk', flat=True))
+        mismatches = []
+        for start in range(0, len(order_ids), batch_size):
+            with transaction.atomic():
+                batch = models.Order.objects.filter(pk__in=order_ids[start:start + batch_size])
+                mismatches.extend(totals.rebuild(batch, commit=not verify))
+
+        for obj, stored, expected in mismatches:
+            self.stdout.write(f"{obj}: stored {stored[0]}/{stored[1]}, expected {expected[0]}/{expected[1]}")
+        if verify and mismatches:
+            raise CommandError(f"{len(mismatches)} stored totals differ from line items")
+        self.stdout.write(f"{'Verified' if verify else 'Rebuilt'} totals of {len(order_ids)} orders, "
+                          f"{len(mismatches)} {'mismatched' if verify else 'fixed'}")
@@ -0,0 +1,88 @@
+import collections
+
+from django.utils.functional import cached_property
+
+import orders.models
+import products.models
+from helpers.tracing import traced
+from products.pricebook import PriceBook
+
+Cell = collections.namedtuple('Cell', ['amount', 'confirmed'])
+Row = collections.namedtuple('Row', ['customer', 'cells'])
+
+
+class OrderMatrix:
+    """Customer x product table of an order.
+
+    Amounts are kept in flat lists indexed by ``customer_index * len(products) + product_index``,
+    so the whole order is loaded with a fixed number of queries and rendered without per-cell lookups.
+    """
+
+    @traced('OrderMatrix')
+    def __init__(self, order, product_list=None, price_book=None):
+        self.order = order
+        if product_list is None:
+            product_list = products.models.Product.objects.select_related('product_type').order_by('pk')
+        self.products = list(product_list)
+        self._product_index = {product.pk: index for index, product in enumerate(self.products)}
+
+        customer_orders = list(order.customers.select_related('customer').order_by('pk'))
+        self.customers = [customer_order.customer for customer_order in customer_orders]
+        customer_index = {customer_order.pk: index for index, customer_order in enumerate(customer_orders)}
+
+        width = len(self.products)
+        self._amounts = [None] * (len(self.customers) * width)
+        self._confirmed = [None] * (len(self.customers) * width)
+        self.amount_totals = [0] * width
+        self.confirmed_totals = [0] * width
+
+        product_orders = orders.models.ProductOrder.objects.filter(customerOrder__order=order).values_list(
+            'customerOrder_id', 'product_id', 'amount', 'confirmed_amount')
+        for customer_order_id, product_id, amount, confirmed in product_orders:
+            product_index = self._product_index.get(product_id)
+            if product_index is None:
+                continue
+            cell = customer_index[customer_order_id] * width + product_index
+            self._amounts[cell] = amount
+            self._confirmed[cell] = confirmed
+            self.amount_totals[product_index] += amount or 0
+            self.confirmed_totals[product_index] += confirmed or 0
+
+        self._price_book = price_book
+
+    @cached_property
+    def prices(self):
+        price_book = self._price_book
+        if price_book is None:
+            price_book = PriceBook(self.products)
+        return [price_book.price(product.pk, self.order.date) for product in self.products]
+
+    def cell(self, customer_index, product_index):
+        index = customer_index * len(self.products) + product_index
+        return Cell(self._amounts[index] or None, self._confirmed[index])
+
+    @property
+    def rows(self):
+        width = len(self.products)
+        for customer_index, customer in enumerate(self.customers):
+            start = customer_index * width
+            yield Row(customer, [Cell(amount or None, confirmed) for amount, confirmed in
+                                 zip(self._amounts[start:start + width], self._confirmed[start:start + width])])
+
+    @property
+    def footer(self):
+        return [Cell(amount, confirmed) for amount, confirmed in zip(self.amount_totals, self.confirmed_totals)]
+
+    @property
+    def message(self):
+        product_types = {}
+        for product, amount in zip(self.products, self.amount_totals):
+            if amount:
+                product_types.setdefault(product.product_type, []).append((product, amount))
+        return sorted(product_types.items(), key=lambda item: item[0].pk)
+
+    def order_cost(self):
+        return sum(amount * price for amount, price in zip(self.amount_totals, self.prices))
+
+    def confirmed_cost(self):
+        return sum(amount * price for amount, price in zip(self.confirmed_totals, self.prices))
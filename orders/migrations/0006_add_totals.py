@@ -0,0 +1,75 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:51
+
+import bisect
+
+from django.db import migrations, models
+
+
+def fill_totals(apps, schema_editor):
+    Price = apps.get_model('products', 'Price')
+    Order = apps.get_model('orders', 'Order')
+    CustomerOrder = apps.get_model('orders', 'CustomerOrder')
+    ProductOrder = apps.get_model('orders', 'ProductOrder')
+
+    timelines = {}
+    for product_id, date, price in Price.objects.order_by('product_id', 'date', 'pk') \
+            .values_list('product_id', 'date', 'price'):
+        dates, prices = timelines.setdefault(product_id, ([], []))
+        dates.append(date)
+        prices.append(price)
+
+    def price_at(product_id, date):
+        dates, prices = timelines.get(product_id, ([], []))
+        index = bisect.bisect_right(dates, date)
+        return prices[index - 1] if index else 0
+
+    customer_totals = {}
+    for customer_order_id, product_id, date, amount, confirmed_amount in ProductOrder.objects.values_list(
+            'customerOrder_id', 'product_id', 'customerOrder__order__date', 'amount', 'confirmed_amount'):
+        price = price_at(product_id, date)
+        totals = customer_totals.setdefault(customer_order_id, [0, 0])
+        totals[0] += (amount or 0) * price
+        totals[1] += (confirmed_amount or 0) * price
+
+    order_totals = {}
+    for customer_order in CustomerOrder.objects.all():
+        customer_order.order_total, customer_order.confirmed_total = customer_totals.get(customer_order.pk, (0, 0))
+        customer_order.save(update_fields=['order_total', 'confirmed_total'])
+        totals = order_totals.setdefault(customer_order.order_id, [0, 0])
+        totals[0] += customer_order.order_total
+        totals[1] += customer_order.confirmed_total
+    for order in Order.objects.all():
+        order.order_total, order.confirmed_total = order_totals.get(order.pk, (0, 0))
+        order.save(update_fields=['order_total', 'confirmed_total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_make_amount_nullable'),
+        ('products', '0003_add_ordering'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customerorder',
+            name='confirmed_total',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Окончательная сумма'),
+        ),
+        migrations.AddField(
+            model_name='customerorder',
+            name='order_total',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Предварительная сумма'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='confirmed_total',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Окончательная сумма'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='order_total',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Предварительная сумма'),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
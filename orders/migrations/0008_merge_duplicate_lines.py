@@ -0,0 +1,119 @@
+import bisect
+
+from django.core.cache import cache
+from django.db import migrations
+from django.db.models import Count, Min
+from django.utils import timezone
+
+
+def add(first, second):
+    return first if second is None else second if first is None else first + second
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    """Merge customer orders of a customer repeated on an order, then product orders of a product repeated
+    on a customer order, summing their amounts, and recompute the totals and ledgers they changed.
+    """
+    Price = apps.get_model('products', 'Price')
+    Order = apps.get_model('orders', 'Order')
+    CustomerOrder = apps.get_model('orders', 'CustomerOrder')
+    ProductOrder = apps.get_model('orders', 'ProductOrder')
+    Customer = apps.get_model('customers', 'Customer')
+    Debit = apps.get_model('customers', 'Debit')
+    LedgerEntry = apps.get_model('customers', 'LedgerEntry')
+
+    changed = set()
+    duplicates = CustomerOrder.objects.order_by().values('order_id', 'customer_id') \
+        .annotate(count=Count('pk'), first=Min('pk')).filter(count__gt=1)
+    for duplicate in duplicates:
+        merged = CustomerOrder.objects.filter(order_id=duplicate['order_id'], customer_id=duplicate['customer_id']) \
+            .exclude(pk=duplicate['first'])
+        ProductOrder.objects.filter(customerOrder__in=merged).update(customerOrder_id=duplicate['first'])
+        merged.delete()
+        changed.add(duplicate['first'])
+
+    duplicates = ProductOrder.objects.order_by().values('customerOrder_id', 'product_id') \
+        .annotate(count=Count('pk'), first=Min('pk')).filter(count__gt=1)
+    for duplicate in duplicates:
+        lines = list(ProductOrder.objects.filter(customerOrder_id=duplicate['customerOrder_id'],
+                                                 product_id=duplicate['product_id']).order_by('pk'))
+        first = lines[0]
+        for line in lines[1:]:
+            first.amount = add(first.amount, line.amount)
+            first.confirmed_amount = add(first.confirmed_amount, line.confirmed_amount)
+        first.save(update_fields=['amount', 'confirmed_amount'])
+        ProductOrder.objects.filter(pk__in=[line.pk for line in lines[1:]]).delete()
+        changed.add(duplicate['customerOrder_id'])
+
+    if not changed:
+        return
+
+    timelines = {}
+    for product_id, date, price in Price.objects.order_by('product_id', 'date', 'pk') \
+            .values_list('product_id', 'date', 'price'):
+        dates, prices = timelines.setdefault(product_id, ([], []))
+        if dates and dates[-1] == date:
+            prices[-1] = price
+        else:
+            dates.append(date)
+            prices.append(price)
+
+    def price_at(product_id, date):
+        dates, prices = timelines.get(product_id, ([], []))
+        index = bisect.bisect_right(dates, date)
+        return prices[index - 1] if index else 0
+
+    customer_orders = list(CustomerOrder.objects.filter(pk__in=changed).select_related('order'))
+    for customer_order in customer_orders:
+        customer_order.order_total = customer_order.confirmed_total = 0
+        for product_id, amount, confirmed_amount in ProductOrder.objects.filter(customerOrder=customer_order) \
+                .values_list('product_id', 'amount', 'confirmed_amount'):
+            price = price_at(product_id, customer_order.order.date)
+            customer_order.order_total += (amount or 0) * price
+            customer_order.confirmed_total += (confirmed_amount or 0) * price
+        customer_order.save(update_fields=['order_total', 'confirmed_total'])
+    changed_orders = Order.objects.filter(customers__in=changed).distinct()
+    for order in changed_orders:
+        order.order_total = order.confirmed_total = 0
+        for order_total, confirmed_total in CustomerOrder.objects.filter(order=order) \
+                .values_list('order_total', 'confirmed_total'):
+            order.order_total += order_total
+            order.confirmed_total += confirmed_total
+        order.save(update_fields=['order_total', 'confirmed_total'])
+
+    # ledgers of the customers, written again as customers.ledger.rebuild() does
+    customer_ids = {customer_order.customer_id for customer_order in customer_orders}
+    for customer_id in customer_ids:
+        rows = [(date, 0, pk, None, amount) for pk, date, amount in Debit.objects.filter(customer_id=customer_id)
+                .values_list('pk', 'date', 'amount')]
+        rows.extend((date, 1, None, pk, -total) for pk, date, total in CustomerOrder.objects
+                    .filter(customer_id=customer_id).exclude(confirmed_total=0)
+                    .values_list('pk', 'order__date', 'confirmed_total'))
+        rows.sort(key=lambda row: (row[0], row[1], row[2] or 0, row[3] or 0))
+        LedgerEntry.objects.filter(customer_id=customer_id).delete()
+        balance = 0
+        entries = []
+        for date, kind, debit_id, customer_order_id, amount in rows:
+            balance += amount
+            entries.append(LedgerEntry(customer_id=customer_id, date=date, kind=kind, debit_id=debit_id,
+                                       customer_order_id=customer_order_id, amount=amount, balance=balance))
+        LedgerEntry.objects.bulk_create(entries)
+
+    # pages of the merged rows are validated by these stamps and cached under tags of models not loaded here
+    now = timezone.now()
+    Order.objects.filter(pk__in=[order.pk for order in changed_orders]).update(updated_at=now)
+    Customer.objects.filter(pk__in=customer_ids).update(updated_at=now)
+    cache.clear()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_add_updated_at'),
+        ('products', '0005_merge_duplicate_prices'),
+        ('customers', '0004_add_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_merge_duplicate_lines'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['date'], name='order_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='customerorder',
+            constraint=models.UniqueConstraint(fields=('order', 'customer'), name='customerorder_customer_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='productorder',
+            constraint=models.UniqueConstraint(fields=('customerOrder', 'product'), name='productorder_product_unique'),
+        ),
+    ]
@@ -1,75 +1,266 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncMonth
 
 import products.models
 # Create your models here.
 from customers.models import Customer
 from helpers import models as helpers_models
+from products.pricebook import PriceBook
 
 
-class Order(helpers_models.BrowseableObjectModel):
+class OrderQuerySet(models.QuerySet):
+    def archive(self):
+        """Months with orders, newest first, with the ``count``, ``order_total`` and ``confirmed_total`` of their orders."""
+        return self.order_by().annotate(month=TruncMonth('date')).values('month') \
+            .annotate(count=Count('pk'), order_total=Sum('order_total'), confirmed_total=Sum('confirmed_total')) \
+            .order_by('-month')
+
+    def with_costs(self):
+        """Annotate ``priced_order_total`` and ``priced_confirmed_total``, see ``ProductOrderQuerySet.costs()``."""
+        return self.annotate(**ProductOrder.objects.filter(customerOrder__order=OuterRef('pk'))
+                             .costs('customerOrder__order'))
+
+
+class Order(helpers_models.AtomicSaveMixin, helpers_models.UpdatedAtModel, helpers_models.BrowseableObjectModel):
     date = models.DateField(verbose_name="Дата заказа")
+    order_total = models.IntegerField(verbose_name="Предварительная сумма", default=0, editable=False)
+    confirmed_total = models.IntegerField(verbose_name="Окончательная сумма", default=0, editable=False)
+
+    objects = OrderQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_date = instance.__dict__.get('date')
+        return instance
+
+    def _cost(self, field, price_book=None):
+        if price_book is None:
+            price_book = PriceBook(ProductOrder.objects.filter(customerOrder__order=self).values('product_id'))
+        customer_orders = self.customers.prefetch_related('product_orders')
+        return sum(getattr(customer_order, field)(price_book) for customer_order in customer_orders)
+
+    def order_cost(self, price_book=None):
+        return self._cost("order_cost", price_book)
+
+    def confirmed_cost(self, price_book=None):
+        return self._cost("confirmed_cost", price_book)
+
+    def delete(self, *args, **kwargs):
+        from orders import totals
 
-    def order_cost(self):
-        cost = 0
-        for customer in self.customers.all():
-            cost += customer.order_cost()
-        return cost
+        # product orders and customer orders deleted with it refresh totals and ledgers once
+        with transaction.atomic(), totals.batch():
+            return super().delete(*args, **kwargs)
 
-    def confirmed_cost(self):
-        cost = 0
-        for customer in self.customers.all():
-            cost += customer.confirmed_cost()
-        return cost
+    def save_amounts(self, changes):
+        """Apply ``{customer_id: {product_id: {amount field: value}}}`` to the customer orders of the order
+        with bulk statements.
+
+        Customer orders are created for customers given a positive amount and deleted when no product order is left.
+        Returns the customer orders of ``changes`` left, by customer id.
+        """
+        from orders import totals
+
+        with transaction.atomic(), totals.batch():
+            customer_orders = {customer_order.customer_id: customer_order
+                               for customer_order in self.customers.prefetch_related('product_orders')}
+            missing = [customer_id for customer_id, amounts in changes.items() if customer_id not in customer_orders
+                       and any(value for values in amounts.values() for value in values.values())]
+            if missing:
+                # customer orders created meanwhile by another request are left as they are and loaded below
+                CustomerOrder.objects.bulk_create([CustomerOrder(order=self, customer_id=customer_id)
+                                                   for customer_id in missing], ignore_conflicts=True)
+                created = self.customers.filter(customer_id__in=missing).prefetch_related('product_orders')
+                customer_orders.update((customer_order.customer_id, customer_order) for customer_order in created)
+            left = CustomerOrder.save_many_amounts({customer_orders[customer_id]: amounts
+                                                    for customer_id, amounts in changes.items()
+                                                    if customer_id in customer_orders})
+            emptied = [pk for pk, count in left.items() if count == 0]
+            if emptied:
+                CustomerOrder.objects.filter(pk__in=emptied).delete()
+        return {customer_id: customer_order for customer_id, customer_order in customer_orders.items()
+                if customer_id in changes and customer_order.pk not in emptied}
 
     def get_confirm_url(self):
         return self.get_absolute_url('confirm')
 
+    def get_export_url(self):
+        return self.get_absolute_url('export')
+
     class Meta:
         get_latest_by = 'date'
         ordering = ['date']
+        indexes = [
+            models.Index(fields=['date'], name='order_date_idx'),
+        ]
 
     def __str__(self):
         return "Заказ {self.date:%Y-%m-%d}".format(self=self)
 
 
-class CustomerOrder(models.Model):
+class CustomerOrderQuerySet(models.QuerySet):
+    def with_costs(self):
+        """Annotate ``priced_order_total`` and ``priced_confirmed_total``, see ``ProductOrderQuerySet.costs()``."""
+        return self.annotate(**ProductOrder.objects.filter(customerOrder=OuterRef('pk')).costs('customerOrder'))
+
+
+class CustomerOrder(helpers_models.AtomicSaveMixin, models.Model):
     order = models.ForeignKey(to=Order, on_delete=models.CASCADE, verbose_name="Заказ", related_name="customers")
     customer = models.ForeignKey(to=Customer, on_delete=models.CASCADE, verbose_name="Покупатель",
                                  related_name='orders')
+    order_total = models.IntegerField(verbose_name="Предварительная сумма", default=0, editable=False)
+    confirmed_total = models.IntegerField(verbose_name="Окончательная сумма", default=0, editable=False)
+
+    objects = CustomerOrderQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_customer_id = instance.__dict__.get('customer_id')
+        return instance
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'customer'], name='customerorder_customer_unique'),
+        ]
 
     def __str__(self):
         return f"{self.order} for {self.customer}"
 
-    def _cost(self, field):
-        return sum((getattr(product_order, field)() for product_order in self.product_orders.all()))
+    def delete(self, *args, **kwargs):
+        from orders import totals
+
+        # product orders and customer orders deleted with it refresh totals and ledgers once
+        with transaction.atomic(), totals.batch():
+            return super().delete(*args, **kwargs)
+
+    def _cost(self, field, price_book=None):
+        product_orders = list(self.product_orders.all())
+        if price_book is None:
+            price_book = PriceBook({product_order.product_id for product_order in product_orders})
+        return sum((getattr(product_order, field)(price_book) for product_order in product_orders))
+
+    def confirmed_cost(self, price_book=None):
+        return self._cost("confirmed_cost", price_book)
+
+    def order_cost(self, price_book=None):
+        return self._cost("order_cost", price_book)
+
+    def save_amounts(self, amounts, amount_field='amount'):
+        """Apply ``{product_id: value}`` to ``amount_field`` of the product orders with bulk statements.
+
+        Positive values create or update product orders, other values are only set on existing ones,
+        and product orders left with neither amount are deleted. Returns the number of product orders left.
+        """
+        changes = {product_id: {amount_field: value} for product_id, value in amounts.items()}
+        return self.save_many_amounts({self: changes})[self.pk]
+
+    @staticmethod
+    def save_many_amounts(changes):
+        """save_amounts() of several customer orders in one set of bulk statements.
+
+        ``changes`` is ``{customer_order: {product_id: {amount field: value}}}``, product orders are read
+        from ``customer_order.product_orders.all()``, so prefetch them. Returns the number of product orders
+        left by customer order pk.
+        """
+        from orders import totals
 
-    def confirmed_cost(self):
-        return self._cost("confirmed_cost")
+        created, updated, deleted = [], [], []
+        fields = set()
+        changed = set()
+        left = {}
+        for customer_order, amounts in changes.items():
+            existing = {product_order.product_id: product_order
+                        for product_order in customer_order.product_orders.all()}
+            left[customer_order.pk] = len(existing)
+            for product_id, values in amounts.items():
+                product_order = existing.get(product_id)
+                if product_order is None:
+                    values = {field: value for field, value in values.items() if value and value > 0}
+                    if values:
+                        created.append(ProductOrder(customerOrder=customer_order, product_id=product_id, **values))
+                        changed.add(customer_order)
+                        left[customer_order.pk] += 1
+                    continue
+                values = {field: value for field, value in values.items() if getattr(product_order, field) != value}
+                if not values:
+                    continue
+                for field, value in values.items():
+                    setattr(product_order, field, value)
+                changed.add(customer_order)
+                if product_order.amount is None and product_order.confirmed_amount is None:
+                    deleted.append(product_order.pk)
+                    left[customer_order.pk] -= 1
+                else:
+                    updated.append(product_order)
+                    fields.update(values)
 
-    def order_cost(self):
-        return self._cost("order_cost")
+        if changed:
+            with transaction.atomic(), totals.batch():
+                ProductOrder.objects.bulk_create(created)
+                if updated:
+                    ProductOrder.objects.bulk_update(updated, sorted(fields))
+                if deleted:
+                    ProductOrder.objects.filter(pk__in=deleted).delete()
+                totals.customer_orders_changed([customer_order.pk for customer_order in changed])
+            for customer_order in changed:
+                getattr(customer_order, '_prefetched_objects_cache', {}).pop('product_orders', None)
+        return left
 
 
-class ProductOrder(models.Model):
+class ProductOrderQuerySet(models.QuerySet):
+    def with_price(self):
+        """Annotate ``price``: the price of the product on the date of its order, as PriceBook finds it, in SQL."""
+        prices = products.models.Price.objects \
+            .filter(product=OuterRef('product'), date__lte=OuterRef('customerOrder__order__date')) \
+            .order_by('-date', '-pk').values('price')[:1]
+        return self.annotate(price=Coalesce(Subquery(prices), 0))
+
+    def costs(self, group_by):
+        """Subqueries of the ordered and confirmed costs of the product orders summed by ``group_by``.
+
+        Returns ``{'priced_order_total': ..., 'priced_confirmed_total': ...}`` for ``annotate()`` of the queryset
+        the product orders are filtered against with ``OuterRef``, 0 where there are no product orders.
+        """
+        lines = self.with_price().order_by().values(group_by)
+        ordered = lines.annotate(total=Sum(Coalesce('amount', 0) * F('price'))).values('total')
+        confirmed = lines.annotate(total=Sum(Coalesce('confirmed_amount', 0) * F('price'))).values('total')
+        return {'priced_order_total': Coalesce(Subquery(ordered), 0),
+                'priced_confirmed_total': Coalesce(Subquery(confirmed), 0)}
+
+
+class ProductOrder(helpers_models.AtomicSaveMixin, models.Model):
     customerOrder = models.ForeignKey(to=CustomerOrder, on_delete=models.CASCADE, related_name='product_orders')
     product = models.ForeignKey(to=products.models.Product, on_delete=models.CASCADE,
                                 verbose_name="Продукция", related_name='+')
     amount = models.PositiveSmallIntegerField(verbose_name="Количество", null=True)
     confirmed_amount = models.PositiveSmallIntegerField(verbose_name="Подтвержденное количество", null=True)
 
+    objects = ProductOrderQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_customer_order_id = instance.__dict__.get('customerOrder_id')
+        return instance
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['customerOrder', 'product'], name='productorder_product_unique'),
+        ]
+
     def __str__(self):
         return f"{self.customerOrder}:{self.product.name} ({self.amount}/{self.confirmed_amount})"
 
-    def _price(self):
-        query = self.product.prices.filter(date__lte=self.customerOrder.order.date)
-        try:
-            price_obj = query.latest()
-        except products.models.Price.DoesNotExist:
-            return 0
-        return price_obj.price
+    def _price(self, price_book=None):
+        if price_book is None:
+            price_book = PriceBook([self.product_id])
+        return price_book.price(self.product_id, self.customerOrder.order.date)
 
-    def order_cost(self):
-        return (self.amount or 0) * self._price()
+    def order_cost(self, price_book=None):
+        return (self.amount or 0) * self._price(price_book)
 
-    def confirmed_cost(self):
-        return (self.confirmed_amount or 0) * self._price()
+    def confirmed_cost(self, price_book=None):
+        return (self.confirmed_amount or 0) * self._price(price_book)
@@ -0,0 +1,74 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+import customers.models
+import helpers.cache
+import products.models
+from customers import ledger
+from orders import models, totals
+
+
+@receiver([post_save, post_delete], sender=models.ProductOrder)
+def product_order_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    customer_order_ids = [instance.customerOrder_id]
+    loaded_customer_order_id = getattr(instance, 'loaded_customer_order_id', None)
+    if loaded_customer_order_id not in (None, instance.customerOrder_id):
+        # moved to another customer order, the one it left is refreshed too
+        customer_order_ids.append(loaded_customer_order_id)
+    totals.customer_orders_changed(customer_order_ids)
+    instance.loaded_customer_order_id = instance.customerOrder_id
+
+
+@receiver(post_save, sender=models.CustomerOrder)
+def customer_order_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if not created and instance.customer_id != getattr(instance, 'loaded_customer_id', instance.customer_id):
+        # the charge moves to the new customer, both ledgers are rebalanced
+        ledger.record_customer_orders([instance])
+        totals.touch_orders([instance.order_id])
+    instance.loaded_customer_id = instance.customer_id
+
+
+@receiver(post_delete, sender=models.CustomerOrder)
+def customer_order_deleted(sender, instance, **kwargs):
+    totals.customer_orders_deleted([instance])
+
+
+@receiver(post_save, sender=models.Order)
+def order_saved(sender, instance, created, raw=False, **kwargs):
+    helpers.cache.invalidate(helpers.cache.tag(models.Order, instance.pk))
+    if raw:
+        return
+    if not created and instance.date != getattr(instance, 'loaded_date', instance.date):
+        totals.refresh_customer_orders(instance.customers.all())
+    instance.loaded_date = instance.date
+
+
+@receiver(post_delete, sender=models.Order)
+def order_deleted(sender, instance, **kwargs):
+    helpers.cache.invalidate(helpers.cache.tag(models.Order, instance.pk))
+
+
+@receiver(post_save, sender=customers.models.Customer)
+def customer_saved(sender, instance, **kwargs):
+    # customer names are shown on the pages of their orders
+    totals.touch_orders(list(models.CustomerOrder.objects.filter(customer=instance).values_list('order_id', flat=True)))
+
+
+@receiver(post_save, sender=products.models.Price)
+def price_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    dates = [instance.date]
+    if getattr(instance, 'loaded_date', None) is not None:
+        dates.append(instance.loaded_date)
+    totals.refresh_price_change(instance.product_id, *dates)
+    instance.loaded_date = instance.date
+
+
+@receiver(post_delete, sender=products.models.Price)
+def price_deleted(sender, instance, **kwargs):
+    totals.refresh_price_change(instance.product_id, instance.date)
@@ -0,0 +1,190 @@
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+import orders.models
+from helpers.views import JsonError, select_fields
+from orders.api import ORDER_FIELDS
+from products import catalog
+
+
+class SelectFieldsTestCase(TestCase):
+    def test_nested(self):
+        self.assertEqual({'id': None, 'customers': {'customer': None, 'product_orders': {'amount': None}}},
+                         select_fields('id, customers.customer,customers.product_orders.amount', ORDER_FIELDS))
+
+    def test_whole_nested_object(self):
+        self.assertIs(ORDER_FIELDS['customers'],
+                      select_fields('customers,customers.customer', ORDER_FIELDS)['customers'])
+        self.assertIs(ORDER_FIELDS['customers'],
+                      select_fields('customers.customer,customers', ORDER_FIELDS)['customers'])
+
+    def test_unknown(self):
+        for value in ['name', 'id.name', 'customers.name']:
+            with self.subTest(value=value), self.assertRaises(JsonError):
+                select_fields(value, ORDER_FIELDS)
+
+
+class OrderApiTestCase(TestCase):
+    fixtures = ['test_products', 'test_customers', 'test_orders']
+
+    def setUp(self):
+        catalog.bump()
+        call_command('rebuild_totals', stdout=StringIO())
+
+    def post(self, url, data, method='post'):
+        return getattr(self.client, method)(url, json.dumps(data), content_type='application/json')
+
+    def test_list(self):
+        orders.models.Order.objects.create(date='2001-01-14')
+        response = self.client.get(reverse('orders:api-orders'))
+        self.assertEqual(200, response.status_code)
+        results = response.json()['results']
+        self.assertEqual(['2001-01-14', '2001-01-07'], [order['date'] for order in results])
+        self.assertEqual({'id', 'date', 'order_total', 'confirmed_total', 'url'}, results[1].keys())
+        self.assertEqual(100 + 400 + 2 * 200 + 2 * 300, results[1]['order_total'])
+
+    def test_list_pages(self):
+        orders.models.Order.objects.create(date='2001-01-14')
+        first = self.client.get(reverse('orders:api-orders'), {'limit': 1, 'fields': 'date'}).json()
+        self.assertEqual([{'date': '2001-01-14'}], first['results'])
+        second = self.client.get(reverse('orders:api-orders'), {'limit': 1, 'after': first['next']}).json()
+        self.assertEqual(['2001-01-07'], [order['date'] for order in second['results']])
+        self.assertIsNone(second['next'])
+        self.assertEqual(400, self.client.get(reverse('orders:api-orders'), {'limit': 1000}).status_code)
+
+    def test_detail(self):
+        response = self.client.get(reverse('orders:api-order', args=[1]))
+        data = response.json()
+        self.assertEqual([1, 2], [customer_order['customer'] for customer_order in data['customers']])
+        self.assertEqual([{'id': 1, 'product': 1, 'amount': 1, 'confirmed_amount': None},
+                          {'id': 2, 'product': 4, 'amount': 1, 'confirmed_amount': None}],
+                         data['customers'][0]['product_orders'])
+        self.assertEqual('user1', data['customers'][0]['customer_name'])
+        self.assertEqual(304, self.client.get(reverse('orders:api-order', args=[1]),
+                                              HTTP_IF_NONE_MATCH=response['ETag']).status_code)
+
+    def test_sparse_fields_queries(self):
+        url = reverse('orders:api-order', args=[1])
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, {'fields': 'date'})
+        sparse = len(context)
+        self.assertEqual({'date': '2001-01-07'}, response.json())
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url, {'fields': 'customers.customer'})
+        self.assertEqual(sparse + 1, len(context))
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        self.assertEqual(sparse + 2, len(context))
+
+    def test_not_found(self):
+        response = self.client.get(reverse('orders:api-order', args=[100]))
+        self.assertEqual(404, response.status_code)
+        self.assertIn('errors', response.json())
+
+    def test_batch_amounts(self):
+        response = self.post(reverse('orders:api-order-amounts', args=[1]), {
+            'amounts': {'1': {'1': 3, '4': None}, '2': {'2': None, '3': None}},
+            'confirmed_amounts': {'1': {'4': None}},
+        })
+        self.assertEqual(200, response.status_code, response.content)
+        data = response.json()
+        self.assertEqual([1], [customer_order['customer'] for customer_order in data['customers']])
+        self.assertEqual({1: (3, None)}, {product_order['product']: (product_order['amount'],
+                                                                        product_order['confirmed_amount'])
+                                          for product_order in data['customers'][0]['product_orders']})
+        self.assertEqual(300, data['order_total'])
+        self.assertFalse(orders.models.CustomerOrder.objects.filter(customer_id=2).exists())
+
+    def test_batch_creates_customer_orders(self):
+        order = orders.models.Order.objects.create(date='2001-01-14')
+        response = self.post(reverse('orders:api-order-amounts', args=[order.pk]) + '?fields=order_total',
+                             {'amounts': {'1': {'1': 1, '2': 0}, '2': {'3': 2}}})
+        self.assertEqual({'order_total': 100 + 2 * 300}, response.json())
+        self.assertEqual(2, order.customers.count())
+
+    def test_batch_statements(self):
+        order = orders.models.Order.objects.create(date='2001-01-14')
+        with CaptureQueriesContext(connection) as context:
+            self.post(reverse('orders:api-order-amounts', args=[order.pk]) + '?fields=id',
+                      {'amounts': {'1': {'1': 1, '2': 1, '3': 1, '4': 1}, '2': {'1': 1, '2': 1, '3': 1, '4': 1}}})
+        inserts = [query['sql'] for query in context.captured_queries
+                   if query['sql'].startswith('INSERT INTO "orders_productorder"')]
+        self.assertEqual(1, len(inserts))
+
+    def test_batch_invalid(self):
+        response = self.post(reverse('orders:api-order-amounts', args=[1]), {
+            'amounts': {'1': {'1': 3, '9': 1, '2': -1, '3': 'x'}, '7': {'1': 1}, 'x': {}},
+        })
+        self.assertEqual(400, response.status_code)
+        self.assertEqual({'amounts.1.9', 'amounts.1.2', 'amounts.1.3', 'amounts.7', 'amounts.x'},
+                         response.json()['errors'].keys())
+        self.assertEqual(1, orders.models.ProductOrder.objects.get(pk=1).amount)
+
+    def test_invalid_json(self):
+        response = self.client.post(reverse('orders:api-order-amounts', args=[1]), 'amounts',
+                                    content_type='application/json')
+        self.assertEqual(400, response.status_code)
+
+    def test_create(self):
+        response = self.post(reverse('orders:api-orders'), {'date': '2001-01-14', 'amounts': {'2': {'1': 1}}})
+        self.assertEqual(201, response.status_code)
+        data = response.json()
+        self.assertEqual(100, data['order_total'])
+        self.assertEqual('2001-01-14', orders.models.Order.objects.get(pk=data['id']).date.isoformat())
+        self.assertEqual(400, self.post(reverse('orders:api-orders'), {'date': 'today'}).status_code)
+
+    def test_create_invalid_amounts_rolled_back(self):
+        response = self.post(reverse('orders:api-orders'), {'date': '2001-01-14', 'amounts': {'2': {'9': 1}}})
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(1, orders.models.Order.objects.count())
+
+    def test_delete(self):
+        response = self.client.delete(reverse('orders:api-order', args=[1]))
+        self.assertEqual(204, response.status_code)
+        self.assertFalse(orders.models.Order.objects.exists())
+
+    def test_customer_order(self):
+        url = reverse('orders:api-customer-order', args=[1, 2])
+        self.assertEqual({'customer': 2, 'order_total': 1000},
+                         self.client.get(url, {'fields': 'customer,order_total'}).json())
+        response = self.post(url, {'confirmed_amounts': {'2': 1}}, method='patch')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(200, response.json()['confirmed_total'])
+        response = self.post(url, {'amounts': {'2': None, '3': None},
+                                   'confirmed_amounts': {'2': None, '3': None}}, method='patch')
+        self.assertEqual(204, response.status_code)
+        self.assertEqual(404, self.client.get(url).status_code)
+
+    def test_token_required(self):
+        self.client = self.client_class(enforce_csrf_checks=True)
+        url = reverse('orders:api-order-amounts', args=[1])
+        self.assertEqual(403, self.post(url, {'amounts': {'1': {'1': 2}}}).status_code)
+        self.assertEqual(403, self.client.delete(reverse('orders:api-order', args=[1])).status_code)
+        self.assertEqual(1, orders.models.ProductOrder.objects.get(pk=1).amount)
+        with override_settings(API_TOKEN='api-token'):
+            self.assertEqual(403, self.client.post(url, json.dumps({'amounts': {'1': {'1': 2}}}),
+                                                   content_type='application/json',
+                                                   HTTP_AUTHORIZATION='Bearer other-token').status_code)
+            response = self.client.post(url, json.dumps({'amounts': {'1': {'1': 2}}}),
+                                        content_type='application/json', HTTP_AUTHORIZATION='Bearer api-token')
+        self.assertEqual(200, response.status_code)
+
+    def test_csrf_token(self):
+        self.client = self.client_class(enforce_csrf_checks=True)
+        self.client.get(reverse('orders:create'))
+        response = self.client.post(reverse('orders:api-order-amounts', args=[1]),
+                                    json.dumps({'amounts': {'1': {'1': 2}}}), content_type='application/json',
+                                    HTTP_X_CSRFTOKEN=self.client.cookies['csrftoken'].value)
+        self.assertEqual(200, response.status_code)
+
+    def test_json_content_type_required(self):
+        response = self.client.post(reverse('orders:api-order-amounts', args=[1]),
+                                    json.dumps({'amounts': {'1': {'1': 2}}}), content_type='text/plain')
+        self.assertEqual(415, response.status_code)
+        self.assertEqual(1, orders.models.ProductOrder.objects.get(pk=1).amount)
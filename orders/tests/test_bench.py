@@ -0,0 +1,78 @@
+import datetime
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+import customers.models
+import orders.models
+import products.models
+
+
+class GenBenchmarkDataTestCase(TestCase):
+    def generate(self, **options):
+        call_command('gen_benchmark_data', customers=6, product_types=2, products=2, orders=4, debits=2,
+                     stdout=StringIO(), **options)
+
+    def test_counts(self):
+        self.generate()
+        self.assertEqual(6, customers.models.Customer.objects.count())
+        self.assertEqual(4, products.models.Product.objects.count())
+        self.assertEqual(4, orders.models.Order.objects.count())
+        self.assertEqual(12, customers.models.Debit.objects.count())
+        # every order has 60% of the customers
+        self.assertEqual(4 * 4, orders.models.CustomerOrder.objects.count())
+        # the last order is not confirmed yet
+        self.assertFalse(orders.models.ProductOrder.objects.filter(
+            customerOrder__order=orders.models.Order.objects.latest(), confirmed_amount__isnull=False).exists())
+
+    def test_dates_kept(self):
+        self.generate(start=datetime.date(2010, 1, 4))
+        self.assertEqual('2010-01-25', orders.models.Order.objects.latest().date.isoformat())
+        self.assertFalse(products.models.Price.objects.filter(date__gt='2010-01-25').exists())
+        self.assertFalse(customers.models.Debit.objects.filter(date__gt='2010-01-25').exists())
+
+    def test_totals_and_ledgers_consistent(self):
+        self.generate()
+        self.generate(seed=1)
+        self.assertEqual(12, customers.models.Customer.objects.count())
+        call_command('rebuild_totals', verify=True, stdout=StringIO())
+        call_command('rebuild_ledger', verify=True, stdout=StringIO())
+        self.assertTrue(orders.models.Order.objects.filter(confirmed_total__gt=0).exists())
+
+
+class BenchTestCase(TestCase):
+    fixtures = ['test_products', 'test_customers', 'test_orders']
+
+    def bench(self, **options):
+        out = StringIO()
+        call_command('bench', repeat=2, warmup=0, stdout=out, stderr=StringIO(), **options)
+        return json.loads(out.getvalue())
+
+    def test_report(self):
+        report = self.bench(namespaces=['customers'])
+        self.assertEqual(2, report['meta']['repeat'])
+        self.assertEqual(2, report['meta']['rows']['customers.customer'])
+        results = {result['name']: result for result in report['results']}
+        # the customers have no debits to show
+        self.assertEqual({'customers:index', 'customers:create', 'customers:customer', 'customers:customer-edit',
+                          'customers:customer-debit'}, results.keys())
+        index = results['customers:index']
+        self.assertEqual(200, index['status'])
+        self.assertGreater(index['queries'], 0)
+        self.assertLessEqual(index['ms']['min'], index['ms']['p50'])
+        self.assertLessEqual(index['ms']['p50'], index['ms']['max'])
+        self.assertGreater(index['peak_memory_kb'], 0)
+
+    def test_filter_and_compare(self):
+        file = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+        self.addCleanup(os.unlink, file.name)
+        with file:
+            json.dump(self.bench(namespaces=['orders'], name_filter='order-export', memory=False), file)
+        report = self.bench(namespaces=['orders'], name_filter='order-export', compare=file.name)
+        self.assertEqual(['orders:order-export'], [result['name'] for result in report['results']])
+        self.assertEqual('/orders/1/export.csv', report['results'][0]['path'])
+        self.assertIn('ms', report['results'][0]['baseline'])
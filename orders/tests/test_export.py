@@ -0,0 +1,68 @@
+import csv
+from datetime import date
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+import orders.models
+from orders import export
+
+
+class ExportTestCase(TestCase):
+    fixtures = ['test_products', 'test_customers', 'test_orders']
+
+    def setUp(self):
+        super().setUp()
+        call_command('rebuild_totals', stdout=StringIO())
+        self.order = orders.models.Order.objects.get(pk=1)
+        self.expected = [
+            ['2001-01-07', 'user1', '1', '', '', '', '', '', '1', '', '500', '0'],
+            ['2001-01-07', 'user2', '', '', '2', '', '2', '', '', '', '1000', '0'],
+        ]
+
+    @staticmethod
+    def parse(lines):
+        return list(csv.reader(StringIO(''.join(lines))))
+
+    def test_rows(self):
+        rows = self.parse(export.export_csv(export.customer_orders(order=self.order)))
+        self.assertEqual(["Дата", "Покупатель", "type1 product1 (заказ)", "type1 product1 (подтверждено)"], rows[0][:4])
+        self.assertEqual(self.expected, rows[1:])
+
+    def test_date_range(self):
+        orders.models.Order.objects.create(date=date(2001, 1, 14)).customers.create(customer_id=1) \
+            .product_orders.create(product_id=2, amount=3, confirmed_amount=3)
+        rows = self.parse(export.export_csv(export.customer_orders(date_from=date(2001, 1, 8))))
+        self.assertEqual([['2001-01-14', 'user1', '', '', '3', '3', '', '', '', '', '600', '600']], rows[1:])
+        self.assertEqual(3, len(self.parse(export.export_csv(export.customer_orders(date_to=date(2001, 1, 7))))))
+        self.assertEqual(4, len(self.parse(export.export_csv(export.customer_orders()))))
+
+    def test_num_queries_independent_of_size(self):
+        for week in range(5):
+            orders.models.Order.objects.create(date=date(2001, 2, 1 + week)).customers.create(customer_id=1) \
+                .product_orders.create(product_id=1, amount=1)
+        # products and product orders
+        with self.assertNumQueries(2):
+            list(export.export_csv(export.customer_orders(), chunk_size=2))
+
+    def test_order_view(self):
+        response = self.client.get(self.order.get_export_url())
+        self.assertTrue(response.streaming)
+        self.assertEqual('attachment; filename="order-2001-01-07.csv"', response['Content-Disposition'])
+        rows = self.parse(line.decode() for line in response.streaming_content)
+        self.assertEqual(self.expected, rows[1:])
+
+    def test_range_view(self):
+        response = self.client.get(reverse('orders:export'), {'from': '2001-01-01', 'to': '2001-12-31'})
+        self.assertEqual('attachment; filename="orders-2001-01-01-2001-12-31.csv"', response['Content-Disposition'])
+        self.assertEqual(self.expected, self.parse(line.decode() for line in response.streaming_content)[1:])
+
+    def test_range_view_invalid_date(self):
+        self.assertEqual(400, self.client.get(reverse('orders:export'), {'from': 'yesterday'}).status_code)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('export_orders', order=self.order.pk, stdout=out)
+        self.assertEqual(self.expected, self.parse(out.getvalue())[1:])
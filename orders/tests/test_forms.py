@@ -0,0 +1,81 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+import customers.models
+import orders.models
+import products.models
+from orders import forms
+
+
+class CatalogFormClassTestCase(TestCase):
+    fixtures = ['test_products', 'test_customers', 'test_orders']
+
+    def test_product_fields(self):
+        form_class = forms.catalog_form_class(forms.CustomerOrderForm)
+        self.assertEqual({1: 'product-1-1', 2: 'product-1-2', 3: 'product-2-3', 4: 'product-2-4'},
+                         form_class.product_fields)
+        self.assertEqual(['product-1-1', 'product-1-2', 'product-2-3', 'product-2-4'],
+                         list(form_class.base_fields)[-4:])
+
+    def test_cached(self):
+        form_class = forms.catalog_form_class(forms.CustomerOrderForm)
+        forms.catalog_formset_class(forms.OrderFormSet)
+        # reading the catalog version only
+        with self.assertNumQueries(3):
+            self.assertIs(form_class, forms.catalog_form_class(forms.CustomerOrderForm))
+            self.assertIs(forms.catalog_formset_class(forms.OrderFormSet),
+                          forms.catalog_formset_class(forms.OrderFormSet))
+
+    def test_catalog_changed(self):
+        form_class = forms.catalog_form_class(forms.CustomerOrderForm)
+        product = products.models.Product.objects.create(product_type_id=1, name="new")
+        new_form_class = forms.catalog_form_class(forms.CustomerOrderForm)
+        self.assertIsNot(form_class, new_form_class)
+        self.assertIn(product.get_field_name(), new_form_class.base_fields)
+
+    def test_formset_no_catalog_queries(self):
+        order = orders.models.Order.objects.first()
+        formset_class = forms.catalog_formset_class(forms.OrderFormSet)
+        extra_formset_class = type('ExtraFormSet', (formset_class,), {'extra': 20})
+        with CaptureQueriesContext(connection) as context:
+            formset = extra_formset_class(instance=order)
+            [form.initial for form in formset]
+            formset.empty_form
+        self.assertEqual(22, len(formset.forms))
+        self.assertFalse([query for query in context.captured_queries if 'products_product' in query['sql']])
+
+
+class CustomerOrderFormSetTestCase(TestCase):
+    fixtures = ['test_products', 'test_customers', 'test_orders']
+
+    def test_save(self):
+        order = orders.models.Order.objects.get(pk=1)
+        customer = customers.models.Customer.objects.create(name="user3")
+        formset = forms.catalog_formset_class(forms.OrderFormSet)({
+            'customers-TOTAL_FORMS': 4, 'customers-INITIAL_FORMS': 2,
+            'customers-0-id': 1, 'customers-0-customer': 1,
+            'customers-1-id': 2, 'customers-1-customer': 2, 'customers-1-product-1-1': 5,
+            'customers-2-customer': customer.pk, 'customers-2-product-1-2': 1,
+        }, instance=order)
+        self.assertTrue(formset.is_valid(), formset.errors)
+        saved = formset.save()
+        new_customer_order = order.customers.get(customer=customer)
+        self.assertEqual([2, new_customer_order.pk], [customer_order.pk for customer_order in saved])
+        self.assertEqual([new_customer_order], formset.new_objects)
+        [(changed, changed_data)] = formset.changed_objects
+        self.assertEqual((2, ['product-1-1', 'product-1-2', 'product-2-3']), (changed.pk, changed_data))
+        self.assertEqual([1], [customer_order.pk for customer_order in formset.deleted_objects])
+        self.assertEqual([2, new_customer_order.pk], list(order.customers.order_by('pk').values_list('pk', flat=True)))
+        self.assertIs(saved[1], formset.forms[2].instance)
+
+    def test_duplicate_customer(self):
+        formset = forms.catalog_formset_class(forms.OrderFormSet)({
+            'customers-TOTAL_FORMS': 3, 'customers-INITIAL_FORMS': 2,
+            'customers-0-id': 1, 'customers-0-customer': 1, 'customers-0-product-1-1': 1,
+            'customers-1-id': 2, 'customers-1-customer': 2, 'customers-1-product-1-1': 1,
+            'customers-2-customer': 1, 'customers-2-product-1-2': 1,
+        }, instance=orders.models.Order.objects.get(pk=1))
+        self.assertFalse(formset.is_valid())
+        self.assertEqual(["Please correct the duplicate data for customer."], formset.non_form_errors())
+        self.assertEqual(["Please correct the duplicate values below."], formset.forms[2].non_field_errors())
@@ -0,0 +1,158 @@
+import json
+import os
+import tempfile
+from datetime import date
+from io import StringIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+import customers.models
+import orders.models
+from orders.importer import OrderImporter, read_csv
+
+CSV = """date,customer,product,amount,confirmed
+2001-01-14,user1,type1 product1,2,
+2001-01-14,user1,4,1,1
+2001-01-14,user2,type2 product3,3,3
+2001-01-21,user2,type1 product2,1,
+2001-01-21,nobody,type1 product2,1,
+2001-01-21,user1,type1 product9,1,
+2001-13-01,user1,type1 product1,1,
+2001-01-21,user1,type1 product1,,
+2001-01-21,user1,type1 product1,-1,
+"""
+
+
+class OrderImporterTestCase(TestCase):
+    fixtures = ['test_products', 'test_customers', 'test_orders']
+
+    def run_import(self, text=CSV, **kwargs):
+        return OrderImporter(**kwargs).run(read_csv(StringIO(text)))
+
+    def test_import(self):
+        importer = self.run_import()
+        self.assertEqual({'lines': 4, 'orders created': 2, 'customer orders created': 3,
+                          'product orders created': 4}, dict(+importer.counts))
+        order = orders.models.Order.objects.get(date=date(2001, 1, 14))
+        self.assertEqual({(1, 1): (2, None), (1, 4): (1, 1), (2, 3): (3, 3)},
+                         {(customer_id, product_id): (amount, confirmed) for customer_id, product_id, amount, confirmed
+                          in orders.models.ProductOrder.objects.filter(customerOrder__order=order)
+                         .values_list('customerOrder__customer_id', 'product_id', 'amount', 'confirmed_amount')})
+
+    def test_errors(self):
+        importer = self.run_import()
+        self.assertEqual([6, 7, 8, 9, 10], [number for number, _ in importer.errors])
+        self.assertIn("unknown customer 'nobody'", importer.errors[0][1])
+        self.assertIn("no amount", importer.errors[3][1])
+
+    def test_totals_and_ledger(self):
+        self.run_import()
+        order = orders.models.Order.objects.get(date=date(2001, 1, 14))
+        self.assertEqual(2 * 100 + 400 + 3 * 300, order.order_total)
+        self.assertEqual(400 + 3 * 300, order.confirmed_total)
+        entry = customers.models.LedgerEntry.objects.get(customer_order__order=order, customer_id=1)
+        self.assertEqual((customers.models.LedgerEntry.CREDIT, date(2001, 1, 14)), (entry.kind, entry.date))
+        self.assertEqual(400, abs(entry.amount))
+
+    def test_existing_lines_updated(self):
+        importer = self.run_import("date,customer,product,amount,confirmed\n2001-01-07,user1,1,5,5\n")
+        self.assertEqual({'lines': 1, 'product orders updated': 1}, dict(+importer.counts))
+        self.assertEqual((5, 5), orders.models.ProductOrder.objects.filter(pk=1)
+                         .values_list('amount', 'confirmed_amount').get())
+        self.assertEqual(1, orders.models.Order.objects.count())
+
+    def test_dry_run(self):
+        importer = self.run_import(dry_run=True)
+        self.assertEqual(2, importer.counts['orders created'])
+        self.assertEqual(1, orders.models.Order.objects.count())
+        self.assertEqual(4, orders.models.ProductOrder.objects.count())
+
+    def test_batches(self):
+        importer = self.run_import(batch_size=2)
+        self.assertEqual(2, importer.counts['orders created'])
+        self.assertEqual(8, orders.models.ProductOrder.objects.count())
+
+    def test_customer_order_created_meanwhile(self):
+        importer = OrderImporter()
+        load = importer._load_customer_orders
+
+        def load_and_create(keys):
+            # another import creates a customer order between reading them and inserting the missing ones
+            loaded = load(keys)
+            if not orders.models.CustomerOrder.objects.filter(order__date=date(2001, 1, 14)).exists():
+                order_id, customer_id = max(keys)
+                orders.models.CustomerOrder.objects.create(order_id=order_id, customer_id=customer_id)
+            return loaded
+
+        importer._load_customer_orders = load_and_create
+        importer.run(read_csv(StringIO("date,customer,product,amount,confirmed\n"
+                                       "2001-01-14,user1,1,1,\n2001-01-14,user2,1,2,\n")))
+        self.assertEqual(1, importer.counts['customer orders created'])
+        self.assertEqual({1: 1, 2: 2}, dict(orders.models.ProductOrder.objects.filter(
+            customerOrder__order__date=date(2001, 1, 14)).values_list('customerOrder__customer_id', 'amount')))
+
+    def test_queries_do_not_grow_with_lines(self):
+        def lines(days):
+            return "date,customer,product,amount,confirmed\n" + "".join(
+                f"2001-02-{day:02},user{customer},{product},{day},\n"
+                for day in range(1, days + 1) for customer in [1, 2] for product in range(1, 5))
+
+        def count_queries(text):
+            importer = OrderImporter()
+            with CaptureQueriesContext(connection) as context:
+                importer.run(read_csv(StringIO(text)))
+            return len(context)
+
+        self.assertEqual(count_queries(lines(2)), count_queries(lines(20).replace('2001-02', '2001-03')))
+
+
+class ImportOrdersCommandTestCase(TestCase):
+    fixtures = ['test_products', 'test_customers']
+
+    def test_json(self):
+        path = self.tmp_file(json.dumps([
+            {'date': '2001-01-14', 'customer': 'user1', 'product': 'type1 product1', 'amount': 2},
+            {'date': '2001-01-14', 'customer': 'user3', 'product': 'type1 product1', 'amount': 2},
+        ]), '.json')
+        out, err = StringIO(), StringIO()
+        call_command('import_orders', path, stdout=out, stderr=err)
+        self.assertIn("Imported 1 lines, 1 errors", out.getvalue())
+        self.assertIn(":2: unknown customer 'user3'", err.getvalue())
+        self.assertEqual(1, orders.models.ProductOrder.objects.count())
+
+    def test_dry_run(self):
+        out = StringIO()
+        call_command('import_orders', self.tmp_file(CSV, '.csv'), dry_run=True, stdout=out, stderr=StringIO())
+        self.assertIn("Checked 4 lines, 5 errors", out.getvalue())
+        self.assertEqual(0, orders.models.Order.objects.count())
+
+    def tmp_file(self, text, suffix):
+        file = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False, encoding='utf-8')
+        with file:
+            file.write(text)
+        self.addCleanup(os.unlink, file.name)
+        return file.name
+
+
+class OrderImportViewTestCase(TestCase):
+    fixtures = ['test_products', 'test_customers']
+
+    def test_upload(self):
+        response = self.client.post(reverse('orders:import'), {
+            'file': SimpleUploadedFile('orders.csv', CSV.encode()),
+        })
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(4, response.context['importer'].counts['lines'])
+        self.assertContains(response, "unknown customer")
+        self.assertEqual(2, orders.models.Order.objects.count())
+
+    def test_invalid_extension(self):
+        response = self.client.post(reverse('orders:import'), {
+            'file': SimpleUploadedFile('orders.txt', CSV.encode()),
+        })
+        self.assertFormError(response, 'form', 'file', "Поддерживаются только файлы .csv и .json")
@@ -0,0 +1,90 @@
+import datetime
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count
+from django.test import TestCase
+
+import customers.models
+import orders.models
+import products.models
+from helpers import slow_queries
+
+
+class QueryPlanTestCase(TestCase):
+    """Plans of the hot lookups on benchmark-sized data use the indexes, without sorting rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('gen_benchmark_data', customers=100, product_types=5, products=4, price_changes=20, orders=30,
+                     debits=10, stdout=StringIO())
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        return slow_queries.explain('default', sql, params)
+
+    @staticmethod
+    def index_on(model, *columns):
+        """Name of the index of a table on exactly these columns, unique constraints have one too."""
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                # indexes of unique constraints are named by SQLite, they are not introspected as indexes
+                cursor.execute(f'PRAGMA index_list("{table}")')
+                for name in [row[1] for row in cursor.fetchall()]:
+                    cursor.execute(f'PRAGMA index_info("{name}")')
+                    if [row[2] for row in cursor.fetchall()] == list(columns):
+                        return name
+                return None
+            constraints = connection.introspection.get_constraints(cursor, table)
+        return next((name for name, constraint in constraints.items()
+                     if (constraint['index'] or constraint['unique']) and constraint['columns'] == list(columns)), None)
+
+    def assertUsesIndex(self, queryset, model, *columns):
+        plan = self.plan(queryset)
+        index = self.index_on(model, *columns)
+        self.assertIsNotNone(index, f"No index of {model._meta.db_table} on {', '.join(columns)}")
+        self.assertTrue(any(f'INDEX {index}' in line or f'using {index}' in line for line in plan), plan)
+        self.assertEqual([], slow_queries.costly_steps(plan))
+
+    def test_price_as_of(self):
+        product = products.models.Product.objects.order_by('pk').first()
+        queryset = products.models.Price.objects.filter(product=product, date__lte=datetime.date(2020, 6, 1)) \
+            .order_by('-date').values('price')[:1]
+        self.assertUsesIndex(queryset, products.models.Price, 'product_id', 'date')
+
+    def test_product_order_of_customer_order(self):
+        product_order = orders.models.ProductOrder.objects.order_by('pk').first()
+        queryset = orders.models.ProductOrder.objects.filter(customerOrder_id=product_order.customerOrder_id,
+                                                             product_id=product_order.product_id)
+        self.assertUsesIndex(queryset, orders.models.ProductOrder, 'customerOrder_id', 'product_id')
+
+    def test_customer_order_of_order(self):
+        customer_order = orders.models.CustomerOrder.objects.order_by('pk').first()
+        queryset = orders.models.CustomerOrder.objects.filter(order_id=customer_order.order_id,
+                                                              customer_id=customer_order.customer_id)
+        self.assertUsesIndex(queryset, orders.models.CustomerOrder, 'order_id', 'customer_id')
+
+    def test_debits_of_customer(self):
+        customer = customers.models.Customer.objects.order_by('pk').first()
+        queryset = customer.debits.filter(date__gte=datetime.date(2020, 3, 1)).order_by('date')
+        self.assertUsesIndex(queryset, customers.models.Debit, 'customer_id', 'date')
+
+    def test_latest_order(self):
+        queryset = orders.models.Order.objects.order_by('-date')[:1]
+        self.assertUsesIndex(queryset, orders.models.Order, 'date')
+
+    def test_unique(self):
+        customer_order = orders.models.CustomerOrder.objects.order_by('pk').first()
+        self.assertFalse(orders.models.CustomerOrder.objects.order_by().values('order_id', 'customer_id')
+                         .annotate(count=Count('pk')).filter(count__gt=1).exists())
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            orders.models.CustomerOrder.objects.create(order_id=customer_order.order_id,
+                                                       customer_id=customer_order.customer_id)
+        product_order = customer_order.product_orders.first()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            orders.models.ProductOrder.objects.create(customerOrder=customer_order, product_id=product_order.product_id,
+                                                      amount=1)
@@ -0,0 +1,44 @@
+from django.test import TestCase
+
+import orders.models
+from orders.matrix import OrderMatrix
+
+
+class OrderMatrixTestCase(TestCase):
+    fixtures = ['test_products', 'test_customers', 'test_orders']
+
+    def setUp(self):
+        super().setUp()
+        self.order = orders.models.Order.objects.first()
+
+    def test_num_queries(self):
+        # products, customer orders and product orders
+        with self.assertNumQueries(3):
+            order_matrix = OrderMatrix(self.order)
+            list(order_matrix.rows)
+            order_matrix.footer
+            order_matrix.message
+
+    def test_cell(self):
+        order_matrix = OrderMatrix(self.order)
+        self.assertEqual((1, None), order_matrix.cell(0, 0))
+        self.assertEqual((None, None), order_matrix.cell(0, 1))
+        self.assertEqual((2, None), order_matrix.cell(1, 2))
+
+    def test_order_cost(self):
+        order_matrix = OrderMatrix(self.order)
+        self.assertEqual(self.order.order_cost(), order_matrix.order_cost())
+
+    def test_confirmed_cost(self):
+        orders.models.ProductOrder.objects.update(confirmed_amount=1)
+        order_matrix = OrderMatrix(self.order)
+        self.assertEqual(self.order.confirmed_cost(), order_matrix.confirmed_cost())
+        self.assertEqual(100 + 400 + 200 + 300, order_matrix.confirmed_cost())
+
+    def test_empty_order(self):
+        order = orders.models.Order.objects.create(date=self.order.date)
+        order_matrix = OrderMatrix(order)
+        self.assertEqual([], list(order_matrix.rows))
+        self.assertEqual([(0, 0)] * 4, order_matrix.footer)
+        self.assertEqual([], order_matrix.message)
+        self.assertEqual(0, order_matrix.order_cost())
@@ -1,10 +1,15 @@
 from datetime import date, timedelta
+from io import StringIO
 
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 import customers.models
 import orders.models
+from products.pricebook import PriceBook
 
 
 class OrderTestCase(TestCase):
@@ -42,6 +47,30 @@ class OrderTestCase(TestCase):
                 product_order.save()
         self.assertEqual(test_order.order_cost(), test_order.confirmed_cost())
 
+    def test_order_cost_num_queries(self):
+        test_order = self._test_order()
+        # prices, customer orders and their prefetched product orders
+        with self.assertNumQueries(3):
+            test_order.order_cost()
+
+    def test_order_cost_price_book(self):
+        test_order = self._test_order()
+        order_cost = test_order.order_cost()
+        price_book = PriceBook()
+        with self.assertNumQueries(2):
+            self.assertEqual(order_cost, test_order.order_cost(price_book))
+
+    def test_with_costs(self):
+        test_order_pk = self._test_order().pk
+        with self.assertNumQueries(1):
+            test_order = orders.models.Order.objects.with_costs().get(pk=test_order_pk)
+        self.assertEqual(100 + 400 + 2 * 200 + 2 * 300, test_order.priced_order_total)
+        self.assertEqual(0, test_order.priced_confirmed_total)
+
+    def test_with_costs_empty(self):
+        test_order = orders.models.Order.objects.with_costs().get(pk=self._new_order().pk)
+        self.assertEqual((0, 0), (test_order.priced_order_total, test_order.priced_confirmed_total))
+
     def test_get_urlpattern(self):
         test_order = self._test_order()
         self.assertEqual('orders:order', test_order.get_urlpattern())
@@ -105,6 +134,47 @@ class CustomerOrderTestCase(TestCase):
             product_order.save()
         self.assertEqual(test_customer_order.order_cost(), test_customer_order.confirmed_cost())
 
+    def test_with_costs(self):
+        orders.models.ProductOrder.objects.filter(product=4).update(confirmed_amount=3)
+        with self.assertNumQueries(1):
+            costs = {customer_order: (customer_order.priced_order_total, customer_order.priced_confirmed_total)
+                     for customer_order in orders.models.CustomerOrder.objects.with_costs()}
+        self.assertEqual([(500, 3 * 400), (1000, 0)], list(costs.values()))
+        for customer_order, sql_costs in costs.items():
+            self.assertEqual((customer_order.order_cost(), customer_order.confirmed_cost()), sql_costs)
+
+    def test_save_amounts(self):
+        test_customer_order = self._test_customer_order()
+        left = test_customer_order.save_amounts({1: 3, 2: 1, 3: None, 4: None})
+        self.assertEqual(2, left)
+        self.assertEqual({1: 3, 2: 1}, dict(test_customer_order.product_orders.values_list('product_id', 'amount')))
+        test_customer_order.refresh_from_db()
+        self.assertEqual(3 * 100 + 200, test_customer_order.order_total)
+
+    def test_save_amounts_confirmed(self):
+        test_customer_order = self._test_customer_order()
+        left = test_customer_order.save_amounts({1: 1, 4: None}, 'confirmed_amount')
+        self.assertEqual(2, left)
+        self.assertEqual({1: (1, 1), 4: (1, None)},
+                         {product_id: (amount, confirmed) for product_id, amount, confirmed in
+                          test_customer_order.product_orders.values_list('product_id', 'amount', 'confirmed_amount')})
+        test_customer_order.refresh_from_db()
+        self.assertEqual(100, test_customer_order.confirmed_total)
+
+    def test_save_amounts_unchanged(self):
+        test_customer_order = self._test_customer_order()
+        with self.assertNumQueries(1):
+            self.assertEqual(2, test_customer_order.save_amounts({1: 1, 2: None, 4: 1}))
+
+    def test_save_amounts_statements(self):
+        test_customer_order = self._test_customer_order()
+        with CaptureQueriesContext(connection) as context:
+            test_customer_order.save_amounts({1: 2, 2: 1, 3: 1, 4: None})
+        statements = [query['sql'].split()[0] for query in context.captured_queries
+                      if '"orders_productorder"' in query['sql'].split('WHERE')[0]]
+        # load, insert, update and delete, no statement per product order
+        self.assertEqual(['SELECT', 'INSERT', 'UPDATE', 'SELECT', 'DELETE'], statements[:5])
+
 
 class ProductOrderTestCase(TestCase):
     fixtures = ['test_products', 'test_customers', 'test_orders']
@@ -135,6 +205,7 @@ class ProductOrderTestCase(TestCase):
         test_product_order.save()
         self.assertEqual(200, test_product_order.order_cost())
         self.assertEqual(200, test_product_order.confirmed_cost())
+        self.assertEqual(200, orders.models.ProductOrder.objects.with_price().get(pk=test_product_order.pk).price)
 
     def test_price_changed_in_future(self):
         test_product_order = self._test_product_order()
@@ -145,3 +216,32 @@ class ProductOrderTestCase(TestCase):
         test_product_order.save()
         self.assertEqual(100, test_product_order.order_cost())
         self.assertEqual(100, test_product_order.confirmed_cost())
+        self.assertEqual(100, orders.models.ProductOrder.objects.with_price().get(pk=test_product_order.pk).price)
+
+    def test_with_price_missing(self):
+        test_product_order = self._test_product_order()
+        test_product_order.product.prices.all().delete()
+        self.assertEqual(0, orders.models.ProductOrder.objects.with_price().get(pk=test_product_order.pk).price)
+
+
+class CostQuerySetTestCase(TestCase):
+    """Costs annotated in SQL match the costs computed with price books, over many price changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('gen_benchmark_data', customers=20, product_types=3, products=3, price_changes=10, orders=12,
+                     debits=0, stdout=StringIO())
+
+    def test_order_with_costs(self):
+        test_orders = list(orders.models.Order.objects.with_costs())
+        self.assertEqual(12, len(test_orders))
+        for test_order in test_orders:
+            self.assertEqual((test_order.order_cost(), test_order.confirmed_cost()),
+                             (test_order.priced_order_total, test_order.priced_confirmed_total))
+
+    def test_customer_order_with_costs(self):
+        price_book = PriceBook()
+        test_customer_orders = orders.models.CustomerOrder.objects.with_costs().prefetch_related('product_orders')
+        for customer_order in test_customer_orders.select_related('order'):
+            self.assertEqual((customer_order.order_cost(price_book), customer_order.confirmed_cost(price_book)),
+                             (customer_order.priced_order_total, customer_order.priced_confirmed_total))
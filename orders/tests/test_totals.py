@@ -0,0 +1,142 @@
+from datetime import date, timedelta
+from io import StringIO
+
+from django.core.management import call_command, CommandError
+from django.test import TestCase
+
+import customers.models
+import orders.models
+import products.models
+from orders import totals
+
+
+class TotalsTestCase(TestCase):
+    fixtures = ['test_products', 'test_customers']
+
+    def setUp(self):
+        super().setUp()
+        self.product = products.models.Product.objects.get(pk=1)
+        self.order = orders.models.Order.objects.create(date=date(2001, 1, 7))
+        self.customer_order = self.order.customers.create(customer=customers.models.Customer.objects.first())
+
+    def assertTotals(self, expected, obj):
+        obj.refresh_from_db()
+        self.assertEqual(expected, (obj.order_total, obj.confirmed_total))
+
+    def test_product_order_saved(self):
+        product_order = self.customer_order.product_orders.create(product=self.product, amount=2)
+        self.assertTotals((200, 0), self.customer_order)
+        self.assertTotals((200, 0), self.order)
+        product_order.confirmed_amount = 1
+        product_order.save()
+        self.assertTotals((200, 100), self.customer_order)
+        self.assertTotals((200, 100), self.order)
+
+    def test_product_order_deleted(self):
+        product_order = self.customer_order.product_orders.create(product=self.product, amount=2)
+        self.customer_order.product_orders.create(product_id=2, amount=1)
+        self.assertTotals((400, 0), self.order)
+        product_order.delete()
+        self.assertTotals((200, 0), self.customer_order)
+        self.assertTotals((200, 0), self.order)
+
+    def test_product_order_moved(self):
+        other = self.order.customers.create(customer=customers.models.Customer.objects.last())
+        product_order = self.customer_order.product_orders.create(product=self.product, amount=2)
+        product_order.customerOrder = other
+        product_order.save()
+        self.assertTotals((0, 0), self.customer_order)
+        self.assertTotals((200, 0), other)
+        product_order = orders.models.ProductOrder.objects.get(pk=product_order.pk)
+        product_order.customerOrder = self.customer_order
+        product_order.save()
+        self.assertTotals((200, 0), self.customer_order)
+        self.assertTotals((0, 0), other)
+        self.assertTotals((200, 0), self.order)
+        call_command('rebuild_ledger', verify=True, stdout=StringIO())
+
+    def test_customer_order_deleted(self):
+        self.customer_order.product_orders.create(product=self.product, amount=2)
+        self.customer_order.delete()
+        self.assertTotals((0, 0), self.order)
+
+    def test_order_deleted(self):
+        self.customer_order.product_orders.create(product=self.product, amount=2, confirmed_amount=2)
+        other = self.order.customers.create(customer=customers.models.Customer.objects.last())
+        other.product_orders.create(product=self.product, amount=1, confirmed_amount=1)
+        other.customer.debits.create(amount=500)
+        self.order.delete()
+        self.assertEqual([(500, 500)], list(other.customer.ledger.values_list('amount', 'balance')))
+        self.assertEqual(0, self.customer_order.customer.ledger.count())
+
+    def test_order_deleted_num_queries(self):
+        for number in range(30):
+            customer_order = self.order.customers.create(
+                customer=customers.models.Customer.objects.create(name=f"customer {number}"))
+            for product_id in range(1, 5):
+                customer_order.product_orders.create(product_id=product_id, amount=1, confirmed_amount=1)
+        # savepoints, collecting and deleting rows, then refreshing ledgers once whatever the number of lines
+        with self.assertNumQueries(14):
+            self.order.delete()
+        self.assertFalse(orders.models.ProductOrder.objects.exists())
+
+    def test_price_changed(self):
+        self.customer_order.product_orders.create(product=self.product, amount=2)
+        price = self.product.prices.create(price=150)
+        price.date = self.order.date
+        price.save()
+        self.assertTotals((300, 0), self.order)
+        price.date = self.order.date + timedelta(days=1)
+        price.save()
+        self.assertTotals((200, 0), self.order)
+        price.date = self.order.date - timedelta(days=1)
+        price.save()
+        self.assertTotals((300, 0), self.order)
+        price.delete()
+        self.assertTotals((200, 0), self.order)
+
+    def test_price_changed_after_next_price(self):
+        self.customer_order.product_orders.create(product=self.product, amount=2)
+        next_price = self.product.prices.create(price=150)
+        next_price.date = self.order.date - timedelta(days=1)
+        next_price.save()
+        self.assertTotals((300, 0), self.order)
+        # the order is out of the range of the first price
+        self.assertEqual([], totals.refresh_price_change(self.product.pk, date(2000, 1, 1)))
+        self.assertTotals((300, 0), self.order)
+
+    def test_order_date_changed(self):
+        self.customer_order.product_orders.create(product=self.product, amount=2)
+        price = self.product.prices.create(price=150)
+        price.date = self.order.date + timedelta(days=1)
+        price.save()
+        self.assertTotals((200, 0), self.order)
+        self.order.date = price.date
+        self.order.save()
+        self.assertTotals((300, 0), self.customer_order)
+        self.assertTotals((300, 0), self.order)
+
+
+class RebuildTotalsCommandTestCase(TestCase):
+    fixtures = ['test_products', 'test_customers', 'test_orders']
+
+    def test_rebuild(self):
+        # fixtures are loaded as raw rows, their totals are not maintained
+        order = orders.models.Order.objects.get(pk=1)
+        self.assertEqual(0, order.order_total)
+        out = StringIO()
+        call_command('rebuild_totals', stdout=out)
+        order.refresh_from_db()
+        self.assertEqual(order.order_cost(), order.order_total)
+        self.assertEqual(1500, order.order_total)
+        for customer_order in order.customers.all():
+            self.assertEqual(customer_order.order_cost(), customer_order.order_total)
+        self.assertIn("3 fixed", out.getvalue())
+
+    def test_verify(self):
+        with self.assertRaisesMessage(CommandError, "3 stored totals differ from line items"):
+            call_command('rebuild_totals', verify=True, stdout=StringIO())
+        call_command('rebuild_totals', stdout=StringIO())
+        out = StringIO()
+        call_command('rebuild_totals', verify=True, stdout=out)
+        self.assertIn("0 mismatched", out.getvalue())
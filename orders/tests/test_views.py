@@ -1,6 +1,9 @@
 from datetime import date, timedelta
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse, reverse_lazy
 
 import customers.models
@@ -25,6 +28,12 @@ def product_order_translate(product_order):
             'product.pk': product_order.product.pk}
 
 
+def add_customer_order(order, name):
+    customer_order = order.customers.create(customer=customers.models.Customer.objects.create(name=name))
+    for product in products.models.Product.objects.all():
+        customer_order.product_orders.create(product=product, amount=1)
+
+
 class OrdersListViewTestCase(ViewTestCaseMixin, TestCase):
     fixtures = ['test_products', 'test_customers', 'test_orders']
     view_class = views.OrdersListView
@@ -41,6 +50,67 @@ class OrdersListViewTestCase(ViewTestCaseMixin, TestCase):
                                  ordered=False)
 
 
+class OrdersListViewPaginationTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        # two orders a week, so dates repeat
+        self.orders = [models.Order.objects.create(date=date(2001, 1, 7) + timedelta(days=7 * (index // 2)))
+                       for index in range(45)]
+        self.expected = sorted(self.orders, key=lambda order: (order.date, order.pk), reverse=True)
+
+    def get_page(self, **params):
+        return self.client.get(reverse('orders:list'), params).context['page_obj']
+
+    def test_walk(self):
+        page = self.get_page()
+        self.assertFalse(page.has_previous())
+        seen = list(page)
+        while page.has_next():
+            page = self.get_page(after=page.next_cursor)
+            self.assertTrue(page.has_previous())
+            seen.extend(page)
+        self.assertEqual(self.expected, seen)
+        previous = self.get_page(before=page.previous_cursor)
+        self.assertEqual(self.expected[20:40], list(previous))
+        self.assertTrue(previous.has_next())
+
+    def test_num_queries_independent_of_depth(self):
+        with CaptureQueriesContext(connection) as first_page_queries:
+            page = self.get_page()
+        num_queries = len(first_page_queries)
+        cursor = self.get_page(after=page.next_cursor).next_cursor
+        with self.assertNumQueries(num_queries):
+            self.get_page(after=cursor)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(404, self.client.get(reverse('orders:list'), {'after': 'bad'}).status_code)
+
+    def test_month(self):
+        response = self.client.get(reverse('orders:list'), {'month': '2001-02'})
+        self.assertEqual([order for order in self.expected if (order.date.year, order.date.month) == (2001, 2)],
+                         list(response.context['page_obj']))
+        self.assertEqual({'year': 2001, 'month': 2}, response.context['period'])
+
+    def test_year(self):
+        response = self.client.get(reverse('orders:list'), {'year': '2001'})
+        self.assertEqual([order for order in self.expected if order.date.year == 2001][:20],
+                         list(response.context['page_obj']))
+
+    def test_last_year(self):
+        for params in [{'year': '9999'}, {'month': '9999-12'}]:
+            with self.subTest(params=params):
+                response = self.client.get(reverse('orders:list'), params)
+                self.assertEqual(200, response.status_code)
+                self.assertEqual([], list(response.context['object_list']))
+
+    def test_archive(self):
+        archive = self.client.get(reverse('orders:list')).context['archive']
+        self.assertEqual([2001], [year for year, months in archive])
+        months = archive[0][1]
+        self.assertEqual(date(2001, 6, 1), months[0]['month'])
+        self.assertEqual(len(self.orders), sum(month['count'] for month in months))
+
+
 class OrderViewTestCase(ViewTestCaseMixin, TestCase):
     fixtures = ['test_products', 'test_customers', 'test_orders']
     view_class = views.OrderView
@@ -57,32 +127,18 @@ class OrderViewTestCase(ViewTestCaseMixin, TestCase):
         response = self.get_response()
         self.assertEqual(self.order, response.context['object'])
         self.assertEqual(self.order, response.context['order'])
+        order_matrix = response.context['order_matrix']
         self.assertEqual(
-            [('customer', 'Заказчик'),
-             ('1', 'type1 product1', products.models.Product.objects.get(pk=1)),
-             ('2', 'type1 product2', products.models.Product.objects.get(pk=2)),
-             ('3', 'type2 product3', products.models.Product.objects.get(pk=3)),
-             ('4', 'type2 product4', products.models.Product.objects.get(pk=4))]
-            , response.context['order_table_header'])
-        self.assertEqual(
-            [{'1': {'amount': 1, 'confirmed': None},
-              '2': {'amount': None, 'confirmed': None},
-              '3': {'amount': None, 'confirmed': None},
-              '4': {'amount': 1, 'confirmed': None},
-              'customer': customers.models.Customer.objects.get(pk=1)},
-             {'1': {'amount': None, 'confirmed': None},
-              '2': {'amount': 2, 'confirmed': None},
-              '3': {'amount': 2, 'confirmed': None},
-              '4': {'amount': None, 'confirmed': None},
-              'customer': customers.models.Customer.objects.get(pk=2)}]
-            , response.context['order_table'])
+            [products.models.Product.objects.get(pk=1),
+             products.models.Product.objects.get(pk=2),
+             products.models.Product.objects.get(pk=3),
+             products.models.Product.objects.get(pk=4)]
+            , order_matrix.products)
         self.assertEqual(
-            {'customer': 'Итого',
-             '1': {'amount': 1, 'confirmed': 0},
-             '2': {'amount': 2, 'confirmed': 0},
-             '3': {'amount': 2, 'confirmed': 0},
-             '4': {'amount': 1, 'confirmed': 0}
-             }, response.context['order_table_footer'])
+            [(customers.models.Customer.objects.get(pk=1), [(1, None), (None, None), (None, None), (1, None)]),
+             (customers.models.Customer.objects.get(pk=2), [(None, None), (2, None), (2, None), (None, None)])]
+            , list(order_matrix.rows))
+        self.assertEqual([(1, 0), (2, 0), (2, 0), (1, 0)], order_matrix.footer)
         self.assertEqual([
             (products.models.ProductType.objects.get(pk=1), [
                 (products.models.Product.objects.get(pk=1), 1),
@@ -92,7 +148,7 @@ class OrderViewTestCase(ViewTestCaseMixin, TestCase):
                 (products.models.Product.objects.get(pk=3), 2),
                 (products.models.Product.objects.get(pk=4), 1),
             ])
-        ], response.context['order_message'])
+        ], order_matrix.message)
 
     def test_order_message_context_object(self):
         order = models.Order.objects.create(date=date.today())
@@ -103,24 +159,114 @@ class OrderViewTestCase(ViewTestCaseMixin, TestCase):
             (products.models.ProductType.objects.get(pk=1), [
                 (products.models.Product.objects.get(pk=2), 1),
             ])
-        ], response.context['order_message'])
+        ], response.context['order_matrix'].message)
 
     def test_context_objects_partial_confirmed(self):
         self.order.customers.get(customer_id=1).product_orders.filter(product_id=1).update(confirmed_amount=0)
         self.order.customers.get(customer_id=2).product_orders.update(confirmed_amount=2)
         response = self.get_response()
         self.assertEqual(
-            [{'customer': customers.models.Customer.objects.get(pk=1),
-              '1': {'amount': 1, 'confirmed': 0},
-              '2': {'amount': None, 'confirmed': None},
-              '3': {'amount': None, 'confirmed': None},
-              '4': {'amount': 1, 'confirmed': None}},
-             {'customer': customers.models.Customer.objects.get(pk=2),
-              '1': {'amount': None, 'confirmed': None},
-              '2': {'amount': 2, 'confirmed': 2},
-              '3': {'amount': 2, 'confirmed': 2},
-              '4': {'amount': None, 'confirmed': None}}]
-            , response.context['order_table'])
+            [(customers.models.Customer.objects.get(pk=1), [(1, 0), (None, None), (None, None), (1, None)]),
+             (customers.models.Customer.objects.get(pk=2), [(None, None), (2, 2), (2, 2), (None, None)])]
+            , list(response.context['order_matrix'].rows))
+
+    def test_num_queries_independent_of_order_size(self):
+        with CaptureQueriesContext(connection) as small_order_queries:
+            self.get_response()
+        customer = customers.models.Customer.objects.create(name='user3')
+        customer_order = self.order.customers.create(customer=customer)
+        for product in products.models.Product.objects.all():
+            customer_order.product_orders.create(product=product, amount=1, confirmed_amount=1)
+        with self.assertNumQueries(len(small_order_queries)):
+            self.get_response()
+
+
+@override_settings(TAGGED_CACHE_TIMEOUT=60)
+class OrderViewCacheTestCase(TestCase):
+    fixtures = ['test_products', 'test_customers', 'test_orders']
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.order = models.Order.objects.first()
+        self.client.get(self.order.get_absolute_url())
+
+    def test_cached(self):
+        with self.assertNumQueries(0):
+            self.client.get(self.order.get_absolute_url())
+
+    def test_product_order_invalidates(self):
+        models.ProductOrder.objects.filter(pk=1).update(amount=5)
+        with self.assertNumQueries(0):
+            self.client.get(self.order.get_absolute_url())
+        models.ProductOrder.objects.get(pk=1).save()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.order.get_absolute_url())
+        self.assertTrue(queries)
+
+    def test_other_order_keeps_cache(self):
+        other = models.Order.objects.create(date=self.order.date)
+        other.customers.create(customer_id=1).product_orders.create(product_id=1, amount=1)
+        with self.assertNumQueries(0):
+            self.client.get(self.order.get_absolute_url())
+
+    def test_customer_invalidates(self):
+        customer = customers.models.Customer.objects.get(pk=1)
+        customer.name = 'renamed'
+        customer.save()
+        self.assertContains(self.client.get(self.order.get_absolute_url()), 'renamed')
+
+    def test_catalog_invalidates(self):
+        product = products.models.Product.objects.get(pk=1)
+        product.name = 'renamed'
+        product.save()
+        self.assertContains(self.client.get(self.order.get_absolute_url()), 'renamed')
+
+    def test_last_order(self):
+        self.client.get(reverse('orders:index'))
+        with self.assertNumQueries(1):
+            self.client.get(reverse('orders:index'))
+
+
+class OrderViewConditionalGetTestCase(TestCase):
+    fixtures = ['test_products', 'test_customers', 'test_orders']
+
+    def setUp(self):
+        super().setUp()
+        self.order = models.Order.objects.first()
+
+    def assertNotModified(self, url):
+        etag = self.client.get(url)['ETag']
+        # order and catalog stamps only, the page is not built
+        with self.assertNumQueries(4):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+        return etag
+
+    def test_not_modified(self):
+        self.assertNotModified(self.order.get_absolute_url())
+
+    def test_last_order_not_modified(self):
+        self.assertNotModified(reverse('orders:index'))
+
+    def test_product_order_changes_etag(self):
+        etag = self.assertNotModified(self.order.get_absolute_url())
+        product_order = models.ProductOrder.objects.get(pk=1)
+        product_order.amount = 5
+        product_order.save()
+        response = self.client.get(self.order.get_absolute_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+
+    def test_new_order_changes_last_order_etag(self):
+        etag = self.assertNotModified(reverse('orders:index'))
+        models.Order.objects.create(date=self.order.date + timedelta(days=7))
+        response = self.client.get(reverse('orders:index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+
+    def test_last_modified(self):
+        response = self.client.get(self.order.get_absolute_url())
+        response = self.client.get(self.order.get_absolute_url(), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(304, response.status_code)
 
 
 class LastOrderViewTestCase(ViewTestCaseMixin, TestCase):
@@ -240,6 +386,15 @@ class OrderCreateViewTestCase(ViewTestCaseMixin, TestCase):
                                  transform=product_order_translate)
         self.assertRedirects(response=response, expected_url=new_order.get_absolute_url())
 
+    def test_num_queries_independent_of_order_size(self):
+        self.load_fixture()
+        with CaptureQueriesContext(connection) as small_order_queries:
+            self.client.get(self.url)
+        add_customer_order(models.Order.objects.latest(), 'user3')
+        add_customer_order(models.Order.objects.latest(), 'user4')
+        with self.assertNumQueries(len(small_order_queries)):
+            self.client.get(self.url)
+
 
 class OrderEditViewTestCase(ViewTestCaseMixin, TestCase):
     fixtures = ['test_products', 'test_customers', 'test_orders']
@@ -324,6 +479,53 @@ class OrderEditViewTestCase(ViewTestCaseMixin, TestCase):
                                  product_order_translate)
         self.assertRedirects(response=response, expected_url=new_order.get_absolute_url())
 
+    def test_post_duplicate_customer(self):
+        response = self.client.post(self.url, {
+            'date': date.today(),
+            'customers-TOTAL_FORMS': 3,
+            'customers-INITIAL_FORMS': 2,
+            'customers-0-customer': 1,
+            'customers-0-id': 1,
+            'customers-0-product-1-1': 1,
+            'customers-1-customer': 2,
+            'customers-1-id': 2,
+            'customers-1-product-1-1': 1,
+            'customers-2-customer': 2,
+            'customers-2-product-1-2': 1,
+        })
+        self.test_status_code(response)
+        self.assertEqual(["Please correct the duplicate data for customer."],
+                         response.context['form'].formset.non_form_errors())
+        self.assertEqual(2, self.order.customers.count())
+
+    def post_amounts(self, amount):
+        """Post ``amount`` of every product for every customer of the order and for a new customer."""
+        customer_orders = list(self.order.customers.order_by('pk'))
+        new_customer = customers.models.Customer.objects.create(name=f"new {len(customer_orders)}")
+        data = {'date': self.order.date, 'customers-TOTAL_FORMS': len(customer_orders) + 1,
+                'customers-INITIAL_FORMS': len(customer_orders)}
+        field_names = [product.get_field_name() for product in products.models.Product.objects.all()]
+        for index, customer_order in enumerate(customer_orders + [None]):
+            prefix = f'customers-{index}-'
+            data[prefix + 'customer'] = customer_order.customer_id if customer_order else new_customer.pk
+            data[prefix + 'id'] = customer_order.pk if customer_order else ''
+            data.update((prefix + field_name, amount) for field_name in field_names)
+        response = self.client.post(self.url, data)
+        self.assertRedirects(response=response, expected_url=self.order.get_absolute_url())
+
+    def test_post_num_queries_independent_of_order_size(self):
+        # form classes of the catalog are built
+        self.get_response()
+        with CaptureQueriesContext(connection) as small_order_queries:
+            self.post_amounts(2)
+        for number in range(10):
+            add_customer_order(self.order, f'user{number + 3}')
+        with self.assertNumQueries(len(small_order_queries)):
+            self.post_amounts(3)
+        self.assertEqual({3}, set(models.ProductOrder.objects.values_list('amount', flat=True)))
+        self.order.refresh_from_db()
+        self.assertEqual(14 * 3 * (100 + 200 + 300 + 400), self.order.order_total)
+
     def test_delete_empty_order(self):
         response = self.client.post(self.url, {
             'date': date.today(),
@@ -357,6 +559,14 @@ class OrderEditViewTestCase(ViewTestCaseMixin, TestCase):
                                  product_order_translate)
         self.assertRedirects(response=response, expected_url=new_order.get_absolute_url())
 
+    def test_num_queries_independent_of_order_size(self):
+        with CaptureQueriesContext(connection) as small_order_queries:
+            self.get_response()
+        add_customer_order(self.order, 'user3')
+        add_customer_order(self.order, 'user4')
+        with self.assertNumQueries(len(small_order_queries)):
+            self.get_response()
+
 
 class OrderConfirmViewTestCase(ViewTestCaseMixin, TestCase):
     fixtures = ['test_products', 'test_customers', 'test_orders']
@@ -448,6 +658,14 @@ class OrderConfirmViewTestCase(ViewTestCaseMixin, TestCase):
         self.assertQuerysetEqual(new_order.customers.order_by('customer_id').all(), expected_data,
                                  tranform_customer_order)
 
+    def test_num_queries_independent_of_order_size(self):
+        with CaptureQueriesContext(connection) as small_order_queries:
+            self.get_response()
+        add_customer_order(self.order, 'user3')
+        add_customer_order(self.order, 'user4')
+        with self.assertNumQueries(len(small_order_queries)):
+            self.get_response()
+
 
 class OrderDeleteViewTestCase(ViewTestCaseMixin, TestCase):
     fixtures = ['test_products', 'test_customers', 'test_orders']
@@ -0,0 +1,167 @@
+import threading
+from contextlib import contextmanager
+
+from django.db.models import Sum
+
+import helpers.cache
+import products.models
+from customers import ledger
+from orders import models
+
+TOTAL_FIELDS = ['order_total', 'confirmed_total']
+
+_state = threading.local()
+
+
+def customer_order_totals(customer_orders):
+    """Compute totals of customer orders from their line items and prices, in SQL.
+
+    Returns ``(customer_order, order_total, confirmed_total)`` tuples.
+    """
+    return [(customer_order, customer_order.priced_order_total, customer_order.priced_confirmed_total)
+            for customer_order in customer_orders.select_related('order').with_costs()]
+
+
+def refresh_orders(order_ids):
+    """Recompute stored totals of orders from the stored totals of their customer orders."""
+    sums = models.CustomerOrder.objects.filter(order__in=order_ids).values('order') \
+        .annotate(sum_order=Sum('order_total'), sum_confirmed=Sum('confirmed_total'))
+    sums = {row['order']: (row['sum_order'], row['sum_confirmed']) for row in sums}
+    changed = []
+    for order in models.Order.objects.filter(pk__in=order_ids):
+        totals = sums.get(order.pk, (0, 0))
+        if (order.order_total, order.confirmed_total) != totals:
+            order.order_total, order.confirmed_total = totals
+            changed.append(order)
+    models.Order.objects.bulk_update(changed, TOTAL_FIELDS)
+    touch_orders(order_ids)
+    return changed
+
+
+def touch_orders(order_ids):
+    """Mark pages of orders as changed: stamp them and invalidate their cache tags."""
+    models.Order.touch(order_ids)
+    helpers.cache.invalidate(*[helpers.cache.tag(models.Order, pk) for pk in order_ids])
+
+
+def refresh_customer_orders(customer_orders):
+    """Recompute stored totals of customer orders (a queryset), their ledger charges and totals of their orders."""
+    changed = []
+    refreshed = []
+    order_ids = set()
+    for customer_order, order_total, confirmed_total in customer_order_totals(customer_orders):
+        refreshed.append(customer_order)
+        order_ids.add(customer_order.order_id)
+        if (customer_order.order_total, customer_order.confirmed_total) != (order_total, confirmed_total):
+            customer_order.order_total, customer_order.confirmed_total = order_total, confirmed_total
+            changed.append(customer_order)
+    models.CustomerOrder.objects.bulk_update(changed, TOTAL_FIELDS)
+    ledger.record_customer_orders(refreshed)
+    refresh_orders(order_ids)
+    return changed
+
+
+@contextmanager
+def batch():
+    """Refresh customer orders changed inside the block once, when the block exits.
+
+    Orders and ledgers of customer orders deleted inside the block are refreshed then too, so deleting
+    an order does not refresh its totals once per deleted product order.
+    """
+    if getattr(_state, 'pending', None) is not None:
+        yield
+        return
+    _state.pending = set()
+    _state.deleted = []
+    try:
+        yield
+        pending, deleted = _state.pending, _state.deleted
+    finally:
+        _state.pending = _state.deleted = None
+    pending.difference_update(pk for pk, _, _ in deleted)
+    if pending:
+        refresh_customer_orders(models.CustomerOrder.objects.filter(pk__in=pending))
+    if deleted:
+        refresh_deleted(deleted)
+
+
+def customer_orders_changed(customer_order_ids):
+    """Refresh totals of changed customer orders now, or when the enclosing batch() exits."""
+    pending = getattr(_state, 'pending', None)
+    if pending is not None:
+        pending.update(customer_order_ids)
+    else:
+        refresh_customer_orders(models.CustomerOrder.objects.filter(pk__in=customer_order_ids))
+
+
+def customer_orders_deleted(customer_orders):
+    """Refresh totals of the orders and ledgers of the customers of deleted customer orders,
+    now or when the enclosing batch() exits.
+    """
+    # their pk is cleared once the deletion is over
+    rows = [(customer_order.pk, customer_order.order_id, customer_order.customer_id)
+            for customer_order in customer_orders]
+    deleted = getattr(_state, 'deleted', None)
+    if deleted is not None:
+        deleted.extend(rows)
+    else:
+        refresh_deleted(rows)
+
+
+def refresh_deleted(rows):
+    """Refresh after deleting customer orders given as ``(pk, order_id, customer_id)`` rows."""
+    remaining = set(models.Order.objects.filter(pk__in={order_id for _, order_id, _ in rows})
+                    .values_list('pk', flat=True))
+    if remaining:
+        refresh_orders(remaining)
+    # pages of deleted orders are dropped from the cache by their own receiver
+    ledger.rebalance_many({customer_id: None for _, _, customer_id in rows})
+
+
+def refresh_price_change(product_id, *dates):
+    """Recompute totals of customer orders whose as-of price of a product could change.
+
+    A price set on (or removed from) ``date`` applies to orders from that date
+    up to the next price of the product.
+    """
+    next_price = products.models.Price.objects.filter(product_id=product_id, date__gt=max(dates)) \
+        .order_by('date').values_list('date', flat=True).first()
+    affected = models.CustomerOrder.objects.filter(product_orders__product_id=product_id,
+                                                   order__date__gte=min(dates))
+    if next_price is not None:
+        affected = affected.filter(order__date__lt=next_price)
+    return refresh_customer_orders(affected.distinct())
+
+
+def rebuild(orders, commit=True):
+    """Recompute totals of whole orders from their line items.
+
+    Returns ``(obj, stored, expected)`` tuples for every order and customer order whose
+    stored totals were wrong, and saves the expected totals when ``commit`` is set.
+    """
+    orders = list(orders)
+    order_sums = {order.pk: [0, 0] for order in orders}
+    mismatches = []
+    changed = []
+    customer_orders = models.CustomerOrder.objects.filter(order__in=orders)
+    for customer_order, order_total, confirmed_total in customer_order_totals(customer_orders):
+        order_sums[customer_order.order_id][0] += order_total
+        order_sums[customer_order.order_id][1] += confirmed_total
+        stored = (customer_order.order_total, customer_order.confirmed_total)
+        if stored != (order_total, confirmed_total):
+            mismatches.append((customer_order, stored, (order_total, confirmed_total)))
+            customer_order.order_total, customer_order.confirmed_total = order_total, confirmed_total
+            changed.append(customer_order)
+    changed_orders = []
+    for order in orders:
+        stored = (order.order_total, order.confirmed_total)
+        expected = tuple(order_sums[order.pk])
+        if stored != expected:
+            mismatches.append((order, stored, expected))
+            order.order_total, order.confirmed_total = expected
+            changed_orders.append(order)
+    if commit:
+        models.CustomerOrder.objects.bulk_update(changed, TOTAL_FIELDS)
+        ledger.record_customer_orders(changed)
+        models.Order.objects.bulk_update(changed_orders, TOTAL_FIELDS)
+    return mismatches
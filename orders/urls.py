@@ -1,5 +1,6 @@
 from django.urls import path, include
 
+import orders.api
 import orders.views
 
 app_name = 'orders'
@@ -8,12 +9,24 @@ order_urlpatterns = [
     path('', orders.views.OrderView.as_view(), name='order'),
     path('edit', orders.views.OrderEditView.as_view(), name='order-edit'),
     path('confirm', orders.views.OrderConfirmView.as_view(), name='order-confirm'),
+    path('export.csv', orders.views.OrderExportView.as_view(), name='order-export'),
     path('delete', orders.views.OrderDeleteView.as_view(), name='order-delete')
 ]
 
+api_urlpatterns = [
+    path('', orders.api.OrdersApiView.as_view(), name='api-orders'),
+    path('<int:order_pk>', orders.api.OrderApiView.as_view(), name='api-order'),
+    path('<int:order_pk>/amounts', orders.api.OrderAmountsApiView.as_view(), name='api-order-amounts'),
+    path('<int:order_pk>/customers/<int:customer_pk>', orders.api.CustomerOrderApiView.as_view(),
+         name='api-customer-order'),
+]
+
 urlpatterns = [
     path('', orders.views.LastOrderView.as_view(), name='index'),
     path('list', orders.views.OrdersListView.as_view(), name='list'),
     path('create', orders.views.OrderCreateView.as_view(), name='create'),
+    path('export.csv', orders.views.OrdersExportView.as_view(), name='export'),
+    path('import', orders.views.OrderImportView.as_view(), name='import'),
+    path('api/', include(api_urlpatterns)),
     path('<int:order_pk>/', include(order_urlpatterns))
 ]
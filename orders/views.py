@@ -1,13 +1,24 @@
+import csv
 import datetime
 
 from django.conf import settings
+from django.db.models import Prefetch
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import redirect
 from django.urls import reverse, reverse_lazy
-from django.views.generic import DetailView, CreateView, UpdateView, ListView, DeleteView
+from django.utils.functional import cached_property
+from django.views.generic import DetailView, CreateView, UpdateView, ListView, DeleteView, View, FormView
+from django.views.generic.detail import SingleObjectMixin
 
-import products.models
-from orders import forms
-from orders.models import Order
+import helpers.cache
+from helpers.pagination import KeysetPaginationMixin
+from helpers.tracing import traced
+from helpers.views import ConditionalGetMixin, TaggedCacheMixin
+from orders import export, forms
+from orders.importer import OrderImporter, read
+from orders.matrix import OrderMatrix
+from orders.models import CustomerOrder, Order
+from products import catalog
 
 
 # Create your views here.
@@ -16,58 +27,76 @@ class OrderMixin:
     pk_url_kwarg = 'order_pk'
 
 
-class OrdersListView(OrderMixin, ListView):
-    pass
+class OrdersListView(OrderMixin, KeysetPaginationMixin, ListView):
+    paginate_by = 20
+    keyset_ordering = ['-date', '-pk']
+
+    def get_period(self):
+        """``(year, month)`` to show orders of, month or both can be None."""
+        for param, date_format in [('month', '%Y-%m'), ('year', '%Y')]:
+            try:
+                date = datetime.datetime.strptime(self.request.GET.get(param, ''), date_format)
+            except ValueError:
+                continue
+            return date.year, date.month if param == 'month' else None
+        return None, None
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        year, month = self.get_period()
+        if year is None:
+            return queryset
+        queryset = queryset.filter(date__gte=datetime.date(year, month or 1, 1))
+        end_year, end_month = (year + 1, 1) if month is None else (year + month // 12, month % 12 + 1)
+        if end_year > datetime.MAXYEAR:
+            # periods ending with the last year dates can have are left without an upper bound
+            return queryset
+        return queryset.filter(date__lt=datetime.date(end_year, end_month, 1))
+
+    def get_archive(self):
+        """Months with orders grouped by year: ``[(year, [month row, ...]), ...]``."""
+        archive = []
+        for month in self.model.objects.archive():
+            if not archive or archive[-1][0] != month['month'].year:
+                archive.append((month['month'].year, []))
+            archive[-1][1].append(month)
+        return archive
+
+    @traced()
+    def get_context_data(self, **kwargs):
+        year, month = self.get_period()
+        kwargs['archive'] = self.get_archive()
+        kwargs['period'] = {'year': year, 'month': month}
+        kwargs['period_query'] = f'month={year}-{month:02}' if month else f'year={year}' if year else ''
+        return super().get_context_data(**kwargs)
 
 
-class OrderView(OrderMixin, DetailView):
-    def get_context_data(self, **kwargs):
-        order = self.object
-        order_table_header = [('customer', 'Заказчик')]
-        order_table_header.extend(
-            [(str(product.pk), str(product), product) for product in products.models.Product.objects.all()]
-        )
-
-        order_table = []
-        for customer in order.customers.all():
-            customer_order = {'customer': customer.customer}
-            for product in products.models.Product.objects.all():
-                try:
-                    product_order = customer.product_orders.get(product=product)
-                    amount = {'amount': product_order.amount or None,
-                              'confirmed': product_order.confirmed_amount}
-                except customer.product_orders.model.DoesNotExist:
-                    amount = {'amount': None,
-                              'confirmed': None}
-                customer_order[str(product.pk)] = amount
-            order_table.append(customer_order)
-
-        order_table_footer = {'customer': 'Итого'}
-        order_message = []
-        for product_type in products.models.ProductType.objects.all():
-            product_type_message = []
-            for product in product_type.products.all():
-                order_table_footer[str(product.pk)] = {
-                    'amount': sum(customer_order[str(product.pk)]['amount'] or 0 for customer_order in order_table),
-                    'confirmed': sum(
-                        customer_order[str(product.pk)]['confirmed'] or 0 for customer_order in order_table),
-                }
-                if order_table_footer[str(product.pk)]['amount']:
-                    product_type_message.append((product, order_table_footer[str(product.pk)]['amount']))
-            if len(product_type_message):
-                order_message.append((product_type, product_type_message))
-
-        for product in products.models.Product.objects.all():
-            order_table_footer[str(product.pk)] = {
-                'amount': sum(customer_order[str(product.pk)]['amount'] or 0 for customer_order in order_table),
-                'confirmed': sum(customer_order[str(product.pk)]['confirmed'] or 0 for customer_order in order_table),
-            }
+class OrderView(OrderMixin, ConditionalGetMixin, TaggedCacheMixin, DetailView):
+    @cached_property
+    def order_stamp(self):
+        """``(pk, updated_at)`` of the order shown, None if there is none."""
+        return self.get_queryset().filter(pk=self.kwargs[self.pk_url_kwarg]).values_list('pk', 'updated_at').first()
+
+    def get_stamp(self):
+        if self.order_stamp is None:
+            return None, None
+        pk, updated_at = self.order_stamp
+        catalog_etag, catalog_modified = catalog.stamp()
+        return f'order-{pk}-{updated_at.timestamp()}-{catalog_etag}', max(updated_at, catalog_modified or updated_at)
+
+    def get_stamp_tags(self):
+        return self.get_cache_tags()
+
+    def get_cache_tags(self):
+        return [helpers.cache.tag(Order, self.get_order_pk()), catalog.TAG]
+
+    def get_order_pk(self):
+        return self.kwargs[self.pk_url_kwarg]
 
+    @traced()
+    def get_context_data(self, **kwargs):
         context = {
-            'order_table_header': order_table_header,
-            'order_table': order_table,
-            'order_table_footer': order_table_footer,
-            'order_message': order_message,
+            'order_matrix': OrderMatrix(self.object),
             'order_phone': settings.ORDER_PHONE
         }
         context.update(kwargs)
@@ -75,6 +104,13 @@ class OrderView(OrderMixin, DetailView):
 
 
 class LastOrderView(OrderView):
+    @cached_property
+    def order_stamp(self):
+        return self.get_queryset().values_list('pk', 'updated_at').latest()
+
+    def get_order_pk(self):
+        return self.order_stamp[0]
+
     def get(self, request, *args, **kwargs):
         try:
             return super().get(request, *args, **kwargs)
@@ -91,22 +127,26 @@ class LastOrderView(OrderView):
 class OrderCreateView(OrderMixin, CreateView):
     form_class = forms.OrderForm
 
+    @traced()
     def get_context_data(self, form=None, **kwargs):
         orders = []
         order_date = datetime.date.today()
+        form = form or self.get_form()
+        product_fields = form.formset.form.product_fields
         try:
-            latest_order = self.get_queryset().latest()
+            latest_order = self.get_queryset().prefetch_related(
+                Prefetch('customers', queryset=CustomerOrder.objects.order_by('pk').prefetch_related('product_orders'))
+            ).latest()
             for customer in latest_order.customers.all():
-                order = {'customer': customer.customer.id}
+                order = {'customer': customer.customer_id}
                 for product_order in customer.product_orders.all():
-                    if product_order.amount:
-                        order[product_order.product.get_field_name()] = product_order.amount
+                    if product_order.amount and product_order.product_id in product_fields:
+                        order[product_fields[product_order.product_id]] = product_order.amount
                 orders.append(order)
             order_date = latest_order.date
         except Order.DoesNotExist:
             pass
 
-        form = form or self.get_form()
         form.formset.extra = len(orders) + 1
         post_initial = {form.add_prefix('date'): order_date + datetime.timedelta(days=7)}
         for i in range(len(orders)):
@@ -123,18 +163,64 @@ class OrderConfirmView(OrderMixin, UpdateView):
     form_class = forms.OrderConfirmForm
     template_name_suffix = '_confirm_form'
 
+    @traced()
     def get_context_data(self, form=None, **kwargs):
         form = form or self.get_form()
         post_initial = {}
         #        for fields in form.visible_fields():
         #            post_initial[]
         for subform in form.formset.forms:
-            customer = self.object.customers.get(customer_id=subform['customer'].value())
-            for product_order in customer.product_orders.all():
-                if product_order.amount and product_order.confirmed_amount is None:
-                    post_initial[subform.add_prefix(product_order.product.get_field_name())] = product_order.amount
+            for product_order in subform.instance.product_orders.all():
+                if product_order.amount and product_order.confirmed_amount is None \
+                        and product_order.product_id in subform.product_fields:
+                    post_initial[subform.add_prefix(subform.product_fields[product_order.product_id])] = \
+                        product_order.amount
         return super().get_context_data(post_initial=post_initial, form=form, **kwargs)
 
 
+class OrderExportView(OrderMixin, SingleObjectMixin, View):
+    """CSV grid of an order, streamed."""
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        return self.render_to_response(export.customer_orders(order=self.object),
+                                       f"order-{self.object.date:%Y-%m-%d}.csv")
+
+    @staticmethod
+    def render_to_response(customer_orders, filename):
+        response = StreamingHttpResponse(export.export_csv(customer_orders), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class OrdersExportView(View):
+    """CSV grid of orders between the ``from`` and ``to`` dates (ISO format, both optional), streamed."""
+
+    def get(self, request, *args, **kwargs):
+        try:
+            dates = [datetime.date.fromisoformat(request.GET[param]) if request.GET.get(param) else None
+                     for param in ['from', 'to']]
+        except ValueError:
+            return HttpResponseBadRequest("Invalid date")
+        name = '-'.join(f'{date:%Y-%m-%d}' for date in dates if date) or 'all'
+        return OrderExportView.render_to_response(export.customer_orders(date_from=dates[0], date_to=dates[1]),
+                                                  f"orders-{name}.csv")
+
+
+class OrderImportView(FormView):
+    form_class = forms.OrderImportForm
+    template_name = 'orders/order_import.html'
+
+    def form_valid(self, form):
+        file = form.cleaned_data['file']
+        importer = OrderImporter(dry_run=form.cleaned_data['dry_run'])
+        try:
+            importer.run(read(file, 'json' if file.name.lower().endswith('.json') else 'csv'))
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            form.add_error('file', str(e))
+            return self.form_invalid(form)
+        return self.render_to_response(self.get_context_data(form=form, importer=importer))
+
+
 class OrderDeleteView(OrderMixin, DeleteView):
     success_url = reverse_lazy('orders:list')
@@ -0,0 +1,39 @@
+from django.db.models import Count, Max, Value
+
+import helpers.cache
+from products import models
+
+TAG = 'catalog'
+
+
+def version():
+    """Token that changes whenever a product or a product type is saved or deleted.
+
+    It is read from the database with one query, so a change made by one process is seen by all the others.
+    Row counts are part of it, so deletions change it too.
+    """
+    rows = [model.objects.order_by().annotate(model=Value(index)).values('model')
+            .annotate(count=Count('pk'), last_modified=Max('updated_at')).values_list('model', 'count', 'last_modified')
+            for index, model in enumerate([models.ProductType, models.Product])]
+    return '-'.join(f"{count}-{last_modified.timestamp() if count else 0}"
+                    for _, count, last_modified in sorted(rows[0].union(rows[1], all=True)))
+
+
+def bump():
+    """Invalidate pages and fragments cached with the catalog tag."""
+    helpers.cache.invalidate(TAG)
+
+
+def stamp():
+    """``(etag, last_modified)`` of the catalog: product types, products and prices.
+
+    Row counts are part of the etag, so deletions change it too.
+    """
+    parts = []
+    last_modified = None
+    for model in [models.ProductType, models.Product, models.Price]:
+        aggregate = model.objects.aggregate(count=Count('pk'), last_modified=Max('updated_at'))
+        parts.append(f"{aggregate['count']}-{aggregate['last_modified'].timestamp() if aggregate['count'] else 0}")
+        if aggregate['last_modified'] and (last_modified is None or aggregate['last_modified'] > last_modified):
+            last_modified = aggregate['last_modified']
+    return '-'.join(parts), last_modified
@@ -0,0 +1,23 @@
+from django.db import migrations
+from django.db.models import Count, Max
+
+
+def merge_duplicate_prices(apps, schema_editor):
+    """Keep the last price entered of a product on a date, the one price books already use."""
+    Price = apps.get_model('products', 'Price')
+    duplicates = Price.objects.order_by().values('product_id', 'date').annotate(count=Count('pk'), last=Max('pk')) \
+        .filter(count__gt=1)
+    for duplicate in duplicates:
+        Price.objects.filter(product_id=duplicate['product_id'], date=duplicate['date']) \
+            .exclude(pk=duplicate['last']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_add_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_merge_duplicate_prices'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='price',
+            constraint=models.UniqueConstraint(fields=('product', 'date'), name='price_product_date_unique'),
+        ),
+    ]
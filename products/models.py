@@ -1,11 +1,10 @@
-from django.db import models
-from django.db.models import Model
+from django.db import models, transaction
 
 from helpers import models as helpers_models
 
 
 # Create your models here.
-class ProductType(helpers_models.BrowseableObjectModel):
+class ProductType(helpers_models.UpdatedAtModel, helpers_models.BrowseableObjectModel):
     name = models.CharField(max_length=20, verbose_name="Тип продукции")
 
     class Meta:
@@ -15,7 +14,7 @@ class ProductType(helpers_models.BrowseableObjectModel):
         return self.name
 
 
-class Product(helpers_models.BrowseableObjectModel):
+class Product(helpers_models.UpdatedAtModel, helpers_models.BrowseableObjectModel):
     product_type = models.ForeignKey(to=ProductType, on_delete=models.CASCADE, verbose_name="Тип продукции",
                                      related_name='products')
     name = models.CharField(max_length=20, verbose_name="Объем/особенность", blank=True)
@@ -33,6 +32,13 @@ class Product(helpers_models.BrowseableObjectModel):
     def __str__(self):
         return "{self.product_type.name} {self.name}".format(self=self)
 
+    def delete(self, *args, **kwargs):
+        # orders with product orders of the product are refreshed once, not once per product order
+        from orders import totals
+
+        with transaction.atomic(), totals.batch():
+            return super().delete(*args, **kwargs)
+
     def get_object_url_kwargs(self):
         kwargs: dict = self.product_type.get_object_url_kwargs()
         kwargs.update(super(Product, self).get_object_url_kwargs())
@@ -45,10 +51,10 @@ class Product(helpers_models.BrowseableObjectModel):
             return super().get_absolute_url(kind)
 
     def get_field_name(self):
-        return f'product-{self.product_type.pk}-{self.pk}'
+        return f'product-{self.product_type_id}-{self.pk}'
 
 
-class Price(Model):
+class Price(helpers_models.AtomicSaveMixin, helpers_models.UpdatedAtModel):
     product = models.ForeignKey(to=Product, on_delete=models.CASCADE, verbose_name="Продукция", related_name="prices")
     price = models.PositiveIntegerField(verbose_name="Цена")
     date = models.DateField(verbose_name="Дата", auto_now_add=True)
@@ -57,6 +63,16 @@ class Price(Model):
         verbose_name = "Цена"
         get_latest_by = 'date'
         ordering = ['date']
+        constraints = [
+            # one price a day, it also serves as-of lookups of the price of a product at a date
+            models.UniqueConstraint(fields=['product', 'date'], name='price_product_date_unique'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_date = instance.__dict__.get('date')
+        return instance
 
     def __str__(self):
         return "{self.price}.00 ₽ ({self.date})".format(self=self)
@@ -0,0 +1,35 @@
+import bisect
+
+from products import models
+
+
+class PriceBook:
+    """Price history of a set of products, loaded with a single query.
+
+    Answers "price of product P on date D" from in-memory timelines sorted by date,
+    the same way ``product.prices.filter(date__lte=D).latest()`` does.
+    """
+
+    def __init__(self, product_list=None):
+        self._dates = {}
+        self._prices = {}
+        query = models.Price.objects.order_by('product_id', 'date', 'pk').values_list('product_id', 'date', 'price')
+        if product_list is not None:
+            query = query.filter(product__in=product_list)
+        for product_id, date, price in query:
+            dates = self._dates.setdefault(product_id, [])
+            prices = self._prices.setdefault(product_id, [])
+            if dates and dates[-1] == date:
+                prices[-1] = price
+            else:
+                dates.append(date)
+                prices.append(price)
+
+    def price(self, product_id, date):
+        dates = self._dates.get(product_id)
+        if not dates:
+            return 0
+        index = bisect.bisect_right(dates, date)
+        if index == 0:
+            return 0
+        return self._prices[product_id][index - 1]
@@ -0,0 +1,19 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+import helpers.cache
+from products import catalog, models
+
+
+@receiver([post_save, post_delete], sender=models.ProductType)
+@receiver([post_save, post_delete], sender=models.Product)
+def catalog_changed(sender, **kwargs):
+    # bump again on commit, pages cached inside the transaction may show uncommitted rows
+    catalog.bump()
+    transaction.on_commit(catalog.bump)
+
+
+@receiver([post_save, post_delete], sender=models.Price)
+def price_changed(sender, **kwargs):
+    helpers.cache.invalidate(helpers.cache.tag(models.Price))
@@ -0,0 +1,42 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+
+import products.models
+from products import catalog
+
+
+class CatalogVersionTestCase(TestCase):
+    fixtures = ['test_products']
+
+    def test_version_stable(self):
+        self.assertEqual(catalog.version(), catalog.version())
+
+    def test_product_saved(self):
+        version = catalog.version()
+        product = products.models.Product.objects.first()
+        product.name = "new name"
+        product.save()
+        self.assertNotEqual(version, catalog.version())
+
+    def test_product_deleted(self):
+        version = catalog.version()
+        products.models.Product.objects.first().delete()
+        self.assertNotEqual(version, catalog.version())
+
+    def test_product_type_saved(self):
+        version = catalog.version()
+        products.models.ProductType.objects.create(name="new type")
+        self.assertNotEqual(version, catalog.version())
+
+    def test_changed_by_another_process(self):
+        version = catalog.version()
+        # neither signals nor the cache of this process see it
+        products.models.Product.objects.filter(pk=1).update(updated_at=timezone.now())
+        cache.clear()
+        self.assertNotEqual(version, catalog.version())
+
+    def test_price_saved(self):
+        version = catalog.version()
+        products.models.Product.objects.first().prices.create(price=1)
+        self.assertEqual(version, catalog.version())
@@ -1,5 +1,6 @@
 from datetime import date, timedelta
 
+from django.db import IntegrityError, transaction
 from django.test import TestCase
 from django.urls import NoReverseMatch, reverse
 
@@ -62,8 +63,12 @@ class ProductTestCase(TestCase):
         price1.date = date.today() - timedelta(days=5)
         price1.save()
         self.assertEqual(100, test_product.price)
-        test_product.prices.create(price=200)
+        price2 = test_product.prices.create(price=200)
         self.assertEqual(200, test_product.price)
+        with transaction.atomic(), self.assertRaises(IntegrityError):
+            test_product.prices.create(price=300)
+        price2.date = date.today() - timedelta(days=1)
+        price2.save()
         price3 = test_product.prices.create(price=100)
         price3.date = date.today() + timedelta(days=5)
         price3.save()
@@ -0,0 +1,55 @@
+from datetime import date
+
+from django.test import TestCase
+
+import products.models
+from products.pricebook import PriceBook
+
+
+class PriceBookTestCase(TestCase):
+    fixtures = ['test_products']
+
+    def setUp(self):
+        super().setUp()
+        self.product = products.models.Product.objects.get(pk=1)
+        for price_date, price in [(date(2001, 1, 1), 150), (date(2002, 1, 1), 170)]:
+            price_obj = self.product.prices.create(price=price)
+            price_obj.date = price_date
+            price_obj.save()
+
+    def test_num_queries(self):
+        with self.assertNumQueries(1):
+            price_book = PriceBook()
+            for product in range(1, 5):
+                price_book.price(product, date(2001, 6, 1))
+
+    def test_price(self):
+        price_book = PriceBook()
+        values = [
+            (date(1999, 12, 31), 0),
+            (date(2000, 1, 1), 100),
+            (date(2000, 12, 31), 100),
+            (date(2001, 1, 1), 150),
+            (date(2001, 6, 1), 150),
+            (date(2002, 1, 1), 170),
+            (date(2010, 1, 1), 170),
+        ]
+        for price_date, price in values:
+            with self.subTest(price_date):
+                self.assertEqual(price, price_book.price(self.product.pk, price_date))
+
+    def test_matches_latest(self):
+        price_book = PriceBook()
+        for price_date in [date(2000, 1, 1), date(2001, 6, 1), date(2003, 1, 1)]:
+            with self.subTest(price_date):
+                self.assertEqual(self.product.prices.filter(date__lte=price_date).latest().price,
+                                 price_book.price(self.product.pk, price_date))
+
+    def test_product_list(self):
+        price_book = PriceBook([self.product])
+        self.assertEqual(170, price_book.price(self.product.pk, date(2010, 1, 1)))
+        self.assertEqual(0, price_book.price(2, date(2010, 1, 1)))
+
+    def test_unknown_product(self):
+        price_book = PriceBook()
+        self.assertEqual(0, price_book.price(-1, date(2010, 1, 1)))
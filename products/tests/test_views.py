@@ -1,6 +1,7 @@
 from datetime import date
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from django.urls import reverse, reverse_lazy
 
 from helpers.tests.views_helper import ViewTestCaseMixin
@@ -23,6 +24,41 @@ class ProductsListViewTestCase(ViewTestCaseMixin, TestCase):
                                  ordered=False)
 
 
+@override_settings(TAGGED_CACHE_TIMEOUT=60)
+class ProductsListViewCacheTestCase(TestCase):
+    fixtures = ['test_products']
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.get(reverse('products:index'))
+
+    def test_fragment_cached(self):
+        with self.assertNumQueries(0):
+            self.client.get(reverse('products:index'))
+
+    def test_price_invalidates(self):
+        models.Product.objects.get(pk=1).prices.create(price=123)
+        self.assertContains(self.client.get(reverse('products:index')), '123.00')
+
+
+class ProductsListViewConditionalGetTestCase(TestCase):
+    fixtures = ['test_products']
+
+    def test_price_changes_etag(self):
+        url = reverse('products:index')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(304, self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+        models.Product.objects.get(pk=1).prices.create(price=123)
+        self.assertEqual(200, self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+
+    def test_delete_changes_etag(self):
+        url = reverse('products:index')
+        etag = self.client.get(url)['ETag']
+        models.Price.objects.filter(pk=1).delete()
+        self.assertEqual(200, self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+
+
 class ProductTypeEditViewTestCase(ViewTestCaseMixin, TestCase):
     fixtures = ['test_products']
     view_class = views.ProductTypeEditView
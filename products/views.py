@@ -2,9 +2,12 @@ import django.forms
 from django.shortcuts import get_object_or_404
 from django.views.generic import ListView, UpdateView, CreateView
 
+import helpers.cache
+from helpers.tracing import traced
 import products.models
 import products.forms
-from helpers.views import CreateWithParentView
+from helpers.views import ConditionalGetMixin, CreateWithParentView
+from products import catalog
 
 
 class ProductTypeMixin:
@@ -22,6 +25,7 @@ class ProductMixin:
                                                                    pk=self.kwargs['producttype_pk'])
         return super().dispatch(request, *args, **kwargs)
 
+    @traced()
     def get_context_data(self, **kwargs):
         kwargs['product_type'] = self.product_type
         return super(ProductMixin, self).get_context_data(**kwargs)
@@ -36,15 +40,22 @@ class PriceMixin:
         self.product = self.product or get_object_or_404(products.models.Product, pk=self.kwargs['product_pk'])
         return super().dispatch(request, *args, **kwargs)
 
+    @traced()
     def get_context_data(self, **kwargs):
         kwargs['product'] = self.product
         return super().get_context_data(**kwargs)
 
 
 # Create your views here.
-class ProductsListView(ProductTypeMixin, ListView):
+class ProductsListView(ProductTypeMixin, ConditionalGetMixin, ListView):
     template_name = "products/product_list.html"
 
+    def get_stamp_tags(self):
+        return [catalog.TAG, helpers.cache.tag(products.models.Price)]
+
+    def get_stamp(self):
+        return catalog.stamp()
+
 
 class ProductTypeEditView(ProductTypeMixin, UpdateView):
     fields = django.forms.ALL_FIELDS